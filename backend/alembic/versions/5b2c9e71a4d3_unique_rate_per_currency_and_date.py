@@ -0,0 +1,36 @@
+"""Unique rate per currency and date
+
+Revision ID: 5b2c9e71a4d3
+Revises: d1ff2da30458
+Create Date: 2026-02-03 18:12:40.118245
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2c9e71a4d3'
+down_revision: Union[str, None] = 'd1ff2da30458'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Usuwamy ewentualne duplikaty (currency_id, date), zostawiając najstarszy wiersz,
+    # aby można było założyć ograniczenie wymagane przez INSERT ... ON CONFLICT w save_rates.
+    op.execute(
+        """
+        DELETE FROM rates
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM rates GROUP BY currency_id, date
+        )
+        """
+    )
+    op.create_unique_constraint('uq_rates_currency_id_date', 'rates', ['currency_id', 'date'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_rates_currency_id_date', 'rates', type_='unique')
@@ -0,0 +1,38 @@
+"""Covering unique (currency_id, date) index for rate history
+
+Revision ID: 8e41f0b6c2a7
+Revises: 5b2c9e71a4d3
+Create Date: 2026-02-06 10:02:11.562810
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e41f0b6c2a7'
+down_revision: Union[str, None] = '5b2c9e71a4d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Unikalny indeks z kolumną rate w INCLUDE zastępuje ograniczenie unikalne o tym samym kluczu:
+    # nadal rozstrzyga konflikty INSERT ... ON CONFLICT (currency_id, date) w save_rates, a zapytania
+    # historii (filtr po walucie i zakresie dat) wykonuje jako index-only scan, bez odwołań do sterty.
+    # Zapis utrzymuje jedno B-drzewo zamiast dwóch z identycznym kluczem.
+    op.drop_constraint('uq_rates_currency_id_date', 'rates', type_='unique')
+    op.create_index(
+        'uq_rates_currency_id_date',
+        'rates',
+        ['currency_id', 'date'],
+        unique=True,
+        postgresql_include=['rate']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_rates_currency_id_date', table_name='rates')
+    op.create_unique_constraint('uq_rates_currency_id_date', 'rates', ['currency_id', 'date'])
@@ -0,0 +1,41 @@
+"""Latest rate per currency summary table
+
+Revision ID: a9e1d5c3b724
+Revises: f4a8c2d6e913
+Create Date: 2026-02-18 11:26:30.604187
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9e1d5c3b724'
+down_revision: Union[str, None] = 'f4a8c2d6e913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('latest_rates',
+    sa.Column('currency_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('rate', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['currency_id'], ['currencies.id'], ),
+    sa.PrimaryKeyConstraint('currency_id')
+    )
+    # Jednorazowe wypełnienie; dalej tabelę utrzymuje save_rates.
+    op.execute(
+        """
+        INSERT INTO latest_rates (currency_id, date, rate)
+        SELECT DISTINCT ON (currency_id) currency_id, date, rate
+        FROM rates
+        ORDER BY currency_id, date DESC
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('latest_rates')
@@ -0,0 +1,57 @@
+"""Fetch job queue table
+
+Revision ID: b6d2e8f4a137
+Revises: a9e1d5c3b724
+Create Date: 2026-02-20 10:04:52.771930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d2e8f4a137'
+down_revision: Union[str, None] = 'a9e1d5c3b724'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('fetch_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('start_date', sa.Date(), nullable=True),
+    sa.Column('end_date', sa.Date(), nullable=True),
+    sa.Column('dedupe_key', sa.String(length=32), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('days_total', sa.Integer(), nullable=False),
+    sa.Column('days_done', sa.Integer(), nullable=False),
+    sa.Column('completed_through', sa.Date(), nullable=True),
+    sa.Column('tables_fetched', sa.Integer(), nullable=False),
+    sa.Column('rows_added', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_fetch_jobs_id'), 'fetch_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_fetch_jobs_status'), 'fetch_jobs', ['status'], unique=False)
+    # Co najwyżej jedno aktywne zadanie na ten sam zakres dat (deduplikacja zleceń).
+    op.create_index(
+        'uq_fetch_jobs_active_dedupe_key',
+        'fetch_jobs',
+        ['dedupe_key'],
+        unique=True,
+        postgresql_where=sa.text("status IN ('pending', 'running')"),
+        sqlite_where=sa.text("status IN ('pending', 'running')")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_fetch_jobs_active_dedupe_key', table_name='fetch_jobs')
+    op.drop_index(op.f('ix_fetch_jobs_status'), table_name='fetch_jobs')
+    op.drop_index(op.f('ix_fetch_jobs_id'), table_name='fetch_jobs')
+    op.drop_table('fetch_jobs')
@@ -0,0 +1,38 @@
+"""Table calendar with published and confirmed-empty dates
+
+Revision ID: c7d3a9e5f112
+Revises: 8e41f0b6c2a7
+Create Date: 2026-02-09 16:45:03.907314
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d3a9e5f112'
+down_revision: Union[str, None] = '8e41f0b6c2a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('table_calendar',
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('has_table', sa.Boolean(), nullable=False),
+    sa.Column('checked_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('date')
+    )
+    # Każda data, dla której mamy już kursy, ma opublikowaną tabelę.
+    op.execute(
+        """
+        INSERT INTO table_calendar (date, has_table)
+        SELECT DISTINCT date, true FROM rates
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('table_calendar')
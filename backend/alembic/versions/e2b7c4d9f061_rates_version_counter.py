@@ -0,0 +1,32 @@
+"""Single-row write counter for the rates table
+
+Revision ID: e2b7c4d9f061
+Revises: b6d2e8f4a137
+Create Date: 2026-03-04 09:12:41.318224
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7c4d9f061'
+down_revision: Union[str, None] = 'b6d2e8f4a137'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('rates_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Licznik startuje od liczby istniejących kursów; dalej zwiększa go save_rates.
+    op.execute("INSERT INTO rates_version (id, version) SELECT 1, count(*) FROM rates")
+
+
+def downgrade() -> None:
+    op.drop_table('rates_version')
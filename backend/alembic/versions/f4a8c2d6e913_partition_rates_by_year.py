@@ -0,0 +1,130 @@
+"""Partition rates by year with a BRIN date index
+
+Revision ID: f4a8c2d6e913
+Revises: c7d3a9e5f112
+Create Date: 2026-02-16 09:12:47.218604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4a8c2d6e913'
+down_revision: Union[str, None] = 'c7d3a9e5f112'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Tworzy (jeśli brak) partycję rates_yYYYY. Wiersze z tego roku, które trafiły wcześniej
+# do partycji domyślnej, są do niej przenoszone przed podłączeniem. Blokada doradcza
+# serializuje równoczesne wywołania z wielu procesów.
+ENSURE_RATES_PARTITION = """
+CREATE OR REPLACE FUNCTION ensure_rates_partition(partition_year integer) RETURNS void AS $$
+DECLARE
+    partition_name text := format('rates_y%s', partition_year);
+    range_start date := make_date(partition_year, 1, 1);
+    range_end date := make_date(partition_year + 1, 1, 1);
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_rates_partition'));
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE rates INCLUDING DEFAULTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM rates_default WHERE date >= %L AND date < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        range_start, range_end, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE rates ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, range_start, range_end
+    );
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def _create_rates_indexes(date_index_using: str) -> None:
+    op.create_index('ix_rates_id', 'rates', ['id'], unique=False)
+    op.create_index('ix_rates_date', 'rates', ['date'], unique=False, postgresql_using=date_index_using)
+    op.create_index(
+        'uq_rates_currency_id_date',
+        'rates',
+        ['currency_id', 'date'],
+        unique=True,
+        postgresql_include=['rate']
+    )
+
+
+def upgrade() -> None:
+    # Stara tabela zostaje odsunięta; jej indeksy są zbędne przy kopiowaniu, a ich nazwy
+    # (wspólne w schemacie) są potrzebne dla nowej tabeli.
+    op.execute('ALTER TABLE rates RENAME TO rates_legacy')
+    op.execute('ALTER TABLE rates_legacy RENAME CONSTRAINT rates_pkey TO rates_legacy_pkey')
+    op.drop_index('uq_rates_currency_id_date', table_name='rates_legacy')
+    op.drop_index('ix_rates_date', table_name='rates_legacy')
+    op.drop_index('ix_rates_id', table_name='rates_legacy')
+
+    op.execute(
+        """
+        CREATE TABLE rates (
+            id integer NOT NULL DEFAULT nextval('rates_id_seq'::regclass),
+            currency_id integer NOT NULL,
+            date date NOT NULL,
+            rate double precision NOT NULL
+        ) PARTITION BY RANGE (date)
+        """
+    )
+    op.execute('CREATE TABLE rates_default PARTITION OF rates DEFAULT')
+    op.execute(ENSURE_RATES_PARTITION)
+    # Partycje od najstarszego kursu do przyszłego roku włącznie; kolejne tworzy save_rates.
+    op.execute(
+        """
+        SELECT ensure_rates_partition(partition_year)
+        FROM generate_series(
+            COALESCE((SELECT EXTRACT(YEAR FROM MIN(date))::integer FROM rates_legacy), EXTRACT(YEAR FROM CURRENT_DATE)::integer),
+            EXTRACT(YEAR FROM CURRENT_DATE)::integer + 1
+        ) AS partition_year
+        """
+    )
+    op.execute('INSERT INTO rates (id, currency_id, date, rate) SELECT id, currency_id, date, rate FROM rates_legacy')
+
+    # Klucz główny i indeksy unikalne tabeli partycjonowanej muszą zawierać klucz partycjonowania.
+    op.create_primary_key('rates_pkey', 'rates', ['id', 'date'])
+    op.create_foreign_key('rates_currency_id_fkey', 'rates', 'currencies', ['currency_id'], ['id'])
+    # Daty w każdej partycji rosną wraz z kolejnością wstawiania, więc BRIN zastępuje B-drzewo
+    # przy ułamku jego rozmiaru.
+    _create_rates_indexes('brin')
+
+    op.execute('ALTER SEQUENCE rates_id_seq OWNED BY rates.id')
+    op.drop_table('rates_legacy')
+    op.execute('ANALYZE rates')
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE rates_plain (
+            id integer NOT NULL DEFAULT nextval('rates_id_seq'::regclass),
+            currency_id integer NOT NULL,
+            date date NOT NULL,
+            rate double precision NOT NULL
+        )
+        """
+    )
+    op.execute('INSERT INTO rates_plain (id, currency_id, date, rate) SELECT id, currency_id, date, rate FROM rates')
+    op.execute('ALTER SEQUENCE rates_id_seq OWNED BY rates_plain.id')
+    op.execute('DROP TABLE rates CASCADE')
+    op.execute('DROP FUNCTION ensure_rates_partition(integer)')
+    op.rename_table('rates_plain', 'rates')
+
+    op.create_primary_key('rates_pkey', 'rates', ['id'])
+    op.create_foreign_key('rates_currency_id_fkey', 'rates', 'currencies', ['currency_id'], ['id'])
+    _create_rates_indexes('btree')
@@ -0,0 +1,378 @@
+import asyncio
+import math
+import threading
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from history import UnknownCurrencyCodeError
+from models import Currency, Rate
+from rate_snapshot import RateSnapshot, snapshot_store
+from singleflight import SingleFlight
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+# Liczba dni notowań w roku, używana do annualizacji zmienności.
+TRADING_DAYS = 252
+
+
+def _log_returns(values: np.ndarray, previous: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Logarytmiczne stopy zwrotu między kolejnymi dniami notowań (NaN, gdy brak któregoś kursu).
+    `previous` to ostatni wiersz kursów poprzedzający `values` (przy dopisywaniu kolejnych dni).
+    """
+    if previous is None:
+        previous = np.full(values.shape[1], np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.diff(np.log(np.vstack([previous, values])), axis=0)
+
+
+def _prefix_sums(values: np.ndarray, initial: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Sumy prefiksowe (suma, suma kwadratów, liczba obserwacji) kolumn z pominięciem NaN.
+
+    Returns:
+        Tablica [3, wiersze, kolumny]; z `initial` sumy są kontynuacją wcześniejszych,
+        bez niego zaczynają się od wiersza zerowego.
+    """
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    sums = np.cumsum(np.stack([filled, filled * filled, present.astype(np.float64)]), axis=1)
+    if initial is not None:
+        return sums + initial[:, None, :]
+    return np.concatenate([np.zeros((3, 1, values.shape[1])), sums], axis=1)
+
+
+def _pairwise_sums(returns: np.ndarray) -> np.ndarray:
+    """
+    Sumy potrzebne do korelacji parami z pominięciem braków, jako cztery macierze [n x n]:
+    liczba wspólnych obserwacji N, sumy x_i, sumy x_i^2 (po wierszach, gdzie obie waluty mają kurs)
+    oraz sumy iloczynów x_i * x_j. Sumy z kolejnych bloków wierszy można dodawać.
+    """
+    present = (~np.isnan(returns)).astype(np.float64)
+    filled = np.where(present > 0, returns, 0.0)
+    return np.stack([present.T @ present, filled.T @ present, (filled * filled).T @ present, filled.T @ filled])
+
+
+def _correlation(sums: np.ndarray) -> np.ndarray:
+    count, sx, sxx, sxy = sums
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = count * sxy - sx * sx.T
+        variance = count * sxx - sx * sx
+        corr = covariance / np.sqrt(variance * variance.T)
+    corr[count < 3] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def nan_to_none(values: np.ndarray) -> List[Optional[float]]:
+    """
+    Zamienia wektor na listę liczb, w której NaN (brak wartości) staje się None (null w JSON).
+    """
+    return [None if math.isnan(value) else value for value in values.tolist()]
+
+
+def _pad_columns(array: np.ndarray, width: int, fill: float) -> np.ndarray:
+    missing = width - array.shape[-1]
+    if missing <= 0:
+        return array
+    return np.concatenate([array, np.full(array.shape[:-1] + (missing,), fill)], axis=-1)
+
+
+class RateAnalytics:
+    """
+    Macierz kursów [dni notowań x waluty] wraz ze statystykami utrzymywanymi przyrostowo.
+
+    Oprócz kursów i logarytmicznych stóp zwrotu przechowuje sumy prefiksowe obu macierzy,
+    dzięki którym średnia krocząca i zmienność w oknie dowolnej długości to różnica dwóch
+    wierszy sum, oraz sumy parami stóp zwrotu z całej historii, z których macierz korelacji
+    wylicza się w O(waluty^2). Dopisanie nowych dni (extended) dolicza tylko nowe wiersze.
+
+    Obiekt jest niezmienny — extended zwraca nową instancję, więc równoległe odczyty
+    zawsze widzą spójny stan.
+    """
+
+    def __init__(
+        self,
+        ordinals: np.ndarray,
+        codes: List[str],
+        values: np.ndarray,
+        returns: np.ndarray,
+        rate_sums: np.ndarray,
+        return_sums: np.ndarray,
+        pair_sums: np.ndarray
+    ):
+        self.ordinals = ordinals
+        self.codes = codes
+        self.code_index: Dict[str, int] = {code: i for i, code in enumerate(codes)}
+        self.values = values
+        self.returns = returns
+        self.rate_sums = rate_sums
+        self.return_sums = return_sums
+        self.pair_sums = pair_sums
+
+    @classmethod
+    def from_matrix(cls, ordinals: np.ndarray, codes: List[str], values: np.ndarray) -> "RateAnalytics":
+        """
+        Wylicza wszystkie statystyki od zera dla macierzy kursów (wiersze rosnąco po dacie).
+        """
+        returns = _log_returns(values)
+        return cls(
+            ordinals, list(codes), values, returns,
+            _prefix_sums(values), _prefix_sums(returns), _pairwise_sums(returns)
+        )
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[date, str, float]]) -> "RateAnalytics":
+        """
+        Buduje analitykę z wierszy (data, kod, kurs) w dowolnej kolejności.
+        """
+        ordinals, codes, values = _pivot(rows)
+        return cls.from_matrix(ordinals, codes, values)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: RateSnapshot) -> "RateAnalytics":
+        """
+        Buduje analitykę z migawki mmap, pomijając dni bez tabeli (weekendy, święta).
+        """
+        published = np.flatnonzero(~np.isnan(snapshot.matrix).all(axis=1))
+        return cls.from_matrix(published + snapshot.start, snapshot.codes, np.array(snapshot.matrix[published]))
+
+    @property
+    def last_ordinal(self) -> Optional[int]:
+        return int(self.ordinals[-1]) if len(self.ordinals) else None
+
+    def extended(self, rows: Iterable[Tuple[date, str, float]]) -> "RateAnalytics":
+        """
+        Zwraca analitykę uzupełnioną o nowe dni notowań, późniejsze od ostatniego znanego.
+        Sumy prefiksowe i sumy parami są kontynuowane od ostatniego wiersza, bez przeliczania historii.
+
+        Raises:
+            ValueError: Gdy wiersze zawierają datę nie późniejszą niż ostatni znany dzień.
+        """
+        ordinals, new_codes, block = _pivot(rows)
+        if not len(ordinals):
+            return self
+        if self.last_ordinal is not None and ordinals[0] <= self.last_ordinal:
+            raise ValueError("Dopisywane dni muszą być późniejsze od ostatniego dnia w analityce")
+
+        codes = self.codes + [code for code in new_codes if code not in self.code_index]
+        width = len(codes)
+        column_of = {code: i for i, code in enumerate(codes)}
+        aligned = np.full((len(ordinals), width), np.nan)
+        aligned[:, [column_of[code] for code in new_codes]] = block
+
+        values = _pad_columns(self.values, width, np.nan)
+        rate_sums = _pad_columns(self.rate_sums, width, 0.0)
+        return_sums = _pad_columns(self.return_sums, width, 0.0)
+        pair_sums = np.zeros((4, width, width))
+        pair_sums[:, :len(self.codes), :len(self.codes)] = self.pair_sums
+
+        new_returns = _log_returns(aligned, values[-1] if len(values) else None)
+        return RateAnalytics(
+            np.concatenate([self.ordinals, ordinals]),
+            codes,
+            np.concatenate([values, aligned]),
+            np.concatenate([_pad_columns(self.returns, width, np.nan), new_returns]),
+            np.concatenate([rate_sums, _prefix_sums(aligned, rate_sums[:, -1])], axis=1),
+            np.concatenate([return_sums, _prefix_sums(new_returns, return_sums[:, -1])], axis=1),
+            pair_sums + _pairwise_sums(new_returns)
+        )
+
+    def column(self, code: str) -> int:
+        try:
+            return self.code_index[code]
+        except KeyError:
+            raise UnknownCurrencyCodeError(f"Nieznana waluta: {code}")
+
+    def _rows(self, start: Optional[date], end: Optional[date]) -> slice:
+        first = int(np.searchsorted(self.ordinals, start.toordinal())) if start else 0
+        last = int(np.searchsorted(self.ordinals, end.toordinal(), side="right")) if end else len(self.ordinals)
+        return slice(first, max(first, last))
+
+    def rolling(
+        self,
+        code: str,
+        window: int,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        annualize: bool = False
+    ) -> Tuple[List[date], np.ndarray, np.ndarray]:
+        """
+        Średnia krocząca kursu i zmienność (odchylenie standardowe logarytmicznych stóp zwrotu)
+        w oknie `window` ostatnich dni notowań, dla każdego dnia z przedziału [start, end].
+        Okno obejmuje także dni sprzed `start`. Dni z niepełnym oknem mają wartość NaN.
+
+        Returns:
+            Krotka (daty, średnie, zmienności).
+
+        Raises:
+            UnknownCurrencyCodeError: Gdy waluty nie ma w danych.
+        """
+        j = self.column(code)
+        rows = self._rows(start, end)
+        upper = np.arange(rows.start, rows.stop) + 1
+        lower = np.maximum(upper - window, 0)
+
+        rate_sum, _, rate_count = self.rate_sums[:, upper, j] - self.rate_sums[:, lower, j]
+        ret_sum, ret_sq, ret_count = self.return_sums[:, upper, j] - self.return_sums[:, lower, j]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(rate_count == window, rate_sum / rate_count, np.nan)
+            variance = (ret_sq - ret_sum * ret_sum / ret_count) / (ret_count - 1)
+            volatility = np.where(ret_count >= 2, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+        volatility[upper - lower < window] = np.nan
+        if annualize:
+            volatility = volatility * math.sqrt(TRADING_DAYS)
+
+        dates = [date.fromordinal(int(o)) for o in self.ordinals[rows]]
+        return dates, mean, volatility
+
+    def correlation(
+        self,
+        codes: Optional[Sequence[str]] = None,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        window: Optional[int] = None
+    ) -> Tuple[List[str], np.ndarray, int]:
+        """
+        Macierz korelacji logarytmicznych stóp zwrotu walut (parami, z pominięciem braków).
+        Bez ograniczeń zakresu korzysta z utrzymywanych sum całej historii; dla przedziału dat
+        lub okna `window` ostatnich dni liczy sumy tylko z wybranych wierszy.
+
+        Returns:
+            Krotka (kody walut, macierz korelacji, liczba dni notowań w zakresie).
+
+        Raises:
+            UnknownCurrencyCodeError: Gdy któraś z walut nie występuje w danych.
+        """
+        codes = sorted(self.codes) if not codes else list(codes)
+        columns = [self.column(code) for code in codes]
+
+        if start is None and end is None and window is None:
+            sums = self.pair_sums
+            observations = len(self.ordinals)
+        else:
+            rows = self._rows(start, end)
+            if window:
+                rows = slice(max(rows.start, rows.stop - window), rows.stop)
+            sums = _pairwise_sums(self.returns[rows][:, columns])
+            columns = list(range(len(columns)))
+            observations = rows.stop - rows.start
+
+        selected = sums[:, columns][:, :, columns]
+        return codes, _correlation(selected), observations
+
+
+def _pivot(rows: Iterable[Tuple[date, str, float]]) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """
+    Zamienia wiersze (data, kod, kurs) na macierz [unikalne daty x kody] (NaN dla braków).
+    """
+    rows = list(rows)
+    if not rows:
+        return np.empty(0, dtype=np.int64), [], np.empty((0, 0))
+    ordinals, row_index = np.unique(np.array([row[0].toordinal() for row in rows], dtype=np.int64), return_inverse=True)
+    codes, column_index = np.unique(np.array([row[1] for row in rows]), return_inverse=True)
+    values = np.full((len(ordinals), len(codes)), np.nan)
+    values[row_index, column_index] = np.array([row[2] for row in rows], dtype=np.float64)
+    return ordinals, codes.tolist(), values
+
+
+_RATES_QUERY = select(Rate.date, Currency.code, Rate.rate).join(Currency, Rate.currency_id == Currency.id)
+
+
+class AnalyticsStore:
+    """
+    Analityka kursów procesu API, budowana leniwie przy pierwszym zapytaniu
+    (z migawki mmap, a bez niej z tabeli `rates`) i uzupełniana przez save_rates
+    o nowo zapisane dni. Zapis starszych dni (np. backfill) lub zmiany wykonane w innym
+    procesie unieważniają ją, a kolejne zapytanie buduje ją od nowa.
+
+    Blokada chroni wyłącznie podmianę gotowego obiektu — odczyt z bazy i budowa odbywają się bez niej.
+    Każde unieważnienie i dopisanie zwiększa generację; analityka zbudowana z danych sprzed
+    takiej zmiany jest zwracana wywołującemu, ale nie zostaje zapamiętana.
+    """
+
+    def __init__(self):
+        self._analytics: Optional[RateAnalytics] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def is_loaded(self) -> bool:
+        return self._analytics is not None
+
+    def get(self, db: Session) -> RateAnalytics:
+        """
+        Zwraca analitykę, w razie potrzeby budując ją w bieżącym wątku (sesja synchroniczna).
+        """
+        analytics = self._analytics
+        if analytics is not None:
+            return analytics
+        generation = self._generation
+        snapshot = snapshot_store.get(db)
+        if snapshot is not None:
+            analytics = RateAnalytics.from_snapshot(snapshot)
+        else:
+            analytics = RateAnalytics.from_rows(db.execute(_RATES_QUERY).all())
+        return self._publish(analytics, generation)
+
+    async def get_async(self, bind: AsyncEngine) -> RateAnalytics:
+        """
+        Zwraca analitykę w endpointach asynchronicznych. Równoczesne zapytania przy braku analityki
+        czekają na jedno wspólne budowanie (SingleFlight), które czyta dane we własnej sesji `bind`,
+        a samą budowę wykonuje w puli wątków, nie blokując pętli zdarzeń.
+        """
+        analytics = self._analytics
+        if analytics is not None:
+            return analytics
+        return await self._flight.do(None, lambda: self._load_async(bind))
+
+    async def _load_async(self, bind: AsyncEngine) -> RateAnalytics:
+        generation = self._generation
+        async with AsyncSession(bind=bind) as db:
+            snapshot = await snapshot_store.get_async(db)
+            rows = None if snapshot is not None else (await db.execute(_RATES_QUERY)).all()
+        if snapshot is not None:
+            analytics = await asyncio.to_thread(RateAnalytics.from_snapshot, snapshot)
+        else:
+            analytics = await asyncio.to_thread(RateAnalytics.from_rows, rows)
+        return self._publish(analytics, generation)
+
+    def _publish(self, analytics: RateAnalytics, generation: int) -> RateAnalytics:
+        with self._lock:
+            if self._generation == generation:
+                self._analytics = analytics
+        return analytics
+
+    def extend(self, rows: List[Tuple[date, str, float]]) -> None:
+        """
+        Dopisuje zatwierdzone kursy; gdy któryś z nich nie jest późniejszy od ostatniego
+        znanego dnia, analityka jest unieważniana.
+        """
+        if not rows:
+            return
+        with self._lock:
+            self._generation += 1
+            if self._analytics is None:
+                return
+            try:
+                self._analytics = self._analytics.extended(rows)
+            except ValueError:
+                self._analytics = None
+
+    def invalidate_dates(self, dates: Iterable[date]) -> None:
+        """
+        Unieważnia analitykę, jeśli nie zna którejś z dat (zapis wykonany przez inny proces).
+        """
+        analytics = self._analytics
+        ordinals = [d.toordinal() for d in dates]
+        if analytics is not None and ordinals and not np.isin(ordinals, analytics.ordinals).all():
+            self.invalidate()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._analytics = None
+
+
+analytics_store = AnalyticsStore()
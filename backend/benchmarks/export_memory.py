@@ -0,0 +1,103 @@
+"""
+Benchmark pamięci eksportu kursów: szczytowe RSS w zależności od liczby wierszy.
+
+Każdy pomiar działa w osobnym procesie, bo szczytowe RSS jest monotoniczne w obrębie procesu.
+Porównywany jest eksport strumieniowy (rate_export.stream_rates) z materializacją `.all()`.
+
+Uruchomienie (z katalogu backend):
+    python -m benchmarks.export_memory --rows 10000 100000 500000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from typing import Dict
+
+from benchmarks.save_rates import generate_rates
+from database import Base
+from nbp_service import save_rates
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+CURRENCIES = 35
+
+
+def _peak_rss_mb() -> float:
+    # VmHWM jest zerowane przy exec, w przeciwieństwie do ru_maxrss dziedziczonego po procesie rodzica.
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure(url: str, mode: str, queue) -> None:
+    from rate_export import _export_query, stream_rates
+
+    engine = create_engine(url)
+    baseline = _peak_rss_mb()
+    started = time.perf_counter()
+    exported_bytes = 0
+
+    if mode == "stream":
+        for chunk in stream_rates(engine, "ndjson"):
+            exported_bytes += len(chunk)
+    else:
+        with engine.connect() as connection:
+            rows = connection.execute(_export_query(None, None, None)).all()
+        exported_bytes = len(json.dumps([
+            {"date": row.date.isoformat(), "code": row.code, "name": row.name, "rate": row.rate} for row in rows
+        ]))
+
+    queue.put({
+        "seconds": time.perf_counter() - started,
+        "bytes": exported_bytes,
+        "peak_rss_mb": _peak_rss_mb(),
+        "rss_growth_mb": _peak_rss_mb() - baseline
+    })
+
+
+def run_in_subprocess(url: str, mode: str) -> Dict[str, float]:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(url, mode, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def populate(url: str, rows: int) -> None:
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with Session(bind=engine) as db:
+        save_rates(db, generate_rates(days=rows // CURRENCIES, currencies=CURRENCIES))
+    engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Szczytowe RSS eksportu kursów w zależności od liczby wierszy.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 300_000])
+    parser.add_argument("--url", help="URL bazy (domyślnie tymczasowy plik SQLite). Tabele zostaną nadpisane!")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        url = args.url or f"sqlite:///{os.path.join(tmp_dir, 'export_bench.db')}"
+        print(f"{'wiersze':>10} {'tryb':>12} {'czas [s]':>10} {'MB danych':>10} {'szczyt RSS':>11} {'przyrost RSS':>13}")
+        for rows in args.rows:
+            populate(url, rows)
+            for mode in ("stream", "materialize"):
+                result = run_in_subprocess(url, mode)
+                print(f"{rows:>10} {mode:>12} {result['seconds']:>10.2f} {result['bytes'] / 2**20:>10.1f} "
+                      f"{result['peak_rss_mb']:>10.1f}M {result['rss_growth_mb']:>12.1f}M")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Lokalny zamiennik API NBP do benchmarków: syntetyczny zbiór tabel A i serwer HTTP, który je odtwarza.
+
+Serwer obsługuje te same ścieżki co NBP (aktualna tabela, tabela z dnia, zakres dat do 93 dni),
+zwraca 404 dla dni bez tabeli oraz 400 dla zbyt długich zakresów, a opóźnienie odpowiedzi
+(stałe + losowy rozrzut) imituje czas odpowiedzi prawdziwego API.
+
+Uruchomienie samodzielne (z katalogu backend):
+    python -m benchmarks.fake_nbp --years 20 --currencies 35 --latency 0.05
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+from nbp_service import NBP_MAX_RANGE_DAYS, RateRecord
+
+_DATE = r"(\d{4}-\d{2}-\d{2})"
+_TABLE_PATH = re.compile(rf"^/api/exchangerates/tables/a/(?:{_DATE}/)?(?:{_DATE}/)?$", re.IGNORECASE)
+
+
+class SyntheticDataset:
+    """
+    Deterministyczny zbiór tabel A: kursy każdej waluty to błądzenie losowe, publikowane w dni robocze.
+    """
+
+    def __init__(self, end: date = date(2025, 12, 31), years: int = 20, currencies: int = 35, seed: int = 2002):
+        self.start = end.replace(year=end.year - years) + timedelta(days=1)
+        self.end = end
+        self.codes = [f"C{i:02d}" for i in range(currencies)]
+        self.names = [f"waluta {i}" for i in range(currencies)]
+
+        dates = [self.start + timedelta(days=offset) for offset in range((end - self.start).days + 1)]
+        self.dates = [d for d in dates if d.weekday() < 5]
+        self._row_of = {d: i for i, d in enumerate(self.dates)}
+
+        rng = np.random.default_rng(seed)
+        steps = rng.normal(0.0, 0.004, size=(len(self.dates), currencies))
+        self.matrix = np.round(rng.uniform(0.5, 5.0, size=currencies) * np.exp(np.cumsum(steps, axis=0)), 4)
+
+    @property
+    def rows(self) -> int:
+        return self.matrix.size
+
+    def table(self, table_date: date) -> Optional[Dict[str, Any]]:
+        row = self._row_of.get(table_date)
+        if row is None:
+            return None
+        return {
+            "table": "A",
+            "no": f"{row + 1:03d}/A/NBP/{table_date.year}",
+            "effectiveDate": table_date.isoformat(),
+            "rates": [
+                {"currency": name, "code": code, "mid": float(mid)}
+                for code, name, mid in zip(self.codes, self.names, self.matrix[row])
+            ]
+        }
+
+    def tables(self, start: date, end: date) -> List[Dict[str, Any]]:
+        return [self.table(d) for d in self.dates if start <= d <= end]
+
+    def records(self) -> Iterator[RateRecord]:
+        """
+        Zwraca cały zbiór w postaci zwracanej przez normalize_data.
+        """
+        for table_date, row in zip(self.dates, self.matrix.tolist()):
+            for code, name, mid in zip(self.codes, self.names, row):
+                yield RateRecord(table_date, code, name, mid)
+
+
+class _FakeNBPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server: FakeNBPServer = self.server
+        server.requests += 1
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+
+        status, body = server.respond(self.path.split("?")[0])
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeNBPServer(ThreadingHTTPServer):
+    """
+    Serwer HTTP odtwarzający tabele z `SyntheticDataset` pod ścieżkami API NBP.
+    Używany jako menedżer kontekstu: uruchamia się w wątku w tle i zatrzymuje przy wyjściu.
+    """
+    daemon_threads = True
+
+    def __init__(self, dataset: SyntheticDataset, latency: float = 0.0, jitter: float = 0.0, port: int = 0):
+        super().__init__(("127.0.0.1", port), _FakeNBPHandler)
+        self.dataset = dataset
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self.base_url = f"http://127.0.0.1:{self.server_port}/api/exchangerates/tables/a/"
+
+    def respond(self, path: str):
+        match = _TABLE_PATH.match(path)
+        if not match:
+            return 404, None
+        first, second = (date.fromisoformat(value) if value else None for value in match.groups())
+
+        if first is None:
+            return 200, [self.dataset.table(self.dataset.dates[-1])]
+        if second is None:
+            table = self.dataset.table(first)
+            return (200, [table]) if table else (404, None)
+        if (second - first).days >= NBP_MAX_RANGE_DAYS:
+            return 400, None
+        tables = self.dataset.tables(first, second)
+        return (200, tables) if tables else (404, None)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Lokalny zamiennik API NBP z syntetycznymi tabelami A.")
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--currencies", type=int, default=35)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stałe opóźnienie odpowiedzi [s].")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maksymalny losowy rozrzut opóźnienia [s].")
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(years=args.years, currencies=args.currencies)
+    with FakeNBPServer(dataset, args.latency, args.jitter, args.port) as server:
+        print(f"NBP_API_URL={server.base_url} ({len(dataset.dates)} tabel, {dataset.start} - {dataset.end})")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark serializacji list kursów: rozmiar [bajty] i czas [µs] jednej odpowiedzi.
+
+Porównuje:
+    - legacy: obiekty w stylu ORM walidowane przez response_model (from_attributes) i kodowane
+      domyślnym enkoderem JSON, jak dotychczas robił FastAPI,
+    - rows: gotowe słowniki z projekcji kolumn serializowane przez rate_cache.dumps (orjson),
+    - columns: zwarta postać kolumnowa (codes[], names[], rates[]),
+oraz rozmiar i czas kompresji gzip i brotli (gdy zainstalowany) każdej z postaci.
+
+Uruchomienie (z katalogu backend):
+    python -m benchmarks.serialization --days 250 --currencies 33
+"""
+import argparse
+import json
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+import compression
+import schemas
+from benchmarks.save_rates import generate_rates
+from compression import StreamCompressor
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from rate_cache import dumps
+
+_LEGACY_ADAPTER = TypeAdapter(List[schemas.RateWithCurrency])
+
+
+def legacy_encode(objects: List[Any]) -> bytes:
+    """
+    Dotychczasowa ścieżka: walidacja response_model z from_attributes i json.dumps po jsonable_encoder.
+    """
+    validated = _LEGACY_ADAPTER.validate_python(objects, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated), separators=(",", ":")).encode("utf-8")
+
+
+def measure(encode: Callable[[], bytes], repeat: int) -> Dict[str, float]:
+    """
+    Mierzy średni czas jednego wywołania `encode` oraz rozmiar i czas kompresji wyniku.
+    """
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = encode()
+    result = {"bytes": len(body), "us": (time.perf_counter() - started) / repeat * 1e6}
+
+    for encoding in compression.supported_encodings():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            compressed = StreamCompressor(encoding).compress(body, finish=True)
+        result[f"{encoding}_bytes"] = len(compressed)
+        result[f"{encoding}_us"] = (time.perf_counter() - started) / repeat * 1e6
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark serializacji list kursów (bajty i µs na odpowiedź).")
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument("--currencies", type=int, default=33)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    records = generate_rates(args.days, args.currencies)
+    objects = [
+        SimpleNamespace(date=r.date, rate=r.rate, currency=SimpleNamespace(code=r.code, name=r.name))
+        for r in records
+    ]
+    rows = [{"date": r.date, "rate": r.rate, "currency": {"code": r.code, "name": r.name}} for r in records]
+    columns = {
+        "dates": [r.date for r in records], "codes": [r.code for r in records],
+        "names": [r.name for r in records], "rates": [r.rate for r in records]
+    }
+    print(f"Kursów w odpowiedzi: {len(records)} ({args.days} dni x {args.currencies} walut)")
+
+    results = {
+        "legacy": measure(lambda: legacy_encode(objects), args.repeat),
+        "rows": measure(lambda: dumps(rows), args.repeat),
+        "columns": measure(lambda: dumps(columns), args.repeat)
+    }
+    for label, result in results.items():
+        compressed = ", ".join(
+            f"{encoding}: {result[f'{encoding}_bytes']:,} B / {result[f'{encoding}_us']:,.0f} µs"
+            for encoding in compression.supported_encodings()
+        )
+        print(f"{label:>8}: {result['bytes']:>10,} B {result['us']:>10,.0f} µs  ({compressed})")
+
+    print(f"Przyspieszenie serializacji (rows vs legacy): x{results['legacy']['us'] / results['rows']['us']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import threading
+from datetime import date
+from typing import Iterable, Optional
+
+from analytics import analytics_store
+from rate_cache import rate_cache
+from rate_snapshot import snapshot_store
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+RATES_CHANNEL = "rates_changed"
+RATE_CACHE_LISTEN = os.getenv("RATE_CACHE_LISTEN", "true").lower() == "true"
+# Postgres odrzuca powiadomienia dłuższe niż 8000 bajtów; większe zmiany czyszczą cały cache.
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+
+def invalidation_payload(dates: Iterable[date], currencies_changed: bool) -> str:
+    payload = json.dumps({"dates": sorted(d.isoformat() for d in dates), "currencies": currencies_changed})
+    if len(payload) > NOTIFY_PAYLOAD_LIMIT:
+        return json.dumps({"all": True})
+    return payload
+
+
+def notify_rates_changed(db: Session, dates: Iterable[date], currencies_changed: bool) -> None:
+    """
+    Wysyła w bieżącej transakcji powiadomienie NOTIFY o nowych kursach.
+    Postgres dostarcza je słuchaczom dopiero po zatwierdzeniu transakcji, a po jej wycofaniu wcale.
+    Na innych bazach nic nie robi.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {
+        "channel": RATES_CHANNEL,
+        "payload": invalidation_payload(dates, currencies_changed)
+    })
+
+
+def apply_invalidation(payload: str) -> None:
+    """
+    Unieważnia wpisy cache procesu wskazane w powiadomieniu (nieczytelne powiadomienie czyści cały cache).
+    Migawka kursów zostanie przy następnym odczycie ponownie porównana z bazą, bo zapis mógł wykonać
+    proces, który jej nie aktualizuje.
+    """
+    snapshot_store.invalidate()
+    try:
+        message = json.loads(payload)
+        dates = [date.fromisoformat(value) for value in message.get("dates", [])]
+    except (ValueError, TypeError, AttributeError):
+        message, dates = {"all": True}, []
+
+    if message.get("all"):
+        rate_cache.clear()
+        analytics_store.invalidate()
+        return
+    rate_cache.invalidate_dates(dates)
+    analytics_store.invalidate_dates(dates)
+    if dates:
+        rate_cache.invalidate_latest()
+    if message.get("currencies"):
+        rate_cache.invalidate_currencies()
+
+
+class CacheInvalidationListener:
+    """
+    Wątek nasłuchujący (LISTEN) powiadomień o nowych kursach, dzięki któremu każdy worker
+    i każda replika API unieważnia swój cache po zapisie wykonanym w dowolnym procesie.
+
+    Korzysta z własnego połączenia psycopg w trybie autocommit, poza pulą silnika.
+    Po zerwaniu połączenia łączy się ponownie i czyści cały cache, bo powiadomienia
+    wysłane w czasie przerwy przepadły.
+    """
+
+    def __init__(self, engine: Engine, channel: str = RATES_CHANNEL, poll_timeout: float = 5.0, retry_delay: float = 5.0):
+        self.dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self.poll_timeout = poll_timeout
+        self.retry_delay = retry_delay
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="rate-cache-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_timeout + 1)
+
+    def _run(self) -> None:
+        import psycopg
+
+        connected_before = False
+        while not self._stopped.is_set():
+            try:
+                with psycopg.connect(self.dsn, autocommit=True) as connection:
+                    connection.execute(f"LISTEN {self.channel}")
+                    if connected_before:
+                        rate_cache.clear()
+                        analytics_store.invalidate()
+                        snapshot_store.invalidate()
+                    connected_before = True
+
+                    while not self._stopped.is_set():
+                        for notification in connection.notifies(timeout=self.poll_timeout):
+                            apply_invalidation(notification.payload)
+            except Exception as e:
+                logger.warning("Nasłuch powiadomień %s przerwany: %s", self.channel, e)
+                self._stopped.wait(self.retry_delay)
@@ -0,0 +1,147 @@
+import os
+import zlib
+from typing import List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli jest opcjonalny
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+
+def supported_encodings() -> List[str]:
+    """
+    Zwraca obsługiwane kodowania w kolejności preferencji serwera.
+    """
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Wybiera kodowanie treści na podstawie nagłówka Accept-Encoding.
+    Pomija kodowania z q=0; przy równych wagach decyduje kolejność z supported_encodings.
+
+    Returns:
+        "br", "gzip" lub None, gdy klient nie akceptuje żadnego z obsługiwanych kodowań.
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    candidates = [
+        (weights.get(encoding, weights.get("*", 0.0)), -position, encoding)
+        for position, encoding in enumerate(supported_encodings())
+    ]
+    weight, _, encoding = max(candidates)
+    return encoding if weight > 0 else None
+
+
+class StreamCompressor:
+    """
+    Strumieniowy kompresor gzip lub brotli o wspólnym interfejsie.
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        """
+        Kompresuje kolejny fragment; bez finish opróżnia bufor, by fragment od razu trafił do klienta.
+        """
+        if self.encoding == "br":
+            return self._brotli.process(data) + (self._brotli.finish() if finish else self._brotli.flush())
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI kompresujący odpowiedzi gzip lub brotli (gdy dostępny pakiet brotli),
+    wybranym na podstawie nagłówka Accept-Encoding.
+
+    Odpowiedzi mniejsze niż minimum_size są wysyłane bez zmian, bo narzut kompresji
+    przewyższyłby zysk. Odpowiedzi strumieniowe (np. eksport) są kompresowane fragment
+    po fragmencie. Skompresowana odpowiedź dostaje nagłówek Vary: Accept-Encoding,
+    a jej ETag staje się słaby (W/), bo bajty różnią się od wersji nieskompresowanej.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        compressor: Optional[StreamCompressor] = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                passthrough = "content-encoding" in Headers(raw=message["headers"])
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                if passthrough or (not more_body and len(body) < self.minimum_size):
+                    passthrough = True
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+                compressor = StreamCompressor(encoding)
+                message["body"] = compressor.compress(body, finish=not more_body)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(message["body"]))
+                await send(start_message)
+                start_message = None
+                await send(message)
+                return
+
+            if not passthrough:
+                message["body"] = compressor.compress(body, finish=not more_body)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
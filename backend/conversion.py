@@ -0,0 +1,201 @@
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from database import is_replica_session
+from models import Currency, Rate
+from rate_cache import rate_cache
+from rate_snapshot import snapshot_store
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+BASE_CURRENCY = "PLN"
+
+
+class MissingRatesError(LookupError):
+    """
+    Brak tabeli kursów dla wskazanej daty.
+    """
+
+
+class UnknownCurrencyError(LookupError):
+    """
+    Waluta nie występuje w tabeli kursów z danej daty.
+    """
+
+
+class RateTable(NamedTuple):
+    """
+    Tabela kursów z jednej daty w postaci wektorowej.
+
+    `mids[i]` to kurs średni waluty `codes[i]` w PLN (dla PLN równy 1.0),
+    a `cross[i, j] = mids[i] / mids[j]` to kurs krzyżowy waluty i wyrażony w walucie j.
+    """
+    date: date
+    codes: np.ndarray
+    mids: np.ndarray
+    cross: np.ndarray
+
+    def index_of(self, code: str) -> int:
+        position = int(np.searchsorted(self.codes, code))
+        if position == len(self.codes) or self.codes[position] != code:
+            raise UnknownCurrencyError(f"Brak kursu waluty {code} z dnia {self.date}")
+        return position
+
+
+class BatchResult(NamedTuple):
+    dates: List[date]
+    rates: np.ndarray
+    results: np.ndarray
+
+
+def latest_rates_date(db: Session) -> Optional[date]:
+    snapshot = snapshot_store.get(db)
+    if snapshot is not None:
+        return snapshot.latest_date()
+    return db.execute(select(func.max(Rate.date))).scalar()
+
+
+def _table_key(rates_date: date) -> tuple:
+    return ("cross", rates_date)
+
+
+def get_rate_table(db: Session, rates_date: date) -> RateTable:
+    """
+    Zwraca (z cache, z migawki mmap lub z bazy) macierz kursów krzyżowych dla danej daty.
+
+    Raises:
+        MissingRatesError: Gdy w bazie nie ma kursów z tej daty.
+    """
+    table = rate_cache.get(_table_key(rates_date))
+    if table is not None:
+        return table
+    generation = rate_cache.generation(_table_key(rates_date))
+
+    snapshot = snapshot_store.get(db)
+    if snapshot is not None and snapshot.covers(rates_date):
+        rows = [(code, rate) for code, _, rate in snapshot.table(rates_date)]
+    else:
+        rows = db.execute(
+            select(Currency.code, Rate.rate)
+            .join(Currency, Rate.currency_id == Currency.id)
+            .where(Rate.date == rates_date)
+        ).all()
+    if not rows:
+        raise MissingRatesError(f"Brak kursów z dnia {rates_date}")
+
+    mids_by_code = {code: mid for code, mid in rows}
+    mids_by_code[BASE_CURRENCY] = 1.0
+    codes = np.array(sorted(mids_by_code))
+    mids = np.array([mids_by_code[code] for code in codes], dtype=np.float64)
+    table = RateTable(date=rates_date, codes=codes, mids=mids, cross=mids[:, None] / mids[None, :])
+    return rate_cache.put(_table_key(rates_date), table, generation, replica=is_replica_session(db))
+
+
+def _resolve_date(db: Session, rates_date: Optional[date]) -> date:
+    if rates_date is not None:
+        return rates_date
+    latest = latest_rates_date(db)
+    if latest is None:
+        raise MissingRatesError("Baza nie zawiera jeszcze żadnych kursów")
+    return latest
+
+
+def convert(db: Session, amount: float, from_code: str, to_code: str, rates_date: Optional[date] = None) -> Tuple[date, float, float]:
+    """
+    Przelicza kwotę między dwiema walutami po kursach średnich NBP.
+
+    Args:
+        db: Sesja bazy danych.
+        amount: Kwota w walucie źródłowej.
+        from_code: Kod waluty źródłowej.
+        to_code: Kod waluty docelowej.
+        rates_date: Data tabeli kursów. Jeśli None, używana jest najnowsza tabela w bazie.
+
+    Returns:
+        Krotka (data tabeli, kurs krzyżowy, kwota po przeliczeniu).
+    """
+    table = get_rate_table(db, _resolve_date(db, rates_date))
+    rate = float(table.cross[table.index_of(from_code.upper()), table.index_of(to_code.upper())])
+    return table.date, rate, amount * rate
+
+
+def convert_batch(
+    db: Session,
+    amounts: Sequence[float],
+    from_codes: Sequence[str],
+    to_codes: Sequence[str],
+    rates_dates: Sequence[Optional[date]]
+) -> BatchResult:
+    """
+    Przelicza wiele kwót jednocześnie.
+
+    Tabele ze wszystkich potrzebnych dat są układane w jedną macierz (daty x waluty)
+    nad wspólną osią kodów, po czym wszystkie pozycje są przeliczane jednym wektorowym
+    działaniem: kwota * kurs[data, z] / kurs[data, na].
+
+    Returns:
+        BatchResult z datami tabel, kursami krzyżowymi i kwotami po przeliczeniu (w kolejności wejścia).
+
+    Raises:
+        MissingRatesError: Gdy brakuje tabeli dla którejkolwiek daty.
+        UnknownCurrencyError: Gdy którejkolwiek waluty nie ma w tabeli z danej daty.
+    """
+    resolved_dates, tables = load_batch_tables(db, rates_dates)
+    return convert_with_tables(amounts, from_codes, to_codes, resolved_dates, tables)
+
+
+def load_batch_tables(db: Session, rates_dates: Sequence[Optional[date]]) -> Tuple[List[date], Dict[date, RateTable]]:
+    """
+    Część convert_batch korzystająca z bazy: ustala daty tabel (brak daty = najnowsza tabela)
+    i wczytuje tabele kursów krzyżowych dla każdej z nich.
+
+    Raises:
+        MissingRatesError: Gdy brakuje tabeli dla którejkolwiek daty.
+    """
+    default_date = None
+    if any(rates_date is None for rates_date in rates_dates):
+        default_date = _resolve_date(db, None)
+    resolved_dates = [rates_date or default_date for rates_date in rates_dates]
+    return resolved_dates, {rates_date: get_rate_table(db, rates_date) for rates_date in dict.fromkeys(resolved_dates)}
+
+
+def convert_with_tables(
+    amounts: Sequence[float],
+    from_codes: Sequence[str],
+    to_codes: Sequence[str],
+    resolved_dates: Sequence[date],
+    tables_by_date: Dict[date, RateTable]
+) -> BatchResult:
+    """
+    Obliczeniowa część convert_batch (bez dostępu do bazy), na tabelach z load_batch_tables.
+
+    Raises:
+        UnknownCurrencyError: Gdy którejkolwiek waluty nie ma w tabeli z danej daty.
+    """
+    if not amounts:
+        return BatchResult(dates=[], rates=np.empty(0), results=np.empty(0))
+
+    unique_dates, date_index = np.unique(np.array([d.toordinal() for d in resolved_dates]), return_inverse=True)
+    tables = [tables_by_date[date.fromordinal(int(ordinal))] for ordinal in unique_dates]
+
+    codes = np.unique(np.concatenate([table.codes for table in tables]))
+    matrix = np.full((len(tables), len(codes)), np.nan)
+    for row, table in enumerate(tables):
+        matrix[row, np.searchsorted(codes, table.codes)] = table.mids
+
+    from_upper = np.char.upper(np.asarray(from_codes, dtype=str))
+    to_upper = np.char.upper(np.asarray(to_codes, dtype=str))
+    from_index = np.clip(np.searchsorted(codes, from_upper), 0, len(codes) - 1)
+    to_index = np.clip(np.searchsorted(codes, to_upper), 0, len(codes) - 1)
+
+    rates = matrix[date_index, from_index] / matrix[date_index, to_index]
+    invalid = (codes[from_index] != from_upper) | (codes[to_index] != to_upper) | np.isnan(rates)
+    if invalid.any():
+        position = int(np.argmax(invalid))
+        raise UnknownCurrencyError(
+            f"Pozycja {position}: brak kursu {from_codes[position]}/{to_codes[position]} "
+            f"z dnia {resolved_dates[position]}"
+        )
+
+    return BatchResult(dates=resolved_dates, rates=rates, results=np.asarray(amounts, dtype=np.float64) * rates)
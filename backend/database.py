@@ -1,7 +1,12 @@
 import os
+from typing import Any, Dict, Union
 
+from fastapi import Request
 from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 DB_USER = os.getenv("POSTGRES_USER", "user")
 DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
@@ -9,16 +14,129 @@ DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
 DB_PORT = os.getenv("POSTGRES_PORT", "5454")
 DB_NAME = os.getenv("POSTGRES_DB", "currency_db")
 
+# Replika tylko do odczytu (np. standby Postgresa). Bez niej odczyty idą do bazy głównej.
+DB_REPLICA_HOST = os.getenv("POSTGRES_REPLICA_HOST", "")
+DB_REPLICA_PORT = os.getenv("POSTGRES_REPLICA_PORT", DB_PORT)
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
 SQLALCHEMY_DATABASE_URL = f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+SQLALCHEMY_REPLICA_URL = (
+    f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}"
+    if DB_REPLICA_HOST else None
+)
+
+_POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING
+}
+
+def _create_engine(url: str) -> Engine:
+    """
+    Tworzy silnik z pulą połączeń sterowaną zmiennymi środowiskowymi.
+    pre_ping i recycle odrzucają połączenia zerwane np. po przełączeniu (failover) Postgresa.
+    """
+    return create_engine(url, **_POOL_OPTIONS)
+
+def _create_async_engine(url: str) -> AsyncEngine:
+    """
+    Tworzy silnik asynchroniczny (psycopg w trybie async) z taką samą konfiguracją puli.
+    """
+    return create_async_engine(url, **_POOL_OPTIONS)
+
+engine = _create_engine(SQLALCHEMY_DATABASE_URL)
+replica_engine = _create_engine(SQLALCHEMY_REPLICA_URL) if SQLALCHEMY_REPLICA_URL else engine
+
+# Silniki asynchroniczne obsługują endpointy API: oczekiwanie na bazę nie zajmuje wątku z puli Starlette.
+# Silniki synchroniczne zostają dla zadań w tle, CLI i strumieniowego eksportu.
+async_engine = _create_async_engine(SQLALCHEMY_DATABASE_URL)
+replica_async_engine = _create_async_engine(SQLALCHEMY_REPLICA_URL) if SQLALCHEMY_REPLICA_URL else async_engine
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Sesje replik pamiętają bazę główną, do której trafiają zapisy wykonywane w trakcie żądań GET.
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine, info={"primary_bind": engine})
+
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+ReplicaAsyncSessionLocal = async_sessionmaker(
+    bind=replica_async_engine, autoflush=False, expire_on_commit=False, info={"primary_bind": async_engine}
+)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+READ_ONLY_METHODS = ("GET", "HEAD")
+
+def get_db(request: Request):
+    """
+    Zwraca sesję bazy danych: dla żądań GET/HEAD połączoną z repliką, dla pozostałych z bazą główną.
+    """
+    db = ReplicaSessionLocal() if request.method in READ_ONLY_METHODS else SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db(request: Request):
+    """
+    Asynchroniczny odpowiednik get_db: zwraca AsyncSession repliki dla żądań GET/HEAD, a bazy głównej dla pozostałych.
+    """
+    db = ReplicaAsyncSessionLocal() if request.method in READ_ONLY_METHODS else AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+def get_export_engine(request: Request) -> Engine:
+    """
+    Zwraca silnik (repliki dla GET/HEAD), z którego eksport strumieniowy otwiera własne połączenie,
+    niezależne od sesji żądania.
+    """
+    return replica_engine if request.method in READ_ONLY_METHODS else engine
+
+def primary_bind(db: Session) -> Union[Engine, Connection]:
+    """
+    Zwraca silnik bazy głównej dla sesji (dla sesji replik inny niż `db.get_bind()`).
+    """
+    return db.info.get("primary_bind") or db.get_bind()
+
+def primary_async_bind(db: AsyncSession) -> AsyncEngine:
+    """
+    Zwraca asynchroniczny silnik bazy głównej dla sesji AsyncSession (dla sesji replik inny niż `db.bind`).
+    """
+    return db.info.get("primary_bind") or db.bind
+
+def is_replica_session(db: Union[Session, AsyncSession]) -> bool:
+    """
+    Sprawdza, czy sesja (synchroniczna lub AsyncSession) czyta z repliki, a nie z bazy głównej.
+    """
+    primary = db.info.get("primary_bind")
+    return primary is not None and primary is not db.bind
+
+def _pool_status(bound: Engine) -> Dict[str, Any]:
+    pool = bound.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow()
+    }
+
+def pool_status() -> Dict[str, Any]:
+    """
+    Zwraca stan pul połączeń bazy głównej i repliki (jeśli skonfigurowana) do monitorowania,
+    osobno dla silników synchronicznych i asynchronicznych.
+    """
+    status = {"primary": _pool_status(engine), "primary_async": _pool_status(async_engine.sync_engine)}
+    if replica_engine is not engine:
+        status["replica"] = _pool_status(replica_engine)
+        status["replica_async"] = _pool_status(replica_async_engine.sync_engine)
+    return status
@@ -1,22 +1,24 @@
+import os
+import tempfile
 from datetime import datetime
 
 import models
 from behave import given, then, when
-from database import Base, get_db
+from database import Base, get_async_db, get_db
 from fastapi.testclient import TestClient
 from main import app
+from rate_cache import rate_cache
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
-# Setup Test DB
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool
-)
+# Setup Test DB (shared file: steps write synchronously, the API reads through aiosqlite)
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "behave.db")
+engine = create_engine(f"sqlite:///{DATABASE_PATH}", connect_args={"check_same_thread": False})
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{DATABASE_PATH}", poolclass=NullPool)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 def override_get_db():
     try:
@@ -25,7 +27,12 @@ def override_get_db():
     finally:
         db.close()
 
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
 client = TestClient(app)
 
 @given('the database contains a currency "{code}" with name "{name}"')
@@ -36,6 +43,7 @@ def step_impl(context, code, name):
     db.add(currency)
     db.commit()
     db.close()
+    rate_cache.clear()
 
 @given('the database contains a currency "{code}" with rate {rate} for date "{date_str}"')
 def step_impl(context, code, rate, date_str):
@@ -53,6 +61,7 @@ def step_impl(context, code, rate, date_str):
     db.add(rate_obj)
     db.commit()
     db.close()
+    rate_cache.clear()
 
 @when('I request the list of currencies')
 def step_impl(context):
@@ -0,0 +1,52 @@
+"""
+Konfiguracja produkcyjna: gunicorn zarządza procesami, a każdy worker uvicorn obsługuje aplikację ASGI.
+
+Uruchomienie (z katalogu backend):
+    gunicorn -c gunicorn.conf.py main:app
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Worker, który nie odpowiada dłużej niż `timeout`, jest restartowany. Przy SIGTERM workery
+# kończą bieżące żądania i zatrzymują zadania w tle (lifespan) w ciągu `graceful_timeout`.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Okresowy restart workerów ogranicza skutki ewentualnych wycieków pamięci; rozrzut zapobiega
+# równoczesnemu restartowi wszystkich.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+
+# Aplikacja nie jest ładowana przed forkiem: każdy worker tworzy własne pule połączeń
+# (baza, NBP) i własny wątek nasłuchu LISTEN.
+preload_app = False
+
+# Każdy worker ma własne liczniki metryk, więc /metrics obsłużone przez jeden z nich sumuje stan
+# zapisywany przez wszystkie workery w tym katalogu (zmienna dziedziczona przez workery po forku).
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "currency-converter-metrics"))
+
+
+def on_starting(server):
+    # Pliki z poprzedniego uruchomienia zawyżałyby sumy liczników.
+    directory = os.environ["METRICS_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "metrics_*.json*")):
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+
+    mark_process_dead(worker.pid, os.environ["METRICS_DIR"])
+
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
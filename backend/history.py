@@ -0,0 +1,165 @@
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from models import Currency, Rate
+from rate_snapshot import RateSnapshot, snapshot_store
+from sqlalchemy import Date, and_, cast, func, select
+from sqlalchemy.orm import Session, aliased
+
+INTERVALS = ("day", "week", "month")
+
+
+class UnknownCurrencyCodeError(LookupError):
+    """
+    W bazie nie ma waluty o podanym kodzie.
+    """
+
+
+def _bucket(db: Session, interval: str):
+    """
+    Wyrażenie SQL zaokrąglające datę kursu do początku tygodnia (poniedziałek) lub miesiąca.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return cast(func.date_trunc(interval, Rate.date), Date)
+    if interval == "week":
+        return func.date(Rate.date, "weekday 0", "-6 days", type_=Date)
+    return func.date(Rate.date, "start of month", type_=Date)
+
+
+# Ordinal daty 1970-01-01 (dzień zerowy numpy.datetime64).
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def history_from_snapshot(
+    snapshot: RateSnapshot,
+    code: str,
+    start: Optional[date],
+    end: Optional[date],
+    interval: str
+) -> List[Dict[str, Any]]:
+    """
+    Wylicza szereg czasowy z migawki mmap, grupując dni w okresy operacjami wektorowymi (reduceat).
+    """
+    if code not in snapshot.code_index:
+        raise UnknownCurrencyCodeError(f"Nieznana waluta: {code}")
+
+    ordinals, values = snapshot.series(code, start, end)
+    if not len(ordinals):
+        return []
+
+    if interval == "week":
+        # Ordinal 1 (0001-01-01) to poniedziałek.
+        buckets = ordinals - (ordinals - 1) % 7
+    elif interval == "month":
+        days = (ordinals - _EPOCH_ORDINAL).astype("datetime64[D]")
+        buckets = days.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+    else:
+        buckets = ordinals
+
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(values)] - 1
+    counts = ends - starts + 1
+    averages = np.add.reduceat(values, starts) / counts
+
+    return [
+        {"date": date.fromordinal(int(bucket)), "open": float(values[first]), "close": float(values[last]),
+         "low": float(low), "high": float(high), "avg": float(avg), "count": int(count)}
+        for bucket, first, last, low, high, avg, count in zip(
+            buckets[starts], starts, ends,
+            np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts), averages, counts
+        )
+    ]
+
+
+def get_rate_history(
+    db: Session,
+    code: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    interval: str = "day"
+) -> List[Dict[str, Any]]:
+    """
+    Zwraca szereg czasowy kursu waluty, opcjonalnie zagregowany do tygodni lub miesięcy.
+
+    Agregacja (pierwszy/ostatni/min/max/średni kurs w okresie) jest wykonywana w bazie
+    jednym zapytaniem korzystającym z indeksu (currency_id, date), więc do aplikacji
+    trafia jeden wiersz na okres zamiast wszystkich kursów dziennych.
+    Gdy dostępna jest migawka mmap, szereg jest wyliczany z niej, bez zapytań do bazy.
+
+    Args:
+        db: Sesja bazy danych.
+        code: Kod waluty.
+        start: Opcjonalna data początkowa (włącznie).
+        end: Opcjonalna data końcowa (włącznie).
+        interval: "day", "week" lub "month".
+
+    Returns:
+        Lista punktów: date (początek okresu), open, close, low, high, avg, count.
+
+    Raises:
+        UnknownCurrencyCodeError: Gdy waluta o podanym kodzie nie istnieje.
+    """
+    snapshot = snapshot_store.get(db)
+    if snapshot is not None:
+        return history_from_snapshot(snapshot, code.upper(), start, end, interval)
+    return history_from_db(db, code, start, end, interval)
+
+
+def history_from_db(
+    db: Session,
+    code: str,
+    start: Optional[date],
+    end: Optional[date],
+    interval: str
+) -> List[Dict[str, Any]]:
+    """
+    Część get_rate_history wykonywana w bazie (bez migawki).
+    """
+    currency_id = db.execute(select(Currency.id).where(Currency.code == code.upper())).scalar()
+    if currency_id is None:
+        raise UnknownCurrencyCodeError(f"Nieznana waluta: {code}")
+
+    conditions = [Rate.currency_id == currency_id]
+    if start:
+        conditions.append(Rate.date >= start)
+    if end:
+        conditions.append(Rate.date <= end)
+
+    if interval == "day":
+        rows = db.execute(select(Rate.date, Rate.rate).where(*conditions).order_by(Rate.date)).all()
+        return [
+            {"date": row.date, "open": row.rate, "close": row.rate, "low": row.rate,
+             "high": row.rate, "avg": row.rate, "count": 1}
+            for row in rows
+        ]
+
+    bucket = _bucket(db, interval)
+    periods = (
+        select(
+            bucket.label("bucket"),
+            func.min(Rate.date).label("first_date"),
+            func.max(Rate.date).label("last_date"),
+            func.min(Rate.rate).label("low"),
+            func.max(Rate.rate).label("high"),
+            func.avg(Rate.rate).label("avg"),
+            func.count().label("count")
+        )
+        .where(*conditions)
+        .group_by(bucket)
+        .subquery()
+    )
+    first_rate = aliased(Rate)
+    last_rate = aliased(Rate)
+
+    rows = db.execute(
+        select(periods, first_rate.rate.label("open"), last_rate.rate.label("close"))
+        .join(first_rate, and_(first_rate.currency_id == currency_id, first_rate.date == periods.c.first_date))
+        .join(last_rate, and_(last_rate.currency_id == currency_id, last_rate.date == periods.c.last_date))
+        .order_by(periods.c.bucket)
+    ).all()
+    return [
+        {"date": row.bucket, "open": row.open, "close": row.close, "low": row.low,
+         "high": row.high, "avg": row.avg, "count": row.count}
+        for row in rows
+    ]
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Set, Tuple
+
+from models import FetchJob
+from nbp_client import NBPClient
+from nbp_service import backfill, fetch_and_save_rates
+from sqlalchemy import select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "30"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "300"))
+JOB_BACKFILL_CONCURRENCY = int(os.getenv("JOB_BACKFILL_CONCURRENCY", "4"))
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+ACTIVE_STATUSES = (PENDING, RUNNING)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def job_dedupe_key(start: Optional[date], end: Optional[date]) -> str:
+    return "latest" if start is None else f"{start.isoformat()}:{end.isoformat()}"
+
+
+def _active_job(db: Session, dedupe_key: str) -> Optional[FetchJob]:
+    return db.execute(
+        select(FetchJob).where(FetchJob.dedupe_key == dedupe_key, FetchJob.status.in_(ACTIVE_STATUSES))
+    ).scalar()
+
+
+def create_fetch_job(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> Tuple[FetchJob, bool]:
+    """
+    Tworzy zadanie pobrania tabel z NBP: aktualnej (bez dat), z jednego dnia lub z przedziału dat.
+    Jeśli identyczne zadanie już oczekuje lub jest wykonywane, zwraca je zamiast tworzyć nowe
+    (unikalny indeks częściowy rozstrzyga także wyścig równoczesnych zgłoszeń).
+
+    Returns:
+        Krotka (zadanie, czy zostało utworzone).
+    """
+    end = end or start
+    dedupe_key = job_dedupe_key(start, end)
+    existing = _active_job(db, dedupe_key)
+    if existing is not None:
+        return existing, False
+
+    job = FetchJob(
+        start_date=start,
+        end_date=end,
+        dedupe_key=dedupe_key,
+        status=PENDING,
+        days_total=(end - start).days + 1 if start else 1,
+        days_done=0,
+        tables_fetched=0,
+        rows_added=0,
+        created_at=_now()
+    )
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        existing = _active_job(db, dedupe_key)
+        if existing is None:
+            raise
+        return existing, False
+    db.refresh(job)
+    return job, True
+
+
+class FetchJobRunner:
+    """
+    Pula `workers` zadań asyncio wykonujących zadania pobrania z tabeli fetch_jobs.
+
+    Zadanie jest przejmowane warunkową aktualizacją (pending -> running), więc przy wielu
+    procesach API każde wykona się tylko raz. Wykonywane zadanie co okno backfillu zapisuje
+    postęp i znacznik życia (heartbeat_at); zadania, których znacznik jest starszy niż
+    `stale_after` sekund (proces przerwany), wracają do kolejki i są wznawiane od pierwszego
+    niezapisanego dnia. Oczekujące zadania są wczytywane przy starcie i co `poll_interval` sekund.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        workers: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        stale_after: float = JOB_STALE_AFTER,
+        client: Optional[NBPClient] = None
+    ):
+        self.engine = engine
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.client = client
+        self._queue: "asyncio.Queue[int]" = asyncio.Queue()
+        self._queued: Set[int] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._stopped = asyncio.Event()
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._poll()))
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job_id: int) -> None:
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def enqueue_pending(self) -> None:
+        """
+        Przywraca do kolejki porzucone zadania i dodaje do niej wszystkie oczekujące.
+        """
+        for job_id in await asyncio.to_thread(self._pending_job_ids):
+            self.submit(job_id)
+
+    def _pending_job_ids(self) -> List[int]:
+        with Session(bind=self.engine) as db:
+            db.execute(
+                update(FetchJob)
+                .where(FetchJob.status == RUNNING, FetchJob.heartbeat_at < _now() - timedelta(seconds=self.stale_after))
+                .values(status=PENDING)
+            )
+            db.commit()
+            return list(db.execute(select(FetchJob.id).where(FetchJob.status == PENDING).order_by(FetchJob.id)).scalars())
+
+    async def _poll(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                await self.enqueue_pending()
+            except Exception as e:
+                logger.exception("Błąd podczas wczytywania oczekujących zadań: %s", e)
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                job = await asyncio.to_thread(self._claim, job_id)
+                if job is not None:
+                    await self.run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Błąd obsługi zadania %d: %s", job_id, e)
+
+    def _claim(self, job_id: int) -> Optional[FetchJob]:
+        now = _now()
+        with Session(bind=self.engine, expire_on_commit=False) as db:
+            claimed = db.execute(
+                update(FetchJob)
+                .where(FetchJob.id == job_id, FetchJob.status == PENDING)
+                .values(status=RUNNING, started_at=now, heartbeat_at=now)
+            ).rowcount
+            db.commit()
+            if not claimed:
+                return None
+            return db.get(FetchJob, job_id)
+
+    def _update(self, job_id: int, **values) -> None:
+        with Session(bind=self.engine) as db:
+            db.execute(update(FetchJob).where(FetchJob.id == job_id).values(heartbeat_at=_now(), **values))
+            db.commit()
+
+    async def run_job(self, job: FetchJob) -> None:
+        """
+        Wykonuje przejęte zadanie i zapisuje jego wynik (succeeded/failed).
+        Przerwane zatrzymaniem procesu wraca do stanu pending, by wznowić je po restarcie.
+        """
+        try:
+            if job.start_date is None or job.start_date == job.end_date:
+                tables_fetched, rows_added = await fetch_and_save_rates(self.engine, job.start_date, client=self.client)
+                await asyncio.to_thread(
+                    self._update, job.id, tables_fetched=tables_fetched, rows_added=rows_added,
+                    completed_through=job.end_date
+                )
+            else:
+                await self._run_range(job)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self._update, job.id, status=PENDING)
+            raise
+        except Exception as e:
+            logger.warning("Zadanie pobrania %d nie powiodło się: %s", job.id, e)
+            await asyncio.to_thread(self._update, job.id, status=FAILED, error=str(e), finished_at=_now())
+            return
+
+        await asyncio.to_thread(self._update, job.id, status=SUCCEEDED, days_done=job.days_total, finished_at=_now())
+
+    async def _run_range(self, job: FetchJob) -> None:
+        start = job.start_date
+        if job.completed_through and job.completed_through >= start:
+            start = job.completed_through + timedelta(days=1)
+        if start > job.end_date:
+            return
+
+        tables_fetched, rows_added = job.tables_fetched, job.rows_added
+
+        def on_progress(window_end: date, tables: int, added: int) -> None:
+            nonlocal tables_fetched, rows_added
+            tables_fetched += tables
+            rows_added += added
+            self._update(
+                job.id, completed_through=window_end, tables_fetched=tables_fetched, rows_added=rows_added,
+                days_done=(window_end - job.start_date).days + 1
+            )
+
+        with Session(bind=self.engine, autoflush=False) as db:
+            await backfill(
+                db, start, job.end_date, concurrency=JOB_BACKFILL_CONCURRENCY,
+                client=self.client, on_progress=on_progress
+            )
@@ -1,15 +1,92 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from datetime import date
-from typing import List, Optional
+from typing import List, Literal, Optional, Tuple, Union
 
 import models
 import schemas
-from database import get_db
-from fastapi import Depends, FastAPI, HTTPException
+from analytics import analytics_store, nan_to_none
+from cache_invalidation import RATE_CACHE_LISTEN, CacheInvalidationListener
+from compression import CompressionMiddleware
+from conversion import MissingRatesError, UnknownCurrencyError, convert, convert_with_tables, load_batch_tables
+from database import get_async_db, get_export_engine, is_replica_session, pool_status, primary_async_bind
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from history import UnknownCurrencyCodeError, history_from_db, history_from_snapshot
+from job_queue import JOB_WORKERS, FetchJobRunner, create_fetch_job
+from metrics import METRICS_DIR, GaugeCallback, MetricsMiddleware, MetricsStateWriter, render_metrics
+from nbp_client import NBPClientError, close_nbp_client
+from rate_cache import (
+    CURRENCIES_KEY,
+    LATEST_COLUMNS_KEY,
+    LATEST_KEY,
+    CachedResponse,
+    encode_response,
+    rate_cache,
+    rates_key
+)
+from rate_export import stream_rates
+from rate_matrix import RATE_MATRIX_MAX_DAYS, RateMatrix, matrix_from_rows, matrix_from_snapshot, rate_matrix_query
+from rate_snapshot import snapshot_store
+from singleflight import SingleFlight
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+
+SYNC_WORKER_ENABLED = os.getenv("SYNC_WORKER_ENABLED", "false").lower() == "true"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from database import async_engine, engine, replica_async_engine
+
+    sync_worker = None
+    sync_task = None
+    if SYNC_WORKER_ENABLED:
+        from sync_worker import SyncWorker
+
+        sync_worker = SyncWorker(engine)
+        sync_task = asyncio.create_task(sync_worker.run())
+
+    # Każdy worker nasłuchuje zapisów wykonanych przez inne procesy i unieważnia swój cache kursów.
+    cache_listener = None
+    if RATE_CACHE_LISTEN and engine.dialect.name == "postgresql":
+        cache_listener = CacheInvalidationListener(engine)
+        cache_listener.start()
 
-app = FastAPI(title="Currency Converter API")
+    # Zadania pobrania z NBP (POST /jobs/fetch) wykonuje ograniczona pula workerów w tle.
+    app.state.job_runner = None
+    if JOB_WORKERS > 0:
+        app.state.job_runner = FetchJobRunner(engine)
+        await app.state.job_runner.start()
+
+    # Przy wielu workerach gunicorna każdy zapisuje swoje metryki do wspólnego katalogu (gunicorn.conf.py).
+    metrics_writer = None
+    if METRICS_DIR:
+        metrics_writer = MetricsStateWriter()
+        metrics_writer.start()
+
+    yield
+
+    if app.state.job_runner:
+        await app.state.job_runner.stop()
+
+    if sync_worker:
+        sync_worker.stop()
+        await sync_task
+    if cache_listener:
+        await asyncio.to_thread(cache_listener.stop)
+    if metrics_writer:
+        await asyncio.to_thread(metrics_writer.stop)
+    await close_nbp_client()
+    await async_engine.dispose()
+    if replica_async_engine is not async_engine:
+        await replica_async_engine.dispose()
+
+app = FastAPI(title="Currency Converter API", lifespan=lifespan)
 
 origins = [
     "http://localhost:4200",
@@ -22,43 +99,510 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+nbp_fetch_flight = SingleFlight()
+
+GaugeCallback("rate_cache_hits_total", "Trafienia w cache tabel kursów.", lambda: rate_cache.hits, kind="counter")
+GaugeCallback("rate_cache_misses_total", "Chybienia w cache tabel kursów.", lambda: rate_cache.misses, kind="counter")
+GaugeCallback(
+    "rate_cache_hit_ratio", "Udział trafień w cache tabel kursów.",
+    lambda: rate_cache.hits / (rate_cache.hits + rate_cache.misses) if rate_cache.hits + rate_cache.misses else 0.0
+)
+GaugeCallback(
+    "nbp_fetch_coalesced_total", "Zapytania do NBP scalone z trwającym już pobraniem.",
+    lambda: nbp_fetch_flight.coalesced, kind="counter"
+)
+GaugeCallback(
+    "db_pool_checked_out", "Połączenia bazy danych wypożyczone z puli.",
+    lambda: {(name,): status.get("checked_out", 0) for name, status in pool_status().items()}, ("pool",)
+)
+
+PUBLISHED_TABLE_CACHE_CONTROL = "public, max-age=86400"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Kształt listy kursów: wiersze (obiekt na kurs) albo zwarte kolumny (codes[], rates[], ...).
+RatesShape = Literal["rows", "columns"]
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def _cached_json_response(request: Request, entry: CachedResponse, cache_control: str) -> Response:
+    """
+    Zwraca zserializowaną odpowiedź z nagłówkami ETag i Cache-Control
+    lub 304 Not Modified, jeśli klient ma już aktualną wersję (If-None-Match).
+    """
+    headers = {"ETag": entry.etag, "Cache-Control": cache_control}
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+def _json_response(payload) -> Response:
+    """
+    Zwraca gotowe struktury jako JSON z pominięciem walidacji response_model
+    (dane pochodzą z projekcji kolumn, więc mają już właściwe typy).
+    """
+    return Response(content=encode_response(payload).body, media_type="application/json")
+
+def _rates_cache_control(entry: CachedResponse, rates_date: date) -> str:
+    """
+    Tabela z przeszłości, która ma już kursy, nie zmieni się. Pustą lub dzisiejszą tabelę
+    klient musi za każdym razem rewalidować (ETag), bo może zostać jeszcze pobrana z NBP.
+    """
+    if not entry.empty and rates_date < date.today():
+        return PUBLISHED_TABLE_CACHE_CONTROL
+    return REVALIDATE_CACHE_CONTROL
+
+def _is_fetchable(rates_date: date) -> bool:
+    return rates_date <= date.today()
+
+def _parse_codes(codes: Optional[str]) -> Optional[List[str]]:
+    return [code.strip().upper() for code in codes.split(",") if code.strip()] if codes else None
 
 @app.get("/")
 def read_root():
     return {"message": "Currency Converter API is running"}
 
+@app.get("/stats")
+def get_stats():
+    """
+    Zwraca liczniki diagnostyczne procesu API (cache tabel, scalanie zapytań do NBP, pule połączeń bazy).
+    """
+    return {
+        "rate_cache": {"hits": rate_cache.hits, "misses": rate_cache.misses},
+        "nbp_fetch": nbp_fetch_flight.stats(),
+        "db_pool": pool_status()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Zwraca metryki API w formacie tekstowym Prometheusa (przy METRICS_DIR — zsumowane ze wszystkich workerów).
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/currencies", response_model=List[schemas.Currency])
-def get_currencies(db: Session = Depends(get_db)):
+async def get_currencies(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Zwraca listę dostępnych walut.
+    Lista jest przechowywana w cache procesu do czasu dodania nowej waluty.
     """
-    currencies = db.query(models.Currency).all()
-    return currencies
+    entry = rate_cache.get(CURRENCIES_KEY)
+    if entry is None:
+        generation = rate_cache.generation(CURRENCIES_KEY)
+        rows = (await db.execute(select(models.Currency.id, models.Currency.code, models.Currency.name))).all()
+        entry = rate_cache.set(
+            CURRENCIES_KEY, [{"id": row.id, "code": row.code, "name": row.name} for row in rows],
+            generation=generation, replica=is_replica_session(db)
+        )
+    return _cached_json_response(request, entry, REVALIDATE_CACHE_CONTROL)
 
-@app.get("/currencies/{date}", response_model=List[schemas.RateWithCurrency])
-def get_currencies_by_date(date: date, db: Session = Depends(get_db)):
+def _rates_table_payload(rates_date: date, rows: List[Tuple[str, str, float]], shape: RatesShape):
+    """
+    Buduje treść odpowiedzi z wierszy (kod, nazwa, kurs) jednej tabeli w wybranym kształcie.
+    """
+    if shape == "columns":
+        codes, names, rates = (list(column) for column in zip(*rows)) if rows else ([], [], [])
+        return {"date": rates_date, "codes": codes, "names": names, "rates": rates}
+    return [
+        {"date": rates_date, "rate": rate, "currency": {"code": code, "name": name}}
+        for code, name, rate in rows
+    ]
+
+async def _load_rates_entry(db: AsyncSession, rates_date: date, shape: RatesShape = "rows") -> CachedResponse:
+    """
+    Zwraca zserializowaną tabelę kursów z danej daty (z cache procesu, z migawki mmap lub z bazy).
+    Dane walut są pobierane tym samym zapytaniem (JOIN z projekcją kolumn),
+    bez ładowania obiektów ORM i leniwego doczytywania relacji `currency` dla każdego wiersza.
+    """
+    key = rates_key(rates_date, shape)
+    entry = rate_cache.get(key)
+    if entry is not None:
+        return entry
+
+    generation = rate_cache.generation(key)
+    snapshot = await snapshot_store.get_async(db)
+    if snapshot is not None and snapshot.covers(rates_date):
+        rows = snapshot.table(rates_date)
+    else:
+        rows = await _select_rates_table(db, rates_date)
+    return rate_cache.set(
+        key, _rates_table_payload(rates_date, rows, shape), empty=not rows,
+        generation=generation, replica=is_replica_session(db)
+    )
+
+async def _select_rates_table(db: AsyncSession, rates_date: date) -> List[Tuple[str, str, float]]:
+    return (await db.execute(
+        select(models.Currency.code, models.Currency.name, models.Rate.rate)
+        .join(models.Currency, models.Rate.currency_id == models.Currency.id)
+        .where(models.Rate.date == rates_date)
+        .order_by(models.Currency.code)
+    )).all()
+
+async def _load_rates_entry_from_primary(db: AsyncSession, rates_date: date, shape: RatesShape = "rows") -> CachedResponse:
+    """
+    Jak _load_rates_entry, ale czyta wprost z bazy głównej (z pominięciem cache i migawki), bo replika
+    i zbudowany z niej wpis cache mogą jeszcze nie mieć świeżo zapisanej tabeli. Wynik zastępuje wpis w cache.
+    """
+    key = rates_key(rates_date, shape)
+    generation = rate_cache.generation(key)
+    async with AsyncSession(bind=primary_async_bind(db)) as primary:
+        rows = await _select_rates_table(primary, rates_date)
+    return rate_cache.set(key, _rates_table_payload(rates_date, rows, shape), empty=not rows, generation=generation)
+
+async def _sync_from_nbp(db: AsyncSession, target_date: Optional[date]) -> Tuple[int, int]:
+    """
+    Pobiera tabelę z NBP i zapisuje ją w bazie. Równoczesne żądania dla tej samej daty
+    są scalane w jedno zapytanie do NBP, którego wynik otrzymują wszyscy oczekujący.
+    Daty, dla których NBP już potwierdził brak tabeli, są pomijane bez odpytywania NBP.
+    Zapis zawsze trafia do bazy głównej, także gdy żądanie korzysta z sesji repliki.
+
+    Returns:
+        Krotka (liczba pobranych tabel, liczba dodanych kursów).
+    """
+    from nbp_service import fetch_and_save_rates, is_date_without_table
+
+    if target_date and await db.run_sync(is_date_without_table, target_date):
+        return 0, 0
+
+    bind = primary_async_bind(db)
+    try:
+        return await nbp_fetch_flight.do(target_date, lambda: fetch_and_save_rates(bind, target_date))
+    except NBPClientError as e:
+        raise HTTPException(status_code=502, detail=f"Błąd połączenia z API NBP: {e}")
+
+@app.get("/currencies/latest", response_model=Union[List[schemas.RateWithCurrency], schemas.LatestRateColumns])
+async def get_latest_rates(request: Request, shape: RatesShape = "rows", db: AsyncSession = Depends(get_async_db)):
+    """
+    Zwraca najnowszy kurs każdej waluty (daty mogą się różnić między walutami).
+    Kursy pochodzą z tabeli podsumowania latest_rates aktualizowanej przez save_rates,
+    więc koszt zapytania nie zależy od długości historii.
+    Z parametrem shape=columns zwraca zwartą postać kolumnową (codes, names, dates, rates).
+    """
+    key = LATEST_COLUMNS_KEY if shape == "columns" else LATEST_KEY
+    entry = rate_cache.get(key)
+    if entry is None:
+        generation = rate_cache.generation(key)
+        rows = (await db.execute(
+            select(models.LatestRate.date, models.LatestRate.rate, models.Currency.code, models.Currency.name)
+            .join(models.Currency, models.LatestRate.currency_id == models.Currency.id)
+            .order_by(models.Currency.code)
+        )).all()
+        if shape == "columns":
+            payload = {
+                "codes": [row.code for row in rows], "names": [row.name for row in rows],
+                "dates": [row.date for row in rows], "rates": [row.rate for row in rows]
+            }
+        else:
+            payload = [
+                {"date": row.date, "rate": row.rate, "currency": {"code": row.code, "name": row.name}}
+                for row in rows
+            ]
+        entry = rate_cache.set(key, payload, empty=not rows, generation=generation, replica=is_replica_session(db))
+    return _cached_json_response(request, entry, REVALIDATE_CACHE_CONTROL)
+
+@app.get("/currencies/{date}", response_model=Union[List[schemas.RateWithCurrency], schemas.RateTableColumns])
+async def get_currencies_by_date(
+    date: date,
+    request: Request,
+    as_of: bool = False,
+    fetch: bool = False,
+    shape: RatesShape = "rows",
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Zwraca kursy walut z wybranej daty.
+    Opublikowane tabele z przeszłości mogą być buforowane przez klientów i serwery pośredniczące.
+    Z parametrem fetch=true brakująca tabela jest najpierw pobierana z NBP (read-through).
+    Z parametrem as_of=true zwraca najnowszą tabelę opublikowaną w tym dniu lub wcześniej
+    (np. piątkową dla niedzieli); faktyczna data tabeli trafia do nagłówka X-Rates-Date.
+    Z parametrem shape=columns zwraca zwartą postać kolumnową (codes, names, rates).
+    """
+    entry = await _load_rates_entry(db, date, shape)
+    if fetch and entry.empty and _is_fetchable(date):
+        await _sync_from_nbp(db, date)
+        entry = await _load_rates_entry_from_primary(db, date, shape)
+
+    table_date = date
+    if as_of and entry.empty:
+        from nbp_service import resolve_table_date
+
+        table_date = await db.run_sync(resolve_table_date, date) or date
+        entry = await _load_rates_entry(db, table_date, shape)
+
+    cache_control = _rates_cache_control(entry, table_date) if table_date == date else REVALIDATE_CACHE_CONTROL
+    response = _cached_json_response(request, entry, cache_control)
+    response.headers["X-Rates-Date"] = table_date.isoformat()
+    return response
+
+@app.get("/currencies/{code}/history", response_model=schemas.RateHistory)
+async def get_currency_history(
+    code: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    interval: Literal["day", "week", "month"] = "day",
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Zwraca historię kursu waluty w przedziale dat.
+    Dla interwałów week/month kursy są agregowane po stronie bazy (open/close/low/high/avg).
     """
-    rates = db.query(models.Rate).filter(models.Rate.date == date).all()
-    return rates
+    try:
+        snapshot = await snapshot_store.get_async(db)
+        if snapshot is not None:
+            points = await asyncio.to_thread(history_from_snapshot, snapshot, code.upper(), start, end, interval)
+        else:
+            points = await db.run_sync(history_from_db, code, start, end, interval)
+    except UnknownCurrencyCodeError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return _json_response({"code": code.upper(), "interval": interval, "points": points})
+
+@app.get("/analytics/rolling", response_model=schemas.RollingStats)
+async def get_rolling_stats(
+    code: str,
+    window: int = Query(20, ge=2),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    annualize: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Zwraca średnią kroczącą kursu waluty i zmienność jej dziennych logarytmicznych stóp zwrotu
+    w oknie `window` dni notowań, dla każdego dnia z przedziału [start, end].
+    Z parametrem annualize=true zmienność jest przeliczana na skalę roczną.
+    """
+    try:
+        analytics = await analytics_store.get_async(db.bind)
+        dates, mean, volatility = await asyncio.to_thread(analytics.rolling, code.upper(), window, start, end, annualize)
+    except UnknownCurrencyCodeError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return _json_response({
+        "code": code.upper(), "window": window, "annualized": annualize,
+        "dates": dates, "mean": nan_to_none(mean), "volatility": nan_to_none(volatility)
+    })
+
+@app.get("/analytics/correlation", response_model=schemas.CorrelationMatrix)
+async def get_correlation_matrix(
+    codes: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    window: Optional[int] = Query(None, ge=3),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Zwraca macierz korelacji dziennych stóp zwrotu walut (domyślnie wszystkich, z całej historii).
+    Zakres można zawęzić przedziałem dat i/lub oknem `window` ostatnich dni notowań.
+    Parametr codes przyjmuje listę kodów walut rozdzielonych przecinkami.
+    """
+    code_list = _parse_codes(codes)
+    try:
+        analytics = await analytics_store.get_async(db.bind)
+        result_codes, matrix, observations = await asyncio.to_thread(analytics.correlation, code_list, start, end, window)
+    except UnknownCurrencyCodeError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return _json_response({
+        "codes": result_codes, "observations": observations,
+        "matrix": [nan_to_none(row) for row in matrix]
+    })
 
 @app.post("/currencies/fetch")
-def fetch_currencies(date: Optional[date] = None, db: Session = Depends(get_db)):
+async def fetch_currencies(date: Optional[date] = None, db: AsyncSession = Depends(get_async_db)):
     """
     Pobiera dane z API NBP i zapisuje je do bazy danych.
     Jeśli podano datę, pobiera kursy dla tej daty. W przeciwnym razie pobiera aktualną tabelę.
+    Zapytanie do NBP i zapis do bazy są asynchroniczne.
     """
-    from nbp_service import fetch_exchange_rates, normalize_data, save_rates
-
-    raw_data = fetch_exchange_rates(date)
-    if not raw_data:
-        raise HTTPException(status_code=404, detail="Nie udało się pobrać danych z API NBP (brak danych dla wybranej daty lub błąd połączenia)")
-
-    normalized_data = normalize_data(raw_data)
-    added_count = save_rates(db, normalized_data)
+    tables_fetched, added_count = await _sync_from_nbp(db, date)
+    if not tables_fetched:
+        raise HTTPException(status_code=404, detail="Brak danych w API NBP dla wybranej daty")
 
     return {
         "message": f"Pomyślnie zsynchronizowano dane. Dodano {added_count} nowych kursów.",
-        "tables_fetched": len(raw_data)
+        "tables_fetched": tables_fetched
     }
+
+async def _rate_matrix_response(
+    request: Request, db: AsyncSession, start: date, end: date, codes: Optional[List[str]]
+) -> Response:
+    """
+    Zwraca kursy z przedziału dat jako macierz (dates, codes, values) z ETagiem umożliwiającym rewalidację.
+    """
+    if end < start:
+        raise HTTPException(status_code=422, detail="Data końcowa nie może być wcześniejsza niż początkowa")
+    if (end - start).days >= RATE_MATRIX_MAX_DAYS:
+        raise HTTPException(status_code=422, detail=f"Przedział dat nie może przekraczać {RATE_MATRIX_MAX_DAYS} dni")
+
+    codes = list(dict.fromkeys(code.upper() for code in codes)) if codes else None
+    snapshot = await snapshot_store.get_async(db)
+    try:
+        if snapshot is not None:
+            entry = await asyncio.to_thread(
+                lambda: _encode_rate_matrix(matrix_from_snapshot(snapshot, start, end, codes))
+            )
+        else:
+            # Zapytanie przez sesję asynchroniczną, a układanie macierzy i serializacja w wątku roboczym.
+            rows = (await db.execute(rate_matrix_query(start, end, codes))).all()
+            entry = await asyncio.to_thread(lambda: _encode_rate_matrix(matrix_from_rows(rows, codes)))
+    except UnknownCurrencyCodeError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return _cached_json_response(request, entry, REVALIDATE_CACHE_CONTROL)
+
+def _encode_rate_matrix(matrix: RateMatrix) -> CachedResponse:
+    return encode_response({
+        "dates": matrix.dates, "codes": matrix.codes,
+        "values": [nan_to_none(row) for row in matrix.values]
+    })
+
+@app.get("/rates", response_model=schemas.RateMatrix)
+async def get_rates(
+    request: Request,
+    start: date,
+    end: date,
+    codes: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Zwraca kursy wielu walut z przedziału dat jednym zapytaniem, jako macierz:
+    values[i][j] to kurs waluty codes[j] z dnia dates[i] (null, gdy brak kursu).
+    Parametr codes przyjmuje listę kodów walut rozdzielonych przecinkami (domyślnie wszystkie).
+    """
+    return await _rate_matrix_response(request, db, start, end, _parse_codes(codes))
+
+@app.post("/rates", response_model=schemas.RateMatrix)
+async def query_rates(query: schemas.RateMatrixQuery, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Jak GET /rates, dla długich list walut przekazywanych w treści zapytania.
+    """
+    return await _rate_matrix_response(request, db, query.start, query.end, query.codes)
+
+@app.post("/jobs/fetch", response_model=schemas.FetchJob, status_code=202)
+async def submit_fetch_job(
+    job_request: schemas.FetchJobRequest, request: Request, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Zleca pobranie z NBP aktualnej tabeli, tabeli z jednego dnia lub wszystkich tabel z przedziału dat
+    i od razu zwraca zadanie; jego postęp i wynik udostępnia GET /jobs/{id}.
+    Zlecenie identyczne z oczekującym lub wykonywanym zadaniem zwraca to zadanie.
+    """
+    from nbp_service import NBP_FIRST_TABLE_DATE
+
+    start, end = job_request.start, job_request.end
+    if job_request.target_date:
+        if start or end:
+            raise HTTPException(status_code=422, detail="Podaj datę albo przedział dat (start, end), nie oba")
+        start = end = job_request.target_date
+    elif bool(start) != bool(end):
+        raise HTTPException(status_code=422, detail="Przedział dat wymaga początku i końca")
+    if start:
+        if end < start:
+            raise HTTPException(status_code=422, detail="Data końcowa nie może być wcześniejsza niż początkowa")
+        if start < NBP_FIRST_TABLE_DATE or end > date.today():
+            raise HTTPException(
+                status_code=422,
+                detail=f"Tabele NBP są dostępne od {NBP_FIRST_TABLE_DATE.isoformat()} do dzisiaj"
+            )
+
+    job, created = await db.run_sync(create_fetch_job, start, end)
+    job_runner = getattr(request.app.state, "job_runner", None)
+    if created and job_runner:
+        job_runner.submit(job.id)
+    return job
+
+@app.get("/jobs/{job_id}", response_model=schemas.FetchJob)
+async def get_fetch_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Zwraca stan zadania pobrania z NBP: status, postęp (days_done z days_total) i liczbę dodanych kursów.
+    Stan jest czytany z bazy głównej, bo replika może nie mieć jeszcze świeżo utworzonego zadania.
+    """
+    async with AsyncSession(bind=primary_async_bind(db)) as primary:
+        job = await primary.get(models.FetchJob, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Nie znaleziono zadania")
+        return schemas.FetchJob.model_validate(job)
+
+@app.get("/rates/export")
+async def export_rates(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    codes: Optional[str] = None,
+    bind: Engine = Depends(get_export_engine)
+):
+    """
+    Strumieniuje historię kursów w formacie NDJSON lub CSV (np. do hurtowni danych).
+    Parametr codes przyjmuje listę kodów walut rozdzielonych przecinkami.
+    Eksport czyta własnym połączeniem; zadanie w tle zamyka generator (kursor i połączenie)
+    po wysłaniu odpowiedzi, także gdy klient rozłączył się w trakcie.
+    """
+    code_list = _parse_codes(codes)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+
+    chunks = stream_rates(bind, format, start, end, code_list)
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="rates.{format}"'},
+        background=BackgroundTask(chunks.close)
+    )
+
+@app.get("/convert", response_model=schemas.ConversionResult)
+async def convert_amount(
+    from_code: str = Query(alias="from"),
+    to_code: str = Query(alias="to"),
+    amount: float = 1.0,
+    date: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Przelicza kwotę między dwiema walutami po kursach średnich NBP z wybranej daty
+    (domyślnie z najnowszej tabeli w bazie).
+    """
+    try:
+        # Wczytanie i weryfikacja migawki poza pętlą zdarzeń; convert korzysta potem z ustalonego stanu.
+        await snapshot_store.get_async(db)
+        rates_date, rate, result = await db.run_sync(convert, amount, from_code, to_code, date)
+    except MissingRatesError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UnknownCurrencyError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return schemas.ConversionResult(
+        amount=amount, from_code=from_code.upper(), to_code=to_code.upper(),
+        date=rates_date, rate=rate, result=result
+    )
+
+@app.post("/convert/batch", response_model=schemas.BatchConversionResponse)
+async def convert_amounts(request: schemas.BatchConversionRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Przelicza wiele pozycji (kwota, z, na, data) w jednym zapytaniu, jednym wektorowym przebiegiem.
+    Tabele kursów są wczytywane przez sesję asynchroniczną, a obliczenia wykonywane w puli wątków.
+    """
+    items = request.items
+    try:
+        await snapshot_store.get_async(db)
+        resolved_dates, tables = await db.run_sync(load_batch_tables, [item.rates_date for item in items])
+        batch = await asyncio.to_thread(
+            convert_with_tables,
+            [item.amount for item in items],
+            [item.from_code for item in items],
+            [item.to_code for item in items],
+            resolved_dates,
+            tables
+        )
+    except MissingRatesError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UnknownCurrencyError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {"results": [
+        {"amount": item.amount, "from": item.from_code.upper(), "to": item.to_code.upper(),
+         "date": rates_date, "rate": rate, "result": result}
+        for item, rates_date, rate, result in zip(items, batch.dates, batch.rates.tolist(), batch.results.tolist())
+    ]}
@@ -0,0 +1,429 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as FrequencyCounter
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Katalog współdzielony przez workery gunicorna: każdy proces zapisuje w nim stan swoich metryk,
+# a /metrics sumuje pliki wszystkich procesów. Pusty — metryki tylko bieżącego procesu.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_HEADER = "x-profile"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+ROWS_BUCKETS = (0, 1, 35, 100, 1000, 10000, 100000)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> Dict[Labels, object]:
+        raise NotImplementedError
+
+    def merge(self, processes: Iterable[Dict[Labels, object]]) -> Dict[Labels, object]:
+        """
+        Łączy próbki wielu procesów (domyślnie sumuje wartości o tych samych etykietach).
+        """
+        merged: Dict[Labels, object] = {}
+        for samples in processes:
+            for key, value in samples.items():
+                merged[key] = merged.get(key, 0.0) + value
+        return merged
+
+    def lines(self, values: Dict[Labels, object], labelnames: Sequence[str]) -> List[str]:
+        return [f"{self.name}{_format_labels(labelnames, key)} {_format_value(v)}" for key, v in sorted(values.items())]
+
+    def render(self) -> List[str]:
+        return self.header() + self.lines(self.samples(), self.labelnames)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Dict[Labels, object]:
+        with self._lock:
+            return dict(self._values)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Dla każdego zestawu etykiet: liczności kubełków (bez skumulowania), suma, liczba obserwacji.
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[position] += 1
+            total[0] += value
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> Dict[Labels, object]:
+        # Wartość próbki: [liczności kubełków, suma obserwacji].
+        with self._lock:
+            return {key: [list(counts), total[0]] for key, (counts, total) in self._values.items()}
+
+    def merge(self, processes: Iterable[Dict[Labels, object]]) -> Dict[Labels, object]:
+        merged: Dict[Labels, object] = {}
+        for samples in processes:
+            for key, (counts, total) in samples.items():
+                if key not in merged:
+                    merged[key] = [list(counts), total]
+                else:
+                    merged_counts = merged[key][0]
+                    for position, count in enumerate(counts):
+                        merged_counts[position] += count
+                    merged[key][1] += total
+        return merged
+
+    def lines(self, values: Dict[Labels, object], labelnames: Sequence[str]) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labelnames, key)} {cumulative}")
+        return lines
+
+
+class GaugeCallback(_Metric):
+    """
+    Metryka wyliczana w chwili odczytu (np. z liczników istniejących obiektów).
+    Funkcja zwraca wartość lub słownik {krotka etykiet: wartość}.
+    Przy wielu workerach liczniki (kind="counter") są sumowane, a wskaźniki (gauge) podawane
+    osobno dla każdego działającego procesu, z dodatkową etykietą `pid`.
+    """
+
+    def __init__(self, name: str, documentation: str, fn: Callable[[], object], labelnames: Sequence[str] = (), kind: str = "gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def samples(self) -> Dict[Labels, object]:
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return {tuple(str(label) for label in key): value for key, value in values.items()}
+
+
+REGISTRY: List[_Metric] = []
+
+def render_metrics(directory: str = METRICS_DIR) -> str:
+    """
+    Zwraca wszystkie metryki w formacie tekstowym Prometheusa (wersja 0.0.4).
+    Z katalogiem `directory` — zsumowane ze wszystkich procesów, które zapisały w nim swój stan.
+    """
+    if directory:
+        return _render_processes(directory)
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+_state_lock = threading.Lock()
+
+
+def _state_path(directory: str, pid: int) -> str:
+    return os.path.join(directory, f"metrics_{pid}.json")
+
+
+def write_metrics_state(directory: str = METRICS_DIR) -> None:
+    """
+    Zapisuje stan metryk bieżącego procesu do `directory` (atomowo, przez plik tymczasowy).
+    """
+    state = {
+        metric.name: {"kind": metric.kind, "samples": [[list(key), value] for key, value in metric.samples().items()]}
+        for metric in REGISTRY
+    }
+    path = _state_path(directory, os.getpid())
+    # Zapisują wątek MetricsStateWriter i obsługa /metrics; wspólny plik tymczasowy wymaga wyłączności.
+    with _state_lock:
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+
+def mark_process_dead(pid: int, directory: str = METRICS_DIR) -> None:
+    """
+    Usuwa wskaźniki (gauge) zakończonego procesu; jego liczniki i histogramy nadal wchodzą do sum.
+    Wywoływane przez gunicorna po zakończeniu workera (child_exit w gunicorn.conf.py).
+    """
+    path = _state_path(directory, pid)
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return
+    state = {name: metric for name, metric in state.items() if metric["kind"] != "gauge"}
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def _read_states(directory: str) -> Dict[int, dict]:
+    states = {}
+    for path in glob.glob(os.path.join(directory, "metrics_*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                states[int(os.path.basename(path)[len("metrics_"):-len(".json")])] = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Pominięto plik metryk %s: %s", path, e)
+    return states
+
+
+def _render_processes(directory: str) -> str:
+    write_metrics_state(directory)
+    states = _read_states(directory)
+    lines: List[str] = []
+    for metric in REGISTRY:
+        processes = {
+            pid: {tuple(key): value for key, value in state[metric.name]["samples"]}
+            for pid, state in sorted(states.items()) if metric.name in state
+        }
+        if metric.kind == "gauge":
+            values = {key + (str(pid),): value for pid, samples in processes.items() for key, value in samples.items()}
+            lines.extend(metric.header() + metric.lines(values, metric.labelnames + ("pid",)))
+        else:
+            lines.extend(metric.header() + metric.lines(metric.merge(processes.values()), metric.labelnames))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsStateWriter:
+    """
+    Wątek w tle zapisujący co `interval` sekund stan metryk procesu do katalogu współdzielonego
+    przez workery, żeby /metrics obsłużone przez dowolny z nich obejmowało wszystkie procesy.
+    """
+
+    def __init__(self, directory: str = METRICS_DIR, interval: float = METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self._write()
+
+    def _write(self) -> None:
+        try:
+            write_metrics_state(self.directory)
+        except OSError as e:
+            logger.warning("Nie udało się zapisać metryk do %s: %s", self.directory, e)
+
+    def start(self) -> None:
+        self._write()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self._write()
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Czas obsługi żądania HTTP (do wysłania całej odpowiedzi).", ("method", "route", "status")
+)
+HTTP_REQUEST_DB_STATEMENTS = Histogram(
+    "http_request_db_statements", "Liczba instrukcji SQL wykonanych podczas obsługi żądania.", ("route",), COUNT_BUCKETS
+)
+HTTP_REQUEST_DB_DURATION = Histogram(
+    "http_request_db_duration_seconds", "Łączny czas instrukcji SQL wykonanych podczas obsługi żądania.", ("route",)
+)
+DB_STATEMENTS = Counter("db_statements_total", "Liczba wykonanych instrukcji SQL.")
+NBP_FETCH_DURATION = Histogram(
+    "nbp_fetch_duration_seconds", "Czas pojedynczego zapytania do API NBP według statusu odpowiedzi.", ("status",)
+)
+NBP_CACHE_REQUESTS = Counter("nbp_cache_requests_total", "Odczyty dyskowego cache odpowiedzi NBP.", ("result",))
+NBP_ROWS_ADDED = Histogram(
+    "nbp_sync_rows_added", "Liczba nowych kursów dodanych przez jedną synchronizację z NBP.", ("kind",), ROWS_BUCKETS
+)
+
+class _RequestStats:
+    __slots__ = ("statements", "seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[_RequestStats]] = ContextVar("request_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    DB_STATEMENTS.inc()
+    # Statystyki są wspólnym, mutowalnym obiektem, więc widzą je też wątki puli, do których kopiowany jest kontekst.
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.seconds += time.perf_counter() - context._metrics_started
+
+class SamplingProfiler:
+    """
+    Profiler próbkujący: wątek w tle co `interval` sekund zapisuje stosy wszystkich pozostałych wątków
+    (pętla zdarzeń i pula wątków), więc obejmuje także endpointy synchroniczne.
+    Wynik to stosy w formacie "folded" (zgodnym z flamegraph.pl / speedscope) z liczbą próbek.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples: FrequencyCounter = FrequencyCounter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._thread.join()
+
+    def report(self, limit: int = 200) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common(limit)) + "\n"
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI mierzące czas żądania do wysłania ostatniego fragmentu odpowiedzi
+    (także dla odpowiedzi strumieniowych) oraz liczbę i czas instrukcji SQL w jego trakcie.
+    Etykietą jest szablon ścieżki (np. /currencies/{date}), a nie konkretny URL.
+
+    Przy PROFILING_ENABLED=true żądanie z nagłówkiem `X-Profile: 1` zwraca zamiast odpowiedzi
+    raport profilera próbkującego.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if PROFILING_ENABLED and (PROFILE_HEADER.encode(), b"1") in scope.get("headers", []):
+            await self._profile(scope, receive, send)
+            return
+
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method=scope["method"], route=route, status=str(status))
+            HTTP_REQUEST_DB_STATEMENTS.observe(stats.statements, route=route)
+            HTTP_REQUEST_DB_DURATION.observe(stats.seconds, route=route)
+
+    async def _profile(self, scope, receive, send):
+        async def discard(message):
+            pass
+
+        with SamplingProfiler() as profiler:
+            await self.app(scope, receive, discard)
+
+        body = profiler.report().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
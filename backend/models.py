@@ -1,8 +1,10 @@
-from sqlalchemy import Integer, String, Date, Float, ForeignKey
+from sqlalchemy import BigInteger, Integer, String, Text, Date, DateTime, Float, ForeignKey, Boolean, Index, PrimaryKeyConstraint, func, text
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.schema import CreateColumn
 from database import Base
-from typing import List
-from datetime import date
+from typing import List, Optional
+from datetime import date, datetime
 
 class Currency(Base):
     __tablename__ = "currencies"
@@ -15,10 +17,86 @@ class Currency(Base):
 
 class Rate(Base):
     __tablename__ = "rates"
+    # W Postgresie tabela jest partycjonowana zakresami po roku (migracja f4a8c2d6e913), więc jej
+    # klucz główny musi zawierać datę: (id, date). Partycje kolejnych lat tworzy save_rates.
+    __table_args__ = (
+        # Jeden unikalny indeks: arbiter ON CONFLICT (currency_id, date) i index-only scan historii (INCLUDE rate).
+        Index("uq_rates_currency_id_date", "currency_id", "date", unique=True, postgresql_include=["rate"]),
+        Index("ix_rates_date", "date", postgresql_using="brin"),
+    )
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    # Postgres: SERIAL (sekwencja rates_id_seq, jak w migracjach); SQLite: alias rowid (zob. niżej).
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True, index=True, info={"sqlite_rowid": True})
     currency_id: Mapped[int] = mapped_column(Integer, ForeignKey("currencies.id"), nullable=False)
-    date: Mapped[date] = mapped_column(Date, nullable=False, index=True)
+    date: Mapped[date] = mapped_column(Date, primary_key=True)
     rate: Mapped[float] = mapped_column(Float, nullable=False)
 
     currency: Mapped["Currency"] = relationship("Currency", back_populates="rates")
+
+# SQLite nie nadaje wartości kolumnie ze złożonego klucza głównego, więc kolumna oznaczona `sqlite_rowid`
+# jest tam aliasem rowid (INTEGER PRIMARY KEY), a klucz (id, date), który przy unikalnym id niczego nie dodaje,
+# nie jest tworzony. Metadane modelu i schemat Postgresa mają klucz (id, date).
+@compiles(CreateColumn, "sqlite")
+def _create_sqlite_rowid_column(create, compiler, **kw):
+    column = create.element
+    if column.info.get("sqlite_rowid"):
+        return f"{compiler.preparer.format_column(column)} INTEGER PRIMARY KEY"
+    return compiler.visit_create_column(create, **kw)
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _create_sqlite_primary_key(constraint, compiler, **kw):
+    if any(column.info.get("sqlite_rowid") for column in constraint.columns):
+        return None
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
+class RatesVersion(Base):
+    __tablename__ = "rates_version"
+    # Jeden wiersz (id = 1): liczba kursów dopisanych dotąd przez save_rates, zwiększana w tej samej transakcji.
+    # Tani (odczyt po kluczu głównym) znacznik stanu tabeli rates, np. do sprawdzania aktualności migawki mmap.
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+class TableCalendar(Base):
+    __tablename__ = "table_calendar"
+
+    date: Mapped[date] = mapped_column(Date, primary_key=True)
+    has_table: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    checked_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+
+class LatestRate(Base):
+    __tablename__ = "latest_rates"
+    # Najnowszy kurs każdej waluty, utrzymywany przez save_rates w tej samej transakcji co tabela rates.
+
+    currency_id: Mapped[int] = mapped_column(Integer, ForeignKey("currencies.id"), primary_key=True)
+    date: Mapped[date] = mapped_column(Date, nullable=False)
+    rate: Mapped[float] = mapped_column(Float, nullable=False)
+
+class FetchJob(Base):
+    __tablename__ = "fetch_jobs"
+    # Co najwyżej jedno aktywne (oczekujące lub wykonywane) zadanie na ten sam zakres dat.
+    __table_args__ = (
+        Index(
+            "uq_fetch_jobs_active_dedupe_key", "dedupe_key", unique=True,
+            postgresql_where=text("status IN ('pending', 'running')"),
+            sqlite_where=text("status IN ('pending', 'running')")
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    # Brak dat oznacza aktualną tabelę; start_date == end_date to tabela z jednego dnia.
+    start_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
+    end_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
+    dedupe_key: Mapped[str] = mapped_column(String(32), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending", index=True)
+    days_total: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    days_done: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Ostatni dzień zakresu, którego kursy są już zapisane; od następnego zadanie jest wznawiane.
+    completed_through: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
+    tables_fetched: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rows_added: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
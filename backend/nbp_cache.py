@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+NBP_CACHE_DIR = os.getenv("NBP_CACHE_DIR", "")
+NBP_CACHE_TTL = float(os.getenv("NBP_CACHE_TTL", "900"))
+
+_DATE_IN_URL = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+class CachedNBPResponse(NamedTuple):
+    """
+    Zapisana odpowiedź NBP: status 200 z tabelami lub 404 (brak tabel).
+    """
+    url: str
+    status: int
+    fetched_at: float
+    body: Optional[List[Dict[str, Any]]]
+
+    @property
+    def tables(self) -> List[Dict[str, Any]]:
+        return self.body if self.status == 200 and self.body else []
+
+
+def url_dates(url: str) -> List[date]:
+    """
+    Zwraca daty występujące w ścieżce zapytania (jedna dla tabeli z dnia, dwie dla zakresu).
+    """
+    return [date.fromisoformat(value) for value in _DATE_IN_URL.findall(url)]
+
+
+class NBPResponseCache:
+    """
+    Dyskowy cache surowych odpowiedzi API NBP, adresowany skrótem sha256 adresu URL.
+
+    Tabele z przeszłości się nie zmieniają, więc odpowiedzi dla dat sprzed dzisiaj (także 404
+    oznaczające brak tabeli) są ważne bezterminowo. Aktualna tabela i zapytania obejmujące
+    dzisiejszą datę wygasają po `ttl` sekundach, bo NBP może ją jeszcze opublikować.
+    Wpisy są zapisywane atomowo (plik tymczasowy + os.replace).
+    """
+
+    def __init__(self, directory: str, ttl: float = NBP_CACHE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, url: str) -> str:
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.json")
+
+    def is_immutable(self, url: str) -> bool:
+        dates = url_dates(url)
+        return bool(dates) and max(dates) < date.today()
+
+    def get(self, url: str) -> Optional[CachedNBPResponse]:
+        """
+        Zwraca zapisaną odpowiedź lub None, gdy jej brak albo wygasła.
+        """
+        try:
+            with open(self._path(url), encoding="utf-8") as f:
+                entry = CachedNBPResponse(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        if entry.url != url:
+            return None
+        if not self.is_immutable(url) and time.time() - entry.fetched_at > self.ttl:
+            return None
+        return entry
+
+    def put(self, url: str, status: int, body: Optional[List[Dict[str, Any]]] = None) -> None:
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Zapisy mogą iść równolegle z wątków puli, więc plik tymczasowy jest osobny dla wątku.
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(CachedNBPResponse(url, status, time.time(), body)._asdict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def entries(self) -> Iterator[CachedNBPResponse]:
+        """
+        Zwraca kolejno wszystkie zapisane odpowiedzi, bez względu na ich ważność.
+        """
+        for root, _, files in os.walk(self.directory):
+            for name in sorted(files):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(root, name), encoding="utf-8") as f:
+                        yield CachedNBPResponse(**json.load(f))
+                except (OSError, ValueError, TypeError):
+                    continue
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from metrics import NBP_CACHE_REQUESTS, NBP_FETCH_DURATION
+from nbp_cache import NBP_CACHE_DIR, NBPResponseCache
+
+NBP_API_URL = os.getenv("NBP_API_URL", "https://api.nbp.pl/api/exchangerates/tables/a/")
+
+NBP_CONNECT_TIMEOUT = float(os.getenv("NBP_CONNECT_TIMEOUT", "5"))
+NBP_READ_TIMEOUT = float(os.getenv("NBP_READ_TIMEOUT", "30"))
+NBP_MAX_CONNECTIONS = int(os.getenv("NBP_MAX_CONNECTIONS", "10"))
+NBP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("NBP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+NBP_MAX_RETRIES = int(os.getenv("NBP_MAX_RETRIES", "3"))
+NBP_BACKOFF_BASE = float(os.getenv("NBP_BACKOFF_BASE", "0.5"))
+NBP_BACKOFF_MAX = float(os.getenv("NBP_BACKOFF_MAX", "10"))
+NBP_CACHE_ONLY = os.getenv("NBP_CACHE_ONLY", "false").lower() == "true"
+
+
+class NBPClientError(Exception):
+    """
+    Błąd komunikacji z API NBP, który nie ustąpił po ponowieniach.
+    """
+
+
+class NBPClient:
+    """
+    Asynchroniczny klient API NBP ze współdzieloną pulą połączeń keep-alive.
+
+    Błędy przejściowe (5xx, 429, przekroczenie czasu, zerwane połączenie, niepoprawny JSON
+    w odpowiedzi 200) są ponawiane z wykładniczym opóźnieniem i losowym rozrzutem (full jitter).
+    Odpowiedź 404 oznacza w API NBP brak tabeli i jest zwracana jako pusta lista.
+
+    Z podanym katalogiem `cache_dir` odpowiedzi (także 404) są zapisywane w dyskowym cache
+    i z niego obsługiwane (odczyt i zapis plików w puli wątków, poza pętlą zdarzeń);
+    w trybie `cache_only` klient w ogóle nie łączy się z NBP.
+    """
+
+    def __init__(
+        self,
+        base_url: str = NBP_API_URL,
+        connect_timeout: float = NBP_CONNECT_TIMEOUT,
+        read_timeout: float = NBP_READ_TIMEOUT,
+        max_connections: int = NBP_MAX_CONNECTIONS,
+        max_keepalive_connections: int = NBP_MAX_KEEPALIVE_CONNECTIONS,
+        max_retries: int = NBP_MAX_RETRIES,
+        backoff_base: float = NBP_BACKOFF_BASE,
+        backoff_max: float = NBP_BACKOFF_MAX,
+        cache_dir: str = NBP_CACHE_DIR,
+        cache_only: bool = NBP_CACHE_ONLY
+    ):
+        self.cache = NBPResponseCache(cache_dir) if cache_dir else None
+        self.cache_only = cache_only
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections
+            ),
+            headers={"Accept": "application/json"}
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def get_tables(self, path: str) -> List[Dict[str, Any]]:
+        """
+        Pobiera tabele kursów spod ścieżki względnej wobec adresu bazowego.
+
+        Args:
+            path: Ścieżka, np. "2026-01-30/" lub "2026-01-01/2026-03-31/".
+
+        Returns:
+            Lista tabel z NBP lub pusta lista, jeśli NBP nie opublikował tabeli (404).
+
+        Raises:
+            NBPClientError: Gdy zapytanie nie powiodło się po wszystkich ponowieniach
+                lub, w trybie cache_only, gdy odpowiedzi nie ma w cache.
+        """
+        url = str(self._client.base_url.join(path))
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, url)
+            NBP_CACHE_REQUESTS.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                return cached.tables
+        if self.cache_only:
+            raise NBPClientError(f"{path}: brak odpowiedzi w cache (tryb cache_only)")
+
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = await self._client.get(path, params={"format": "json"})
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                NBP_FETCH_DURATION.observe(time.perf_counter() - started, status=type(e).__name__)
+                error = NBPClientError(f"{path}: {e!r}")
+            else:
+                NBP_FETCH_DURATION.observe(time.perf_counter() - started, status=str(response.status_code))
+                if response.status_code == 404:
+                    if self.cache is not None:
+                        await asyncio.to_thread(self.cache.put, url, 404)
+                    return []
+                if response.status_code < 400:
+                    try:
+                        tables = response.json()
+                    except ValueError as e:
+                        # Ucięta lub niepoprawna treść odpowiedzi jest traktowana jak błąd przejściowy.
+                        error = NBPClientError(f"{path}: niepoprawna odpowiedź JSON: {e}")
+                    else:
+                        if self.cache is not None:
+                            await asyncio.to_thread(self.cache.put, url, 200, tables)
+                        return tables
+                else:
+                    error = NBPClientError(f"{path}: HTTP {response.status_code}")
+                    if response.status_code < 500 and response.status_code != 429:
+                        raise error
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt))
+
+        raise error
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+_client: Optional[NBPClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_nbp_client() -> NBPClient:
+    """
+    Zwraca współdzielonego klienta NBP dla bieżącej pętli zdarzeń.
+    Pula połączeń httpx jest związana z pętlą, więc nowa pętla dostaje nowego klienta.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = NBPClient()
+        _client_loop = loop
+    return _client
+
+
+async def close_nbp_client() -> None:
+    """
+    Zamyka współdzielonego klienta NBP (wywoływane przy zamykaniu aplikacji).
+    """
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
@@ -1,119 +1,694 @@
-from datetime import date, datetime
-from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from collections import deque
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
 
-import requests
-from models import Currency, Rate
+from analytics import analytics_store
+from cache_invalidation import notify_rates_changed
+from metrics import NBP_ROWS_ADDED
+from models import Currency, LatestRate, Rate, RatesVersion, TableCalendar
+from nbp_cache import NBP_CACHE_DIR, NBPResponseCache, url_dates
+from nbp_client import NBPClient, get_nbp_client
+from rate_cache import rate_cache
+from rate_snapshot import SnapshotUpdate, rebuild_snapshot, select_snapshot_rows, snapshot_store, write_snapshot
+from sqlalchemy import Row, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.orm import Session
 
-NBP_API_URL = "https://api.nbp.pl/api/exchangerates/tables/a/"
+logger = logging.getLogger(__name__)
 
-def fetch_exchange_rates(target_date: Optional[date] = None) -> List[Dict[str, Any]]:
+NBP_MAX_RANGE_DAYS = 93
+NBP_FIRST_TABLE_DATE = date(2002, 1, 2)
+SAVE_CHUNK_SIZE = int(os.getenv("SAVE_CHUNK_SIZE", "5000"))
+# Liczba dni, z których kursy są czytane jednym zapytaniem przy aktualizacji migawki i analityki po zapisie.
+ADDED_RATES_DATES_PER_QUERY = int(os.getenv("ADDED_RATES_DATES_PER_QUERY", "64"))
+
+async def fetch_exchange_rates(target_date: Optional[date] = None, client: Optional[NBPClient] = None) -> List[Dict[str, Any]]:
     """
     Pobiera kursy walut z API NBP (Tabela A).
 
     Args:
         target_date: Opcjonalna data, dla której mają zostać pobrane kursy. Jeśli None, pobiera aktualną tabelę.
+        client: Opcjonalny klient NBP. Domyślnie używany jest współdzielony klient z pulą połączeń.
 
     Returns:
-        Lista słowników zawierająca dane z NBP lub pusta lista w przypadku błędu.
+        Lista słowników zawierająca dane z NBP lub pusta lista, jeśli NBP nie opublikował tabeli.
+
+    Raises:
+        NBPClientError: Gdy NBP nie odpowiedział poprawnie mimo ponowień.
     """
-    url = NBP_API_URL
-    if target_date:
-        url += f"{target_date.strftime('%Y-%m-%d')}/"
+    path = f"{target_date.strftime('%Y-%m-%d')}/" if target_date else ""
+    return await (client or get_nbp_client()).get_tables(path)
+
+async def fetch_exchange_rates_range(start: date, end: date, client: Optional[NBPClient] = None) -> List[Dict[str, Any]]:
+    """
+    Pobiera wszystkie tabele A opublikowane w przedziale dat (maksymalnie 93 dni).
+
+    Args:
+        start: Pierwszy dzień przedziału.
+        end: Ostatni dzień przedziału (włącznie).
+        client: Opcjonalny klient NBP. Domyślnie używany jest współdzielony klient z pulą połączeń.
 
-    url += "?format=json"
+    Returns:
+        Lista tabel z NBP lub pusta lista, jeśli w przedziale nie opublikowano żadnej tabeli.
 
+    Raises:
+        NBPClientError: Gdy NBP nie odpowiedział poprawnie mimo ponowień.
+    """
+    path = f"{start.strftime('%Y-%m-%d')}/{end.strftime('%Y-%m-%d')}/"
+    return await (client or get_nbp_client()).get_tables(path)
+
+class RateRecord(NamedTuple):
+    """
+    Pojedynczy kurs ze znormalizowanej odpowiedzi NBP. Kody i nazwy walut są internowane,
+    więc wszystkie rekordy danej waluty współdzielą te same obiekty napisów.
+    """
+    date: date
+    code: str
+    name: str
+    rate: float
+
+def _effective_date(table: Dict[str, Any]) -> Optional[date]:
+    effective_date_str = table.get("effectiveDate")
+    if not isinstance(effective_date_str, str):
+        return None
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Błąd podczas pobierania danych z NBP: {e}")
-        return []
+        return datetime.strptime(effective_date_str, "%Y-%m-%d").date()
+    except ValueError:
+        return None
 
-def normalize_data(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def normalize_data(data: List[Dict[str, Any]]) -> Iterator[RateRecord]:
     """
     Normalizuje dane z odpowiedzi API NBP do płaskiej struktury.
 
+    Rekordy są generowane leniwie, więc nawet wieloletnia odpowiedź nie jest kopiowana w całości.
+
     Args:
         data: Surowe dane JSON z API NBP.
 
     Returns:
-        Lista słowników ze znormalizowanymi danymi kursów.
+        Generator rekordów RateRecord ze znormalizowanymi danymi kursów.
     """
-    normalized_rates = []
-    if not data:
-        return normalized_rates
+    currencies: Dict[Any, Tuple[str, str]] = {}
 
-    for table in data:
-        effective_date_str = table.get("effectiveDate")
-        if not isinstance(effective_date_str, str):
+    for table in data or []:
+        effective_date = _effective_date(table)
+        if effective_date is None:
             continue
 
+        for item in table.get("rates", []):
+            code = item.get("code")
+            currency = currencies.get(code)
+            if currency is None:
+                name = item.get("currency")
+                currency = currencies[code] = (
+                    sys.intern(code) if isinstance(code, str) else code,
+                    sys.intern(name) if isinstance(name, str) else name
+                )
+            yield RateRecord(effective_date, currency[0], currency[1], item.get("mid"))
+
+def _insert(db: Session, table):
+    """
+    Zwraca konstrukcję INSERT właściwą dla dialektu bazy (obsługującą ON CONFLICT).
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+def _bump_rates_version(db: Session, added_count: int) -> int:
+    """
+    Zwiększa licznik zapisów tabeli rates (RatesVersion) o liczbę dodanych kursów i zwraca jego nową wartość.
+    Wiersz licznika jest blokowany do końca transakcji, więc równoległe zapisy otrzymują kolejne wersje.
+    """
+    table = RatesVersion.__table__
+    return db.execute(
+        _insert(db, table)
+        .values(id=1, version=added_count)
+        .on_conflict_do_update(index_elements=["id"], set_={"version": table.c.version + added_count})
+        .returning(table.c.version)
+    ).scalar_one()
+
+def _update_latest_rates(db: Session, added_rows: Sequence[Row]) -> None:
+    """
+    Przenosi do tabeli latest_rates nowo dodane kursy, jeśli są nowsze od zapisanych tam dla danej waluty.
+    """
+    newest: Dict[int, Any] = {}
+    for row in added_rows:
+        current = newest.get(row.currency_id)
+        if current is None or row.date > current.date:
+            newest[row.currency_id] = row
+    if not newest:
+        return
+
+    latest_table = LatestRate.__table__
+    statement = _insert(db, latest_table)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["currency_id"],
+            set_={"date": statement.excluded.date, "rate": statement.excluded.rate},
+            where=statement.excluded.date > latest_table.c.date
+        ),
+        [{"currency_id": row.currency_id, "date": row.date, "rate": row.rate} for row in newest.values()]
+    )
+
+# Lata, dla których partycja tabeli rates na pewno istnieje (po zatwierdzeniu transakcji, która ją utworzyła).
+_rate_partition_years: Set[int] = set()
+
+def _ensure_rate_partitions(db: Session, dates: Iterable[date]) -> Set[int]:
+    """
+    W Postgresie tworzy brakujące roczne partycje tabeli rates dla podanych dat
+    (funkcją ensure_rates_partition z migracji). Zwraca lata sprawdzone w tej transakcji.
+    Na innych bazach oraz gdy tabela nie jest partycjonowana nic nie robi.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return set()
+    years = {d.year for d in dates} - _rate_partition_years
+    if not years or db.execute(text("SELECT to_regproc('ensure_rates_partition')")).scalar() is None:
+        return set()
+    for year in sorted(years):
+        db.execute(text("SELECT ensure_rates_partition(:year)"), {"year": year})
+    return years
+
+def _added_rates_query(dates: Sequence[date]):
+    return (
+        select(Rate.date, Currency.code, Currency.name, Rate.rate)
+        .join(Currency, Rate.currency_id == Currency.id)
+        .where(Rate.date.in_(dates))
+        .order_by(Rate.date)
+    )
+
+class _SavedRates(NamedTuple):
+    """
+    Wynik zatwierdzonej transakcji save_rates, potrzebny do aktualizacji migawki, analityki i cache.
+    """
+    added_count: int
+    added_dates: Set[date]
+    new_currencies: bool
+    version: Optional[int]
+
+class _SavedRatesUpdate:
+    """
+    Aktualizacja migawki mmap i analityki po zatwierdzeniu save_rates.
+
+    Zapis nie przechowuje dodanych kursów — tylko daty, w których przybyły. Kursy z tych dat są
+    po zatwierdzeniu czytane z bazy porcjami po ADDED_RATES_DATES_PER_QUERY dni (date_batches + add),
+    więc zużycie pamięci nie rośnie z rozmiarem zapisu. Migawka, do której nie da się dopisać kursów
+    (nie istnieje albo nie odpowiada wersji `version` z transakcji zapisu), jest przebudowywana
+    z bazy (needs_rebuild). Błąd migawki nie wycofuje zapisu — dane są już w bazie, a plik migawki
+    jest usuwany, żeby odczyty wróciły do bazy danych zamiast do nieaktualnej kopii.
+    """
+
+    def __init__(self, saved: _SavedRates):
+        self.path = snapshot_store.path
+        self._snapshot: Optional[SnapshotUpdate] = None
+        self._rebuild = False
+        self._dates = sorted(saved.added_dates)
+        self._extend_analytics = bool(self._dates) and analytics_store.is_loaded()
+        if self._dates and not self._extend_analytics:
+            # Odrzuca analitykę budowaną równolegle z danych sprzed zapisu.
+            analytics_store.invalidate()
+        if saved.version is None or not self.path:
+            return
         try:
-            effective_date = datetime.strptime(effective_date_str, "%Y-%m-%d").date()
-        except ValueError:
-            continue
+            update = SnapshotUpdate(self.path, saved.added_count, saved.version)
+        except Exception as e:
+            _discard_snapshot(self.path, e)
+            return
+        if update.applicable:
+            self._snapshot = update
+        else:
+            self._rebuild = not update.current
 
-        for item in table.get("rates", []):
-            normalized_rates.append({
-                "date": effective_date,
-                "code": item.get("code"),
-                "name": item.get("currency"),
-                "rate": item.get("mid")
-            })
+    def date_batches(self) -> List[List[date]]:
+        if self._snapshot is None and not self._extend_analytics:
+            return []
+        return [
+            self._dates[i:i + ADDED_RATES_DATES_PER_QUERY]
+            for i in range(0, len(self._dates), ADDED_RATES_DATES_PER_QUERY)
+        ]
 
-    return normalized_rates
+    def add(self, rows: Sequence[Row]) -> None:
+        if self._snapshot is not None:
+            try:
+                self._snapshot.add(rows)
+            except Exception as e:
+                _discard_snapshot(self.path, e)
+                self._snapshot = None
+        if self._extend_analytics:
+            analytics_store.extend([(row.date, row.code, row.rate) for row in rows])
 
-def save_rates(db: Session, rates_data: List[Dict[str, Any]]) -> int:
+    def needs_rebuild(self) -> bool:
+        """
+        Zapisuje dopisaną migawkę; zwraca True, gdy migawkę trzeba zamiast tego przebudować z bazy.
+        """
+        if self._snapshot is None:
+            return self._rebuild
+        try:
+            return not self._snapshot.commit()
+        except Exception as e:
+            _discard_snapshot(self.path, e)
+            return False
+
+def _discard_snapshot(path: str, error: Exception) -> None:
+    logger.error("Błąd podczas aktualizacji migawki kursów %s: %s", path, error, exc_info=error)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error("Nie udało się usunąć nieaktualnej migawki kursów %s: %s", path, e)
+
+def save_rates(db: Session, rates_data: Iterable[RateRecord], chunk_size: int = SAVE_CHUNK_SIZE) -> int:
     """
-    Zapisuje znormalizowane kursy do bazy danych.
-    Tworzy walutę (Currency), jeśli nie istnieje.
-    Tworzy kurs (Rate), jeśli nie istnieje dla danej daty/waluty.
+    Zapisuje znormalizowane kursy do bazy danych zbiorczymi instrukcjami INSERT ... ON CONFLICT DO NOTHING.
+    Rekordy są pobierane z `rates_data` porcjami po `chunk_size`, więc zużycie pamięci zależy od rozmiaru porcji,
+    a nie całej odpowiedzi. Brakujące waluty (Currency) i kursy (Rate) są dodawane w stałej liczbie zapytań na porcję.
+    Istniejące kursy dla danej daty/waluty są pomijane.
+    Daty z partii są oznaczane w kalendarzu tabel (TableCalendar) jako opublikowane,
+    a najnowsze kursy walut trafiają do tabeli podsumowania LatestRate.
+    W Postgresie przed wstawieniem tworzone są brakujące roczne partycje tabeli rates.
+    Całość jest zatwierdzana jedną transakcją, razem z powiadomieniem NOTIFY dla cache innych procesów. Po jej zatwierdzeniu aktualizuje migawkę kursów
+    (jeśli jest włączona; wersję tabeli rates wyznacza licznik RatesVersion zwiększany w tej samej transakcji) i dopisuje nowe dni do analityki kursów,
+    czytając kursy z dat, w których przybyły, porcjami z bazy (zob. _SavedRatesUpdate), a następnie unieważnia cache tabel
+    dla dat, w których przybyły kursy.
 
     Args:
         db: Sesja bazy danych.
-        rates_data: Lista słowników ze znormalizowanymi danymi kursów.
+        rates_data: Rekordy (np. generator z normalize_data) ze znormalizowanymi danymi kursów.
+        chunk_size: Liczba rekordów zapisywanych jedną porcją instrukcji.
 
     Returns:
         Liczba dodanych nowych kursów.
     """
+    saved = _insert_rates(db, rates_data, chunk_size)
+    update = _SavedRatesUpdate(saved)
+    for dates in update.date_batches():
+        update.add(db.execute(_added_rates_query(dates)).all())
+    if update.needs_rebuild():
+        try:
+            rebuild_snapshot(db.get_bind(), update.path)
+        except Exception as e:
+            _discard_snapshot(update.path, e)
+    _invalidate_saved_rates(saved)
+    return saved.added_count
+
+def _insert_rates(db: Session, rates_data: Iterable[RateRecord], chunk_size: int) -> _SavedRates:
+    """
+    Transakcyjna część save_rates: zapis walut, kursów, kalendarza tabel i LatestRate oraz NOTIFY i commit.
+    """
+    records = iter(rates_data)
+    rates_table = Rate.__table__
+    currency_ids: Dict[str, int] = {}
+    new_currencies = False
     added_count = 0
+    added_dates = set()
+    partition_years: Set[int] = set()
+    version: Optional[int] = None
+
+    try:
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+
+            missing = {}
+            for record in chunk:
+                if record.code not in currency_ids:
+                    missing.setdefault(record.code, record.name)
+            if missing:
+                new_currencies |= bool(db.execute(
+                    _insert(db, Currency.__table__)
+                    .on_conflict_do_nothing(index_elements=["code"])
+                    .returning(Currency.__table__.c.id),
+                    [{"code": code, "name": name} for code, name in missing.items()]
+                ).all())
+                currency_ids.update(db.execute(select(Currency.code, Currency.id).where(Currency.code.in_(missing))).all())
+
+            rate_rows: Dict[Tuple[int, date], Dict[str, Any]] = {}
+            for record in chunk:
+                currency_id = currency_ids[record.code]
+                rate_rows.setdefault((currency_id, record.date), {
+                    "currency_id": currency_id,
+                    "date": record.date,
+                    "rate": record.rate
+                })
 
-    existing_currencies = {c.code: c for c in db.query(Currency).all()}
-
-    for item in rates_data:
-        code = item["code"]
-        name = item["name"]
-        rate_value = item["rate"]
-        rate_date = item["date"]
-
-        currency = existing_currencies.get(code)
-        if not currency:
-            currency = Currency(code=code, name=name)
-            db.add(currency)
-            db.flush()
-            existing_currencies[code] = currency
-
-        existing_rate = db.query(Rate).filter(
-            Rate.currency_id == currency.id,
-            Rate.date == rate_date
-        ).first()
-
-        if not existing_rate:
-            new_rate = Rate(
-                currency_id=currency.id,
-                date=rate_date,
-                rate=rate_value
+            partition_years |= _ensure_rate_partitions(db, {rate_date for _, rate_date in rate_rows})
+            added_rows = db.execute(
+                _insert(db, rates_table)
+                .on_conflict_do_nothing(index_elements=["currency_id", "date"])
+                .returning(rates_table.c.currency_id, rates_table.c.date, rates_table.c.rate),
+                list(rate_rows.values())
+            ).all()
+
+            _update_latest_rates(db, added_rows)
+
+            db.execute(
+                _insert(db, TableCalendar.__table__)
+                .on_conflict_do_update(index_elements=["date"], set_={"has_table": True, "checked_at": func.now()}),
+                [{"date": rate_date, "has_table": True} for rate_date in {record.date for record in chunk}]
             )
-            db.add(new_rate)
-            added_count += 1
 
-    try:
+            added_count += len(added_rows)
+            added_dates.update(row.date for row in added_rows)
+
+        if not currency_ids:
+            return _SavedRates(0, set(), False, None)
+        if added_dates or new_currencies:
+            notify_rates_changed(db, added_dates, new_currencies)
+        if added_count:
+            version = _bump_rates_version(db, added_count)
         db.commit()
     except Exception as e:
         db.rollback()
-        print(f"Błąd podczas zapisu do bazy danych: {e}")
+        logger.error("Błąd podczas zapisu do bazy danych: %s", e)
         raise e
 
+    _rate_partition_years.update(partition_years)
+    return _SavedRates(added_count, added_dates, new_currencies, version)
+
+def _invalidate_saved_rates(saved: _SavedRates) -> None:
+    """
+    Unieważnia cache tabel dla dat, w których przybyły kursy (oraz najnowsze kursy i listę walut).
+    """
+    rate_cache.invalidate_dates(saved.added_dates)
+    if saved.added_dates:
+        rate_cache.invalidate_latest()
+    if saved.new_currencies:
+        rate_cache.invalidate_currencies()
+
+async def save_rates_async(db: AsyncSession, rates_data: Iterable[RateRecord], chunk_size: int = SAVE_CHUNK_SIZE) -> int:
+    """
+    Asynchroniczny odpowiednik save_rates dla sesji AsyncSession.
+    Wykonuje tę samą transakcję zapisu (AsyncSession.run_sync), ale instrukcje idą przez asynchroniczny
+    sterownik bazy, więc oczekiwanie na bazę nie blokuje pętli zdarzeń ani nie zajmuje wątku.
+    Praca obliczeniowa po zatwierdzeniu (aktualizacja migawki, dopisanie dni do analityki)
+    jest wykonywana w puli wątków (asyncio.to_thread), a nie w pętli zdarzeń.
+
+    Args:
+        db: Asynchroniczna sesja bazy danych.
+        rates_data: Rekordy ze znormalizowanymi danymi kursów.
+        chunk_size: Liczba rekordów zapisywanych jedną porcją instrukcji.
+
+    Returns:
+        Liczba dodanych nowych kursów.
+    """
+    saved = await db.run_sync(_insert_rates, rates_data, chunk_size)
+    update = await asyncio.to_thread(_SavedRatesUpdate, saved)
+    for dates in update.date_batches():
+        rows = (await db.execute(_added_rates_query(dates))).all()
+        await asyncio.to_thread(update.add, rows)
+    if await asyncio.to_thread(update.needs_rebuild):
+        try:
+            version, rows = await db.run_sync(select_snapshot_rows)
+            await asyncio.to_thread(write_snapshot, update.path, version, rows)
+        except Exception as e:
+            _discard_snapshot(update.path, e)
+    _invalidate_saved_rates(saved)
+    return saved.added_count
+
+def mark_dates_without_table(db: Session, dates: Iterable[date]) -> None:
+    """
+    Zapisuje w kalendarzu tabel daty, dla których NBP potwierdził brak tabeli (weekendy, święta).
+    Pomijane są daty od dzisiaj wzwyż, bo dzisiejsza tabela może zostać jeszcze opublikowana.
+    Istniejące wpisy (w szczególności pozytywne) nie są nadpisywane.
+
+    Args:
+        db: Sesja bazy danych.
+        dates: Daty bez opublikowanej tabeli.
+    """
+    today = date.today()
+    rows = [{"date": missing_date, "has_table": False} for missing_date in set(dates) if missing_date < today]
+    if not rows:
+        return
+
+    db.execute(_insert(db, TableCalendar.__table__).on_conflict_do_nothing(index_elements=["date"]), rows)
+    db.commit()
+
+def is_date_without_table(db: Session, target_date: date) -> bool:
+    """
+    Sprawdza, czy kalendarz tabel zawiera potwierdzenie, że NBP nie opublikował tabeli w danym dniu.
+    """
+    has_table = db.execute(select(TableCalendar.has_table).where(TableCalendar.date == target_date)).scalar()
+    return has_table is False
+
+def resolve_table_date(db: Session, target_date: date) -> Optional[date]:
+    """
+    Zwraca datę najnowszej tabeli opublikowanej w danym dniu lub przed nim
+    (jedno zapytanie po kluczu głównym kalendarza tabel).
+    """
+    return db.execute(
+        select(TableCalendar.date)
+        .where(TableCalendar.has_table.is_(True), TableCalendar.date <= target_date)
+        .order_by(TableCalendar.date.desc())
+        .limit(1)
+    ).scalar()
+
+async def fetch_and_save_rates(
+    bind: Union[Engine, Connection, AsyncEngine],
+    target_date: Optional[date] = None,
+    client: Optional[NBPClient] = None
+) -> Tuple[int, int]:
+    """
+    Pobiera tabelę z NBP i zapisuje ją we własnej sesji bazy danych.
+
+    Sesja jest tworzona na podstawie `bind`, a nie przekazywana z zewnątrz, ponieważ wynik
+    może być współdzielony przez wiele żądań (single-flight) i przeżyć żądanie, które go zleciło.
+    Dla silnika asynchronicznego zapis odbywa się w AsyncSession, dla synchronicznego w puli wątków.
+    Brak tabeli dla daty z przeszłości zostaje zapisany w kalendarzu tabel.
+
+    Args:
+        bind: Silnik (synchroniczny lub asynchroniczny) albo połączenie bazy danych.
+        target_date: Opcjonalna data. Jeśli None, pobiera aktualną tabelę.
+        client: Opcjonalny klient NBP. Domyślnie używany jest współdzielony klient z pulą połączeń.
+
+    Returns:
+        Krotka (liczba pobranych tabel, liczba dodanych kursów).
+
+    Raises:
+        NBPClientError: Gdy NBP nie odpowiedział poprawnie mimo ponowień.
+    """
+    raw_data = await fetch_exchange_rates(target_date, client=client)
+
+    def save(db: Session) -> int:
+        if not raw_data:
+            if target_date:
+                mark_dates_without_table(db, [target_date])
+            return 0
+        return save_rates(db, normalize_data(raw_data))
+
+    if isinstance(bind, AsyncEngine):
+        async with AsyncSession(bind=bind, autoflush=False) as db:
+            if raw_data:
+                added_count = await save_rates_async(db, normalize_data(raw_data))
+            else:
+                added_count = await db.run_sync(save)
+    else:
+        def save_in_thread() -> int:
+            with Session(bind=bind, autoflush=False) as db:
+                return save(db)
+
+        added_count = await asyncio.to_thread(save_in_thread)
+    NBP_ROWS_ADDED.observe(added_count, kind="fetch")
+    return len(raw_data), added_count
+
+def split_date_range(start: date, end: date, max_days: int = NBP_MAX_RANGE_DAYS) -> List[Tuple[date, date]]:
+    """
+    Dzieli przedział dat na kolejne okna akceptowane przez API NBP (domyślnie do 93 dni).
+
+    Args:
+        start: Pierwszy dzień przedziału.
+        end: Ostatni dzień przedziału (włącznie).
+        max_days: Maksymalna liczba dni w jednym oknie.
+
+    Returns:
+        Lista par (początek, koniec) pokrywających cały przedział.
+    """
+    windows = []
+    window_start = start
+    while window_start <= end:
+        window_end = min(window_start + timedelta(days=max_days - 1), end)
+        windows.append((window_start, window_end))
+        window_start = window_end + timedelta(days=1)
+    return windows
+
+class Checkpoint(NamedTuple):
+    """
+    Punkt kontrolny backfillu: przedział zlecenia i ostatni dzień ciągłego, zapisanego prefiksu [start, completed_through].
+    """
+    start: date
+    end: date
+    completed_through: date
+
+def _read_checkpoint(path: str) -> Optional[Checkpoint]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if "from" not in data:
+        # Dawny format bez przedziału: nie wiadomo, którego zlecenia dotyczy, więc jest pomijany.
+        return None
+    return Checkpoint(
+        date.fromisoformat(data["from"]), date.fromisoformat(data["to"]), date.fromisoformat(data["completed_through"])
+    )
+
+def _write_checkpoint(path: str, checkpoint: Checkpoint) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "from": checkpoint.start.isoformat(),
+            "to": checkpoint.end.isoformat(),
+            "completed_through": checkpoint.completed_through.isoformat()
+        }, f)
+    os.replace(tmp_path, path)
+
+async def backfill(
+    db: Session,
+    start: date,
+    end: date,
+    concurrency: int = 4,
+    checkpoint_path: Optional[str] = None,
+    client: Optional[NBPClient] = None,
+    on_progress: Optional[Callable[[date, int, int], None]] = None
+) -> int:
+    """
+    Ładuje historyczne kursy z przedziału dat, okno po oknie.
+
+    Okna są pobierane równolegle przez współdzielonego klienta NBP (najwyżej `concurrency` jednocześnie),
+    a zapisywane do bazy po kolei w osobnym wątku, dzięki czemu punkt kontrolny zawsze oznacza ciągły, zapisany prefiks.
+    Dni okna bez tabeli trafiają do kalendarza tabel jako wpisy negatywne.
+    Punkt kontrolny zapisuje przedział zlecenia i koniec zapisanego prefiksu. Ponowne uruchomienie z tym samym plikiem
+    wznawia pracę od pierwszego niezapisanego okna tylko wtedy, gdy początek przedziału mieści się w zapisanym prefiksie;
+    inny przedział (np. wcześniejszy) jest ładowany od początku, a punkt kontrolny zostaje nadpisany.
+
+    Args:
+        db: Sesja bazy danych.
+        start: Pierwszy dzień przedziału.
+        end: Ostatni dzień przedziału (włącznie).
+        concurrency: Maksymalna liczba równoczesnych zapytań do NBP.
+        checkpoint_path: Opcjonalna ścieżka pliku z punktem kontrolnym.
+        client: Opcjonalny klient NBP. Domyślnie używany jest współdzielony klient z pulą połączeń.
+        on_progress: Opcjonalna funkcja wywoływana (w wątku) po zapisaniu każdego okna
+            z ostatnim dniem okna, liczbą pobranych tabel i liczbą dodanych kursów.
+
+    Returns:
+        Liczba dodanych nowych kursów.
+    """
+    covered_from = start
+    if checkpoint_path:
+        checkpoint = _read_checkpoint(checkpoint_path)
+        if checkpoint and checkpoint.start <= start <= checkpoint.completed_through:
+            covered_from = checkpoint.start
+            start = checkpoint.completed_through + timedelta(days=1)
+
+    windows = deque(split_date_range(start, end))
+    added_count = 0
+
+    pending = deque()
+    try:
+        while windows or pending:
+            while windows and len(pending) < concurrency:
+                window = windows.popleft()
+                pending.append((window, asyncio.ensure_future(fetch_exchange_rates_range(*window, client=client))))
+
+            (window_start, window_end), task = pending.popleft()
+            raw_data = await task
+            added = await asyncio.to_thread(save_rates, db, normalize_data(raw_data))
+            added_count += added
+
+            published_dates = {_effective_date(table) for table in raw_data}
+            window_dates = (window_start + timedelta(days=offset) for offset in range((window_end - window_start).days + 1))
+            await asyncio.to_thread(mark_dates_without_table, db, [d for d in window_dates if d not in published_dates])
+            logger.info("%s - %s: dodano %d kursów", window_start, window_end, added)
+
+            if checkpoint_path:
+                _write_checkpoint(checkpoint_path, Checkpoint(covered_from, end, window_end))
+            if on_progress:
+                await asyncio.to_thread(on_progress, window_end, len(raw_data), added)
+    finally:
+        for _, task in pending:
+            task.cancel()
+
+    NBP_ROWS_ADDED.observe(added_count, kind="backfill")
+    return added_count
+
+def rebuild_from_cache(db: Session, cache: NBPResponseCache) -> int:
+    """
+    Odtwarza kursy i kalendarz tabel wyłącznie z dyskowego cache odpowiedzi NBP, bez połączenia z siecią.
+    Dni z zapisanych zapytań o datę lub zakres, dla których NBP nie zwrócił tabeli, trafiają
+    do kalendarza tabel jako wpisy negatywne.
+
+    Args:
+        db: Sesja bazy danych.
+        cache: Cache odpowiedzi NBP.
+
+    Returns:
+        Liczba dodanych nowych kursów.
+    """
+    added_count = 0
+    for entry in cache.entries():
+        added_count += save_rates(db, normalize_data(entry.tables))
+
+        dates = url_dates(entry.url)
+        if dates:
+            published_dates = {_effective_date(table) for table in entry.tables}
+            first, last = min(dates), max(dates)
+            window_dates = (first + timedelta(days=offset) for offset in range((last - first).days + 1))
+            mark_dates_without_table(db, [d for d in window_dates if d not in published_dates])
     return added_count
+
+def _parse_cli_date(value: str) -> date:
+    if value == "today":
+        return date.today()
+    return date.fromisoformat(value)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m nbp_service", description="Narzędzia synchronizacji kursów NBP.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_parser = subparsers.add_parser("backfill", help="Ładuje historyczne kursy z przedziału dat.")
+    backfill_parser.add_argument("--from", dest="start", type=_parse_cli_date, default=NBP_FIRST_TABLE_DATE)
+    backfill_parser.add_argument("--to", dest="end", type=_parse_cli_date, default=date.today())
+    backfill_parser.add_argument("--concurrency", type=int, default=4)
+    backfill_parser.add_argument("--checkpoint", default=".nbp_backfill_checkpoint.json")
+    backfill_parser.add_argument("--cache-dir", default=NBP_CACHE_DIR, help="Katalog dyskowego cache odpowiedzi NBP.")
+    backfill_parser.add_argument("--cache-only", action="store_true", help="Nie łącz się z NBP, czytaj wyłącznie z cache.")
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="Odtwarza bazę offline z dyskowego cache odpowiedzi NBP.")
+    rebuild_parser.add_argument("--cache-dir", default=NBP_CACHE_DIR or ".nbp_cache")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from database import SessionLocal
+
+    if args.command == "rebuild":
+        with SessionLocal() as db:
+            added_count = rebuild_from_cache(db, NBPResponseCache(args.cache_dir))
+        print(f"Odtworzono bazę z cache {args.cache_dir}. Dodano {added_count} nowych kursów.")
+        return
+
+    async def run() -> int:
+        client = NBPClient(cache_dir=args.cache_dir, cache_only=args.cache_only)
+        try:
+            return await backfill(db, args.start, args.end, args.concurrency, args.checkpoint, client=client)
+        finally:
+            await client.aclose()
+
+    db = SessionLocal()
+    try:
+        added_count = asyncio.run(run())
+    finally:
+        db.close()
+    print(f"Backfill zakończony. Dodano {added_count} nowych kursów.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, Hashable, Iterable, NamedTuple, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson jest opcjonalny
+    orjson = None
+
+RATE_CACHE_SIZE = int(os.getenv("RATE_CACHE_SIZE", "512"))
+# Przez tyle sekund od unieważnienia klucza odczyty z repliki nie trafiają do cache (replika może nie mieć jeszcze zapisu).
+RATE_CACHE_REPLICA_LAG = float(os.getenv("RATE_CACHE_REPLICA_LAG", "5"))
+
+CURRENCIES_KEY = ("currencies",)
+LATEST_KEY = ("latest",)
+LATEST_COLUMNS_KEY = ("latest_columns",)
+
+
+class CachedResponse(NamedTuple):
+    """
+    Zserializowana odpowiedź JSON wraz z jej znacznikiem ETag.
+    Pole empty oznacza odpowiedź bez żadnego kursu (niezależnie od kształtu treści).
+    """
+    body: bytes
+    etag: str
+    empty: bool = False
+
+
+class CacheGeneration(NamedTuple):
+    """
+    Stan unieważnień klucza uchwycony przed odczytem z bazy (epoka czyszczenia cache, licznik
+    unieważnień klucza i chwila ostatniego unieważnienia według time.monotonic).
+    """
+    epoch: int
+    counter: int
+    invalidated_at: float
+
+
+def rates_key(rates_date: date, shape: str = "rows") -> tuple:
+    return ("rates", rates_date) if shape == "rows" else ("rates_columns", rates_date)
+
+
+def dumps(payload: Any) -> bytes:
+    """
+    Serializuje gotowe struktury (dict/list/date/float) do zwartego JSON w UTF-8.
+    Z orjson typy spoza JSON (np. Decimal, modele pydantic) są przekazywane do jsonable_encoder
+    tylko wtedy, gdy faktycznie wystąpią; bez orjson cała treść przechodzi przez jsonable_encoder.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=jsonable_encoder)
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_response(payload: Any, empty: Optional[bool] = None) -> CachedResponse:
+    """
+    Serializuje odpowiedź do JSON i wylicza dla niej silny znacznik ETag (skrót treści).
+    Domyślnie odpowiedź jest pusta, gdy pusty jest sam payload.
+    """
+    body = dumps(payload)
+    return CachedResponse(
+        body=body,
+        etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+        empty=not payload if empty is None else empty
+    )
+
+
+class RateCache:
+    """
+    Ograniczony cache LRU zserializowanych tabel kursów (per data), listy walut
+    oraz obiektów wyliczanych z tabel kursów.
+
+    Wpisy nie wygasają same — opublikowana tabela NBP się nie zmienia — lecz są
+    unieważniane przez save_rates dokładnie dla tych dat, dla których zapisano nowe kursy.
+
+    Każde unieważnienie zwiększa generację klucza. Odczyt z bazy pobiera generację przed zapytaniem
+    (generation) i przekazuje ją do set/put; jeśli w trakcie odczytu klucz unieważniono, wynik
+    (być może sprzed zapisu) nie trafia do cache.
+    """
+
+    def __init__(self, maxsize: int = RATE_CACHE_SIZE, replica_lag: float = RATE_CACHE_REPLICA_LAG):
+        self.maxsize = maxsize
+        self.replica_lag = replica_lag
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        # Generacje per data (klucze postaci (rodzaj, data)) lub per cały klucz: (licznik, chwila unieważnienia).
+        self._generations: Dict[Hashable, Tuple[int, float]] = {}
+        self._counter = 0
+        self._epoch = 0
+        self._cleared_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _scope(key: Hashable) -> Hashable:
+        return key[1] if isinstance(key, tuple) and len(key) == 2 else key
+
+    def _bump(self, scope: Hashable, now: float) -> None:
+        self._counter += 1
+        self._generations[scope] = (self._counter, now)
+
+    def _generation(self, key: Hashable) -> CacheGeneration:
+        counter, invalidated_at = self._generations.get(self._scope(key), (0, 0.0))
+        return CacheGeneration(self._epoch, counter, max(invalidated_at, self._cleared_at))
+
+    def generation(self, key: Hashable) -> CacheGeneration:
+        with self._lock:
+            return self._generation(key)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(
+        self,
+        key: Hashable,
+        payload: Any,
+        empty: Optional[bool] = None,
+        generation: Optional[CacheGeneration] = None,
+        replica: bool = False
+    ) -> CachedResponse:
+        """
+        Serializuje odpowiedź i zapisuje ją w cache (zob. put).
+        Pusta odpowiedź odczytana z repliki nie jest zapisywana — replika mogła jeszcze nie odtworzyć zapisu.
+        """
+        entry = encode_response(payload, empty)
+        if replica and entry.empty:
+            return entry
+        return self.put(key, entry, generation, replica)
+
+    def put(self, key: Hashable, value: Any, generation: Optional[CacheGeneration] = None, replica: bool = False) -> Any:
+        """
+        Zapisuje dowolny obiekt pochodny od tabeli kursów (np. macierz kursów krzyżowych).
+        Klucze postaci (rodzaj, data) są unieważniane razem z tabelą z tej daty.
+        Gdy podano `generation`, a klucz unieważniono po jej pobraniu, wartość nie jest zapisywana.
+        Wartość odczytana z repliki (replica=True) nie jest też zapisywana, gdy klucz unieważniono mniej
+        niż `replica_lag` sekund przed odczytem: replika mogła nie mieć jeszcze zapisu, który wywołał
+        unieważnienie, a po nim nic już tego wpisu nie unieważni.
+        """
+        if replica and (generation is None or time.monotonic() - generation.invalidated_at < self.replica_lag):
+            return value
+        with self._lock:
+            if generation is not None and generation != self._generation(key):
+                return value
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate_dates(self, dates: Iterable[date]) -> None:
+        dates = set(dates)
+        if not dates:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for rates_date in dates:
+                self._bump(rates_date, now)
+            stale = [key for key in self._entries if len(key) == 2 and key[1] in dates]
+            for key in stale:
+                del self._entries[key]
+
+    def invalidate_currencies(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._bump(CURRENCIES_KEY, now)
+            self._entries.pop(CURRENCIES_KEY, None)
+
+    def invalidate_latest(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for key in (LATEST_KEY, LATEST_COLUMNS_KEY):
+                self._bump(key, now)
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._epoch += 1
+            self._cleared_at = time.monotonic()
+            self.hits = 0
+            self.misses = 0
+
+
+rate_cache = RateCache()
@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+from datetime import date
+from typing import Iterator, List, Optional, Union
+
+from models import Currency, Rate
+from sqlalchemy import select
+from sqlalchemy.engine import Connection, Engine
+
+EXPORT_BATCH_SIZE = 5000
+EXPORT_COLUMNS = ("date", "code", "name", "rate")
+
+
+def _export_query(start: Optional[date], end: Optional[date], codes: Optional[List[str]]):
+    query = (
+        select(Rate.date, Currency.code, Currency.name, Rate.rate)
+        .join(Currency, Rate.currency_id == Currency.id)
+        .order_by(Rate.date, Currency.code)
+    )
+    if start:
+        query = query.where(Rate.date >= start)
+    if end:
+        query = query.where(Rate.date <= end)
+    if codes:
+        query = query.where(Currency.code.in_(codes))
+    return query
+
+
+def _csv_chunk(rows, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows((row.date.isoformat(), row.code, row.name, row.rate) for row in rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def _ndjson_chunk(rows) -> bytes:
+    return "".join(
+        json.dumps({"date": row.date.isoformat(), "code": row.code, "name": row.name, "rate": row.rate}, ensure_ascii=False) + "\n"
+        for row in rows
+    ).encode("utf-8")
+
+
+def stream_rates(
+    bind: Union[Engine, Connection],
+    export_format: str = "ndjson",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    codes: Optional[List[str]] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[bytes]:
+    """
+    Generuje eksport kursów (NDJSON lub CSV) porcjami po `batch_size` wierszy.
+
+    Wiersze są czytane kursorem po stronie serwera (stream_results/yield_per), więc
+    zużycie pamięci zależy od rozmiaru porcji, a nie od liczby eksportowanych wierszy.
+    Generator otwiera własne połączenie, ponieważ jest konsumowany już po zamknięciu
+    sesji żądania (StreamingResponse). Zamknięcie generatora (close(), np. po rozłączeniu
+    klienta) zamyka kursor i oddaje połączenie do puli.
+
+    Args:
+        bind: Silnik bazy danych (nie sesja żądania).
+        export_format: "ndjson" lub "csv".
+        start: Opcjonalna data początkowa (włącznie).
+        end: Opcjonalna data końcowa (włącznie).
+        codes: Opcjonalna lista kodów walut.
+        batch_size: Liczba wierszy w jednej porcji.
+    """
+    with bind.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(
+            _export_query(start, end, codes)
+        )
+        try:
+            if export_format == "csv":
+                yield _csv_chunk([], header=True)
+            for rows in result.partitions():
+                yield _csv_chunk(rows) if export_format == "csv" else _ndjson_chunk(rows)
+        finally:
+            result.close()
@@ -0,0 +1,113 @@
+import os
+from datetime import date
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from history import UnknownCurrencyCodeError
+from models import Currency, Rate
+from rate_snapshot import RateSnapshot, snapshot_store
+from sqlalchemy import Row, Select, and_, select
+from sqlalchemy.orm import Session
+
+RATE_MATRIX_MAX_DAYS = int(os.getenv("RATE_MATRIX_MAX_DAYS", "3660"))
+
+
+class RateMatrix(NamedTuple):
+    """
+    Kursy wielu walut z wielu dat: `values[i, j]` to kurs waluty `codes[j]` z dnia `dates[i]` (NaN, gdy brak).
+    """
+    dates: List[date]
+    codes: List[str]
+    values: np.ndarray
+
+
+def _unknown_codes_error(codes: Sequence[str], known: Sequence[str]) -> UnknownCurrencyCodeError:
+    missing = sorted(set(codes) - set(known))
+    return UnknownCurrencyCodeError(f"Nieznane waluty: {', '.join(missing)}")
+
+
+def matrix_from_snapshot(snapshot: RateSnapshot, start: date, end: date, codes: Optional[Sequence[str]]) -> RateMatrix:
+    if codes and not set(codes) <= snapshot.code_index.keys():
+        raise _unknown_codes_error(codes, snapshot.codes)
+
+    first = max(0, start.toordinal() - snapshot.start)
+    last = min(snapshot.matrix.shape[0], end.toordinal() - snapshot.start + 1)
+    block = np.asarray(snapshot.matrix[first:max(first, last)])
+    if codes:
+        block = block[:, [snapshot.code_index[code] for code in codes]]
+        selected = list(codes)
+    else:
+        present = ~np.isnan(block).all(axis=0)
+        block = block[:, present]
+        selected = [code for code, keep in zip(snapshot.codes, present) if keep]
+
+    published = np.flatnonzero(~np.isnan(block).all(axis=1))
+    dates = [date.fromordinal(snapshot.start + first + int(row)) for row in published]
+    return RateMatrix(dates, selected, block[published])
+
+
+def rate_matrix_query(start: date, end: date, codes: Optional[Sequence[str]]) -> Select:
+    """
+    Jedno zapytanie zwracające wiersze (kod, data, kurs) dla matrix_from_rows. Złączenie zewnętrzne
+    od tabeli walut zwraca też wybrane waluty bez kursów w przedziale (z datą NULL), więc nieznane kody
+    można rozpoznać bez osobnego zapytania o waluty.
+    """
+    query = select(Currency.code, Rate.date, Rate.rate).select_from(Currency).outerjoin(
+        Rate, and_(Rate.currency_id == Currency.id, Rate.date >= start, Rate.date <= end)
+    )
+    if codes:
+        query = query.where(Currency.code.in_(codes))
+    return query
+
+
+def matrix_from_rows(rows: Sequence[Row], codes: Optional[Sequence[str]]) -> RateMatrix:
+    """
+    Układa wiersze z rate_matrix_query w macierz [daty x waluty] (bez dostępu do bazy).
+
+    Raises:
+        UnknownCurrencyCodeError: Gdy któraś z podanych walut nie istnieje.
+    """
+    if codes:
+        known = {row.code for row in rows}
+        if len(known) < len(set(codes)):
+            raise _unknown_codes_error(codes, list(known))
+    rows = [row for row in rows if row.date is not None]
+
+    dates = sorted({row.date for row in rows})
+    selected = list(codes) if codes else sorted({row.code for row in rows})
+    values = np.full((len(dates), len(selected)), np.nan)
+    if rows:
+        row_of = {rate_date: i for i, rate_date in enumerate(dates)}
+        column_of = {code: j for j, code in enumerate(selected)}
+        values[
+            np.array([row_of[row.date] for row in rows]),
+            np.array([column_of[row.code] for row in rows])
+        ] = np.array([row.rate for row in rows], dtype=np.float64)
+    return RateMatrix(dates, selected, values)
+
+
+def get_rate_matrix(db: Session, start: date, end: date, codes: Optional[Sequence[str]] = None) -> RateMatrix:
+    """
+    Zwraca kursy wybranych walut z przedziału dat w postaci macierzy [daty x waluty].
+
+    Oś dat obejmuje tylko dni, w których któraś z walut ma kurs (dni z tabelą NBP).
+    Bez listy kodów zwracane są wszystkie waluty notowane w przedziale, posortowane po kodzie;
+    z listą — dokładnie podane waluty w podanej kolejności.
+    Gdy dostępna jest migawka mmap, macierz jest jej wycinkiem, bez zapytań do bazy.
+
+    Args:
+        db: Sesja bazy danych.
+        start: Data początkowa (włącznie).
+        end: Data końcowa (włącznie).
+        codes: Opcjonalna lista kodów walut (wielkie litery, bez powtórzeń).
+
+    Returns:
+        Macierz kursów (RateMatrix).
+
+    Raises:
+        UnknownCurrencyCodeError: Gdy któraś z podanych walut nie istnieje.
+    """
+    snapshot = snapshot_store.get(db)
+    if snapshot is not None:
+        return matrix_from_snapshot(snapshot, start, end, codes)
+    return matrix_from_rows(db.execute(rate_matrix_query(start, end, codes)).all(), codes)
@@ -0,0 +1,404 @@
+import argparse
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+from models import Currency, Rate, RatesVersion
+from sqlalchemy import Row, Select, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+RATE_SNAPSHOT_PATH = os.getenv("RATE_SNAPSHOT_PATH", "")
+# Najdłuższy czas [s], przez który proces ufa migawce bez ponownego porównania jej wersji z bazą.
+RATE_SNAPSHOT_VERIFY_INTERVAL = float(os.getenv("RATE_SNAPSHOT_VERIFY_INTERVAL", "10"))
+
+SNAPSHOT_MAGIC = b"NBPSNAP1"
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+def rates_version(db: Union[Session, Connection]) -> int:
+    """
+    Odczytuje wersję tabeli rates (licznik zapisów RatesVersion) — jeden odczyt po kluczu głównym.
+    """
+    return db.execute(_rates_version_query()).scalar() or 0
+
+
+def _rates_version_query() -> Select:
+    return select(RatesVersion.version).where(RatesVersion.id == 1)
+
+
+class RateSnapshot:
+    """
+    Migawka całej tabeli kursów odwzorowana w pamięci (mmap).
+
+    Plik zawiera nagłówek JSON (pierwsza data, liczba dni, kody i nazwy walut, wersja tabeli rates)
+    oraz gęstą macierz float64 [dni x waluty], w której NaN oznacza brak kursu. Wiersz dla daty to
+    `date.toordinal() - start`, więc odczyt tabeli dnia lub szeregu waluty to O(1) indeksowanie.
+    Wiele procesów API korzysta z jednej kopii pliku w page cache.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} nie jest migawką kursów")
+            (header_length,) = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))
+            header = json.loads(f.read(header_length))
+
+        self.path = path
+        self.start: int = header["start"]
+        self.codes: List[str] = header["codes"]
+        self.names: List[str] = header["names"]
+        # Migawka bez wersji (starszy format) nigdy nie zostanie uznana za aktualną.
+        self.version: Optional[int] = header.get("version")
+        self.code_index: Dict[str, int] = {code: i for i, code in enumerate(self.codes)}
+        shape = (header["n_dates"], len(self.codes))
+        offset = len(SNAPSHOT_MAGIC) + _HEADER_LENGTH.size + header_length
+        if shape[0] and shape[1]:
+            self.matrix = np.memmap(path, dtype="<f8", mode="r", offset=offset, shape=shape)
+        else:
+            self.matrix = np.empty(shape)
+
+    @property
+    def first_date(self) -> date:
+        return date.fromordinal(self.start)
+
+    @property
+    def last_date(self) -> date:
+        return date.fromordinal(self.start + self.matrix.shape[0] - 1)
+
+    def covers(self, target_date: date) -> bool:
+        return 0 <= target_date.toordinal() - self.start < self.matrix.shape[0]
+
+    def row(self, target_date: date) -> Optional[np.ndarray]:
+        if not self.covers(target_date):
+            return None
+        return self.matrix[target_date.toordinal() - self.start]
+
+    def table(self, target_date: date) -> List[Tuple[str, str, float]]:
+        """
+        Zwraca kursy z danej daty jako listę (kod, nazwa, kurs) posortowaną po kodzie.
+        """
+        row = self.row(target_date)
+        if row is None:
+            return []
+        return [(self.codes[i], self.names[i], float(row[i])) for i in np.flatnonzero(~np.isnan(row))]
+
+    def latest_date(self) -> Optional[date]:
+        published = np.flatnonzero(~np.isnan(self.matrix).all(axis=1))
+        if not len(published):
+            return None
+        return date.fromordinal(self.start + int(published[-1]))
+
+    def series(self, code: str, start: Optional[date] = None, end: Optional[date] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Zwraca szereg kursów waluty: (ordinale dat, kursy), z pominięciem dni bez kursu.
+
+        Raises:
+            KeyError: Gdy waluty nie ma w migawce.
+        """
+        column = self.matrix[:, self.code_index[code]]
+        first = max(0, start.toordinal() - self.start) if start else 0
+        last = min(len(column), end.toordinal() - self.start + 1) if end else len(column)
+        if first >= last:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        values = np.asarray(column[first:last])
+        present = np.flatnonzero(~np.isnan(values))
+        return present + self.start + first, values[present]
+
+
+def _write(path: str, version: int, start: int, codes: List[str], names: List[str], matrix: np.ndarray) -> None:
+    """
+    Zapisuje migawkę atomowo: do pliku tymczasowego, a następnie os.replace.
+    Procesy, które mają zmapowaną starą wersję, czytają ją dalej aż do przeładowania.
+    """
+    header = json.dumps({
+        "start": start, "n_dates": matrix.shape[0], "codes": codes, "names": names, "version": version
+    }).encode("utf-8")
+    # Wyrównanie macierzy do 8 bajtów.
+    header += b" " * (-(len(SNAPSHOT_MAGIC) + _HEADER_LENGTH.size + len(header)) % 8)
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(_HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(np.ascontiguousarray(matrix, dtype="<f8").tobytes())
+    os.replace(tmp_path, path)
+
+
+def _build(rows: Iterable[Tuple[date, str, str, float]], base: Optional[RateSnapshot] = None) -> Tuple[int, List[str], List[str], np.ndarray]:
+    rows = list(rows)
+    names = dict(zip(base.codes, base.names)) if base else {}
+    for _, code, name, _ in rows:
+        names.setdefault(code, name)
+    codes = sorted(names)
+
+    ordinals = [row[0].toordinal() for row in rows]
+    if base and base.matrix.shape[0]:
+        ordinals += [base.start, base.start + base.matrix.shape[0] - 1]
+    if not ordinals:
+        return 0, [], [], np.empty((0, 0))
+    start, end = min(ordinals), max(ordinals)
+
+    matrix = np.full((end - start + 1, len(codes)), np.nan)
+    column_of = {code: i for i, code in enumerate(codes)}
+    if base and base.matrix.size:
+        offset = base.start - start
+        columns = [column_of[code] for code in base.codes]
+        matrix[offset:offset + base.matrix.shape[0], columns] = base.matrix
+    if rows:
+        matrix[
+            np.array([o - start for o in ordinals[:len(rows)]]),
+            np.array([column_of[row[1]] for row in rows])
+        ] = np.array([row[3] for row in rows], dtype=np.float64)
+
+    return start, codes, [names[code] for code in codes], matrix
+
+
+class _FileLock:
+    def __init__(self, path: str):
+        self.path = f"{path}.lock"
+
+    def __enter__(self):
+        self._file = open(self.path, "a")
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+
+def select_snapshot_rows(db: Union[Session, Connection]) -> Tuple[int, List[Row]]:
+    """
+    Odczytuje wersję i całą tabelę `rates` (data, kod, nazwa, kurs) do zbudowania migawki (write_snapshot).
+    Wersja jest czytana przed wierszami: zapis zatwierdzony pomiędzy odczytami da migawkę z nowszymi
+    danymi, ale starszą wersją — zostanie ona uznana za nieaktualną, a nie odwrotnie.
+    """
+    version = rates_version(db)
+    return version, db.execute(
+        select(Rate.date, Currency.code, Currency.name, Rate.rate)
+        .join(Currency, Rate.currency_id == Currency.id)
+    ).all()
+
+
+def write_snapshot(path: str, version: int, rows: List[Row]) -> None:
+    """
+    Zapisuje migawkę zbudowaną od zera z wierszy odczytanych przez select_snapshot_rows.
+    """
+    with _FileLock(path):
+        _write(path, version, *_build(rows))
+
+
+def rebuild_snapshot(bind: Union[Engine, Connection], path: str) -> None:
+    """
+    Buduje migawkę od zera na podstawie całej tabeli `rates`.
+    """
+    with _FileLock(path), bind.connect() as connection:
+        version, rows = select_snapshot_rows(connection)
+        _write(path, version, *_build(rows))
+
+
+class _Matrix(NamedTuple):
+    start: int
+    codes: List[str]
+    names: List[str]
+    matrix: np.ndarray
+
+
+class SnapshotUpdate:
+    """
+    Dopisanie zatwierdzonych kursów do istniejącej migawki, zasilane porcjami wierszy (add), dzięki czemu
+    nowe kursy nie muszą być naraz w pamięci. Plik jest zapisywany atomowo w commit().
+
+    Dopisanie jest poprawne tylko wtedy, gdy wersja migawki powiększona o liczbę dodanych kursów (`added`)
+    daje dokładnie wersję `version` ustaloną w transakcji zapisu (applicable). Jeśli bazę zmienił
+    w międzyczasie inny proces (np. bez włączonej migawki), migawkę trzeba przebudować (rebuild_snapshot).
+    """
+
+    def __init__(self, path: str, added: int, version: int):
+        self.path = path
+        self.version = version
+        self._identity = _file_identity(path)
+        self._base = RateSnapshot(path) if self._identity else None
+        self._state: Optional[_Matrix] = None
+        base_version = self._base.version if self._base else None
+        # Migawka już zawiera ten zapis (np. przebudował ją równoległy zapis).
+        self.current = base_version == version
+        self.applicable = base_version is not None and base_version + added == version
+
+    def add(self, rows: Iterable[Tuple[date, str, str, float]]) -> None:
+        self._state = _Matrix(*_build(rows, self._state or self._base))
+
+    def commit(self) -> bool:
+        """
+        Zapisuje migawkę z dopisanymi kursami. Zwraca False (bez zapisu), gdy w międzyczasie plik
+        podmienił inny proces — wtedy migawkę trzeba przebudować.
+        """
+        with _FileLock(self.path):
+            if self._base is None or _file_identity(self.path) != self._identity:
+                return False
+            _write(self.path, self.version, *(self._state or self._base))
+        return True
+
+
+def _file_identity(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def update_snapshot(path: str, rows: List[Tuple[date, str, str, float]], version: int) -> bool:
+    """
+    Dopisuje do istniejącej migawki nowe kursy (data, kod, nazwa, kurs), rozszerzając
+    zakres dat i listę walut w razie potrzeby. Nie wymaga odczytu z bazy danych (zob. SnapshotUpdate).
+
+    Returns:
+        True, gdy migawka jest aktualna; False, gdy trzeba ją przebudować (rebuild_snapshot).
+    """
+    update = SnapshotUpdate(path, len(rows), version)
+    if update.current:
+        return True
+    if not update.applicable:
+        return False
+    update.add(rows)
+    return update.commit()
+
+
+class SnapshotStore:
+    """
+    Dostęp do aktualnej migawki kursów w procesie API.
+
+    Przy każdym odczycie sprawdzany jest i-węzeł pliku (stat), więc podmiana pliku
+    przez dowolny proces jest widoczna od razu, bez kosztownego ponownego wczytywania danych.
+    Wersja migawki jest porównywana z licznikiem zapisów w bazie (RatesVersion, odczyt jednego wiersza)
+    po każdej zmianie pliku, po każdym unieważnieniu (invalidate, np. po powiadomieniu o zapisie
+    z innego procesu) i nie rzadziej niż co `verify_interval` sekund. Migawka, która nie odpowiada bazie
+    (np. kursy zapisał proces bez włączonej migawki), nie jest używana — odczyty wracają do bazy do czasu
+    jej przebudowy. Gdy bazy nie da się odpytać, nadal serwowana jest ostatnia zweryfikowana migawka.
+    """
+
+    def __init__(self, path: str = RATE_SNAPSHOT_PATH, verify_interval: float = RATE_SNAPSHOT_VERIFY_INTERVAL):
+        self.path = path
+        self.verify_interval = verify_interval
+        self._snapshot: Optional[RateSnapshot] = None
+        self._identity: Optional[Tuple[int, int]] = None
+        # Wynik ostatniego porównania z bazą (None: do sprawdzenia) i chwila, w której go ustalono.
+        self._fresh: Optional[bool] = None
+        self._verified_at = 0.0
+        # Ostatnia migawka, którą porównanie z bazą uznało za aktualną.
+        self._verified: Optional[RateSnapshot] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        """
+        Wymusza porównanie migawki z bazą przy następnym odczycie.
+        """
+        with self._lock:
+            self._fresh = None
+
+    def _load(self) -> Tuple[Optional[RateSnapshot], Optional[bool]]:
+        identity = _file_identity(self.path)
+        if identity is None:
+            return None, None
+        with self._lock:
+            changed = identity != self._identity
+        if changed:
+            # Wczytanie pliku poza blokadą, żeby invalidate() i odczyty innych wątków na nie nie czekały.
+            try:
+                snapshot = RateSnapshot(self.path)
+            except (OSError, ValueError) as e:
+                logger.error("Nie udało się wczytać migawki kursów %s: %s", self.path, e)
+                snapshot = None
+            with self._lock:
+                if identity != self._identity:
+                    self._snapshot = snapshot
+                    self._identity = identity
+                    self._fresh = None
+        with self._lock:
+            if self._fresh is not None and time.monotonic() - self._verified_at > self.verify_interval:
+                self._fresh = None
+            return self._snapshot, self._fresh
+
+    def get(self, db: Session) -> Optional[RateSnapshot]:
+        """
+        Zwraca migawkę, jeśli odpowiada stanowi bazy widocznemu w sesji `db`; w przeciwnym razie None.
+        Zapytanie o wersję jest wykonywane poza blokadą, tylko gdy wynik porównania wygasł.
+        """
+        if not self.path:
+            return None
+        snapshot, fresh = self._load()
+        if snapshot is None or fresh is not None:
+            return snapshot if fresh else None
+        try:
+            version = rates_version(db)
+        except SQLAlchemyError as e:
+            db.rollback()
+            return self._unverified(e)
+        return self._settle(snapshot, version)
+
+    async def get_async(self, db: AsyncSession) -> Optional[RateSnapshot]:
+        """
+        Jak get, dla endpointów asynchronicznych: plik jest wczytywany w puli wątków,
+        a wersja odczytywana przez sesję asynchroniczną, bez blokowania pętli zdarzeń.
+        """
+        if not self.path:
+            return None
+        snapshot, fresh = await asyncio.to_thread(self._load)
+        if snapshot is None or fresh is not None:
+            return snapshot if fresh else None
+        try:
+            version = (await db.execute(_rates_version_query())).scalar() or 0
+        except SQLAlchemyError as e:
+            await db.rollback()
+            return self._unverified(e)
+        return self._settle(snapshot, version)
+
+    def _settle(self, snapshot: RateSnapshot, version: int) -> Optional[RateSnapshot]:
+        fresh = snapshot.version is not None and snapshot.version == version
+        if not fresh:
+            logger.warning("Migawka kursów %s nie odpowiada bazie danych, odczyty wracają do bazy", self.path)
+        with self._lock:
+            if self._snapshot is snapshot:
+                self._fresh = fresh
+                self._verified_at = time.monotonic()
+            self._verified = snapshot if fresh else None
+        return snapshot if fresh else None
+
+    def _unverified(self, error: Exception) -> Optional[RateSnapshot]:
+        logger.warning("Nie udało się sprawdzić wersji migawki kursów %s: %s", self.path, error)
+        return self._verified
+
+
+snapshot_store = SnapshotStore()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m rate_snapshot", description="Migawka kursów do odczytu przez mmap.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--path", default=RATE_SNAPSHOT_PATH or "rates.snapshot")
+    args = parser.parse_args(argv)
+
+    from database import engine
+
+    rebuild_snapshot(engine, args.path)
+    snapshot = RateSnapshot(args.path)
+    print(f"Zapisano migawkę {args.path}: {snapshot.matrix.shape[0]} dni x {len(snapshot.codes)} walut")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
-from datetime import date
+from datetime import date, datetime
+from typing import List, Optional
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class CurrencyBase(BaseModel):
@@ -41,3 +42,144 @@ class RateWithCurrency(RateBase):
     currency: CurrencyBase
 
     model_config = ConfigDict(from_attributes=True)
+
+class RateTableColumns(BaseModel):
+    """
+    Tabela kursów z jednej daty w zwartej postaci kolumnowej (kształt "columns").
+    Pozycje list codes, names i rates odpowiadają sobie indeksami.
+    """
+    date: date
+    codes: List[str]
+    names: List[str]
+    rates: List[float]
+
+class LatestRateColumns(BaseModel):
+    """
+    Najnowsze kursy walut w postaci kolumnowej; każda waluta ma własną datę kursu.
+    """
+    codes: List[str]
+    names: List[str]
+    dates: List[date]
+    rates: List[float]
+
+class ConversionBase(BaseModel):
+    """
+    Podstawowy model przeliczenia kwoty między walutami.
+    """
+    amount: float
+    from_code: str = Field(alias="from")
+    to_code: str = Field(alias="to")
+
+    model_config = ConfigDict(populate_by_name=True)
+
+class ConversionRequest(ConversionBase):
+    """
+    Pojedyncza pozycja do przeliczenia. Brak daty oznacza najnowszą tabelę kursów.
+    """
+    rates_date: Optional[date] = Field(default=None, alias="date")
+
+class ConversionResult(ConversionBase):
+    """
+    Wynik przeliczenia wraz z datą tabeli i zastosowanym kursem krzyżowym.
+    """
+    date: date
+    rate: float
+    result: float
+
+class BatchConversionRequest(BaseModel):
+    """
+    Lista pozycji do przeliczenia w jednym zapytaniu.
+    """
+    items: List[ConversionRequest]
+
+class BatchConversionResponse(BaseModel):
+    """
+    Wyniki przeliczeń w kolejności pozycji z zapytania.
+    """
+    results: List[ConversionResult]
+
+class RateHistoryPoint(BaseModel):
+    """
+    Kurs waluty w jednym okresie (dzień, tydzień lub miesiąc) szeregu czasowego.
+    """
+    date: date
+    open: float
+    close: float
+    low: float
+    high: float
+    avg: float
+    count: int
+
+class RateHistory(BaseModel):
+    """
+    Szereg czasowy kursu waluty.
+    """
+    code: str
+    interval: str
+    points: List[RateHistoryPoint]
+
+class RateMatrixQuery(BaseModel):
+    """
+    Zapytanie o kursy wielu walut z przedziału dat (brak listy kodów oznacza wszystkie waluty).
+    """
+    start: date
+    end: date
+    codes: Optional[List[str]] = None
+
+class RateMatrix(BaseModel):
+    """
+    Kursy w postaci macierzy: values[i][j] to kurs waluty codes[j] z dnia dates[i] (null, gdy brak kursu).
+    """
+    dates: List[date]
+    codes: List[str]
+    values: List[List[Optional[float]]]
+
+class RollingStats(BaseModel):
+    """
+    Średnia krocząca kursu i zmienność stóp zwrotu w oknie ostatnich dni notowań.
+    Dni z niepełnym oknem mają wartości null.
+    """
+    code: str
+    window: int
+    annualized: bool
+    dates: List[date]
+    mean: List[Optional[float]]
+    volatility: List[Optional[float]]
+
+class CorrelationMatrix(BaseModel):
+    """
+    Macierz korelacji dziennych logarytmicznych stóp zwrotu walut; matrix[i][j] dotyczy codes[i] i codes[j].
+    """
+    codes: List[str]
+    observations: int
+    matrix: List[List[Optional[float]]]
+
+class FetchJobRequest(BaseModel):
+    """
+    Zlecenie pobrania z NBP: bez dat — aktualna tabela, z datą — tabela z jednego dnia,
+    z początkiem i końcem — wszystkie tabele z przedziału.
+    """
+    target_date: Optional[date] = Field(default=None, alias="date")
+    start: Optional[date] = None
+    end: Optional[date] = None
+
+    model_config = ConfigDict(populate_by_name=True)
+
+class FetchJob(BaseModel):
+    """
+    Stan zadania pobrania z NBP (pending, running, succeeded lub failed) wraz z postępem.
+    """
+    id: int
+    status: str
+    start_date: Optional[date]
+    end_date: Optional[date]
+    days_total: int
+    days_done: int
+    tables_fetched: int
+    rows_added: int
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    model_config = ConfigDict(from_attributes=True)
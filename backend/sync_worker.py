@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from models import Rate
+from nbp_client import close_nbp_client
+from nbp_service import backfill, fetch_and_save_rates
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+SYNC_TIMEZONE = ZoneInfo(os.getenv("SYNC_TIMEZONE", "Europe/Warsaw"))
+SYNC_PUBLICATION_TIME = time.fromisoformat(os.getenv("SYNC_PUBLICATION_TIME", "12:15"))
+SYNC_POLL_UNTIL = time.fromisoformat(os.getenv("SYNC_POLL_UNTIL", "16:00"))
+SYNC_POLL_INTERVAL = float(os.getenv("SYNC_POLL_INTERVAL", "600"))
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", "2"))
+
+# Stały klucz blokady doradczej Postgresa, o którą konkurują repliki ("NBPS").
+SYNC_LOCK_KEY = 0x4E425053
+
+
+async def sync_once(engine: Engine) -> int:
+    """
+    Pobiera z NBP wszystkie tabele nowsze od najnowszego kursu w bazie (do dzisiaj włącznie)
+    i zapisuje je ścieżką normalize_data/save_rates. Pustą bazę inicjuje aktualną tabelą.
+
+    Returns:
+        Liczba dodanych nowych kursów.
+    """
+    today = datetime.now(SYNC_TIMEZONE).date()
+
+    with Session(bind=engine, autoflush=False) as db:
+        latest = await asyncio.to_thread(lambda: db.execute(select(func.max(Rate.date))).scalar())
+        if latest is None:
+            _, added_count = await fetch_and_save_rates(engine)
+            return added_count
+        if latest >= today:
+            return 0
+        return await backfill(db, latest + timedelta(days=1), today, concurrency=SYNC_CONCURRENCY)
+
+
+def next_check_delay(now: datetime, synced_today: bool, last_check: Optional[datetime] = None) -> float:
+    """
+    Wylicza, ile sekund czekać do kolejnej próby synchronizacji (0 oznacza: teraz).
+
+    NBP publikuje tabelę A w dni robocze około południa. Przed oknem publikacji czekamy na jego
+    początek, w oknie ponawiamy co SYNC_POLL_INTERVAL, aż tabela się pojawi, a po jej pobraniu,
+    po końcu okna oraz w weekendy czekamy do okna w kolejnym dniu roboczym.
+
+    Args:
+        now: Bieżący czas w strefie SYNC_TIMEZONE.
+        synced_today: Czy dzisiejsza tabela jest już w bazie.
+        last_check: Czas ostatniej próby synchronizacji.
+    """
+    publication = datetime.combine(now.date(), SYNC_PUBLICATION_TIME, tzinfo=now.tzinfo)
+    poll_until = datetime.combine(now.date(), SYNC_POLL_UNTIL, tzinfo=now.tzinfo)
+
+    if now.weekday() < 5 and not synced_today and now < poll_until:
+        if now < publication:
+            return (publication - now).total_seconds()
+        if last_check is None or last_check < publication:
+            return 0.0
+        return max(0.0, (last_check + timedelta(seconds=SYNC_POLL_INTERVAL) - now).total_seconds())
+
+    next_day = now.date() + timedelta(days=1)
+    while next_day.weekday() >= 5:
+        next_day += timedelta(days=1)
+    return (datetime.combine(next_day, SYNC_PUBLICATION_TIME, tzinfo=now.tzinfo) - now).total_seconds()
+
+
+class SyncWorker:
+    """
+    Cykliczna synchronizacja przyrostowa kursów z NBP.
+
+    Przy wielu replikach tylko lider (posiadacz sesyjnej blokady doradczej Postgresa
+    `pg_try_advisory_lock`) odpytuje NBP; pozostałe co cykl próbują przejąć blokadę,
+    co następuje automatycznie, gdy połączenie lidera zostanie zamknięte.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._lock_connection: Optional[Connection] = None
+        self._stopped = asyncio.Event()
+
+    def _is_leader(self) -> bool:
+        if self.engine.dialect.name != "postgresql":
+            return True
+
+        if self._lock_connection is not None:
+            try:
+                self._lock_connection.execute(text("SELECT 1"))
+                self._lock_connection.commit()
+                return True
+            except Exception:
+                self._release_leadership()
+
+        connection = self.engine.connect()
+        acquired = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": SYNC_LOCK_KEY}).scalar()
+        connection.commit()
+        if acquired:
+            self._lock_connection = connection
+            return True
+        connection.close()
+        return False
+
+    def _release_leadership(self) -> None:
+        if self._lock_connection is not None:
+            try:
+                self._lock_connection.close()
+            except Exception:
+                pass
+            self._lock_connection = None
+
+    async def run(self) -> None:
+        synced_on: Optional[date] = None
+        last_check: Optional[datetime] = None
+
+        while not self._stopped.is_set():
+            now = datetime.now(SYNC_TIMEZONE)
+            delay = next_check_delay(now, synced_on == now.date(), last_check)
+
+            if delay == 0.0:
+                last_check = now
+                try:
+                    if await asyncio.to_thread(self._is_leader):
+                        added_count = await sync_once(self.engine)
+                        logger.info("Synchronizacja z NBP: dodano %d nowych kursów", added_count)
+                    if await asyncio.to_thread(self._has_table_for, now.date()):
+                        synced_on = now.date()
+                except Exception as e:
+                    logger.exception("Błąd synchronizacji z NBP: %s", e)
+                continue
+
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+        await asyncio.to_thread(self._release_leadership)
+
+    def _has_table_for(self, target_date: date) -> bool:
+        with Session(bind=self.engine) as db:
+            return db.execute(select(Rate.id).where(Rate.date == target_date).limit(1)).first() is not None
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    from database import engine
+
+    async def run() -> None:
+        try:
+            await SyncWorker(engine).run()
+        finally:
+            await close_nbp_client()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
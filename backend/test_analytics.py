@@ -0,0 +1,145 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+from analytics import AnalyticsStore, RateAnalytics
+from database import Base
+from history import UnknownCurrencyCodeError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+START = date(2026, 1, 5)
+
+
+def make_rows(days, codes=("EUR", "USD", "CHF"), start=START, seed=7):
+    rng = np.random.default_rng(seed)
+    levels = np.exp(np.cumsum(rng.normal(0, 0.01, (days, len(codes))), axis=0)) * 4
+    return [
+        (start + timedelta(days=day), code, float(levels[day, i]))
+        for day in range(days) for i, code in enumerate(codes)
+    ]
+
+
+class TestRateAnalytics:
+    def test_should_compute_rolling_mean_and_volatility(self):
+        rows = make_rows(30)
+        analytics = RateAnalytics.from_rows(rows)
+        usd = np.array([rate for _, code, rate in rows if code == "USD"])
+
+        dates, mean, volatility = analytics.rolling("USD", 5)
+
+        assert dates[0] == START and len(dates) == 30
+        assert np.isnan(mean[:4]).all() and np.isnan(volatility[:4]).all()
+        assert mean[10] == pytest.approx(usd[6:11].mean())
+        # The window of 5 rates at day 10 contains the 5 returns ending at day 10.
+        assert volatility[10] == pytest.approx(np.std(np.diff(np.log(usd[5:11])), ddof=1))
+
+    def test_should_use_rates_before_start_for_the_first_window(self):
+        analytics = RateAnalytics.from_rows(make_rows(30))
+
+        dates, mean, _ = analytics.rolling("EUR", 5, start=START + timedelta(days=20))
+
+        assert dates[0] == START + timedelta(days=20)
+        assert not np.isnan(mean).any()
+
+    def test_should_match_numpy_correlation_over_full_history(self):
+        rows = make_rows(200)
+        analytics = RateAnalytics.from_rows(rows)
+        returns = np.diff(np.log(analytics.values), axis=0)
+
+        codes, matrix, observations = analytics.correlation()
+
+        assert codes == ["CHF", "EUR", "USD"]
+        assert observations == 200
+        assert np.allclose(matrix, np.corrcoef(returns.T))
+
+    def test_should_compute_windowed_correlation_for_selected_codes(self):
+        analytics = RateAnalytics.from_rows(make_rows(200))
+        returns = np.diff(np.log(analytics.values[-51:]), axis=0)
+
+        codes, matrix, observations = analytics.correlation(["USD", "EUR"], window=50)
+
+        assert codes == ["USD", "EUR"]
+        assert observations == 50
+        expected = np.corrcoef(returns[:, [analytics.code_index["USD"], analytics.code_index["EUR"]]].T)
+        assert np.allclose(matrix, expected)
+
+    def test_should_extend_incrementally_to_the_same_result_as_full_build(self):
+        rows = make_rows(60)
+        new_days = [row for row in make_rows(5, ("EUR", "USD", "CHF", "GBP"), START + timedelta(days=60), seed=8)]
+
+        extended = RateAnalytics.from_rows(rows).extended(new_days)
+        rebuilt = RateAnalytics.from_rows(rows + new_days)
+
+        order = [extended.code_index[code] for code in rebuilt.codes]
+        assert np.array_equal(extended.ordinals, rebuilt.ordinals)
+        assert np.allclose(extended.rate_sums[:, :, order], rebuilt.rate_sums, equal_nan=True)
+        assert np.allclose(extended.return_sums[:, :, order], rebuilt.return_sums, equal_nan=True)
+        assert np.allclose(extended.correlation()[1], rebuilt.correlation()[1], equal_nan=True)
+
+    def test_should_reject_days_older_than_the_last_known_day(self):
+        analytics = RateAnalytics.from_rows(make_rows(10))
+
+        with pytest.raises(ValueError):
+            analytics.extended([(START, "EUR", 4.0)])
+
+    def test_should_raise_for_unknown_currency(self):
+        with pytest.raises(UnknownCurrencyCodeError):
+            RateAnalytics.from_rows(make_rows(10)).rolling("XYZ", 5)
+
+
+class TestAnalyticsStore:
+    @pytest.fixture
+    def db(self):
+        engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        session = sessionmaker(bind=engine)()
+        yield session
+        session.close()
+
+    @pytest.fixture
+    def store(self, mocker):
+        store = AnalyticsStore()
+        mocker.patch("nbp_service.analytics_store", store)
+        return store
+
+    def save(self, db, rows):
+        from nbp_service import RateRecord, save_rates
+
+        save_rates(db, [RateRecord(rate_date, code, code, rate) for rate_date, code, rate in rows])
+
+    def test_should_append_new_days_saved_by_save_rates(self, db, store, mocker):
+        self.save(db, make_rows(30))
+        loaded = store.get(db)
+        build = mocker.spy(RateAnalytics, "from_rows")
+
+        self.save(db, make_rows(2, start=START + timedelta(days=30), seed=9))
+
+        analytics = store.get(db)
+        assert analytics is not loaded
+        assert len(analytics.ordinals) == 32
+        build.assert_not_called()
+
+    def test_should_rebuild_after_saving_older_days(self, db, store):
+        self.save(db, make_rows(30, start=START + timedelta(days=10)))
+        store.get(db)
+
+        self.save(db, make_rows(5))
+
+        assert not store.is_loaded()
+        assert len(store.get(db).ordinals) == 35
+
+    def test_should_not_keep_analytics_built_before_an_invalidation(self, db, store, mocker):
+        self.save(db, make_rows(10))
+        from_rows = RateAnalytics.from_rows
+
+        def build_racing_a_write(rows):
+            # Another process writes (and notifies) while the rows are being turned into analytics.
+            store.invalidate()
+            return from_rows(rows)
+
+        mocker.patch.object(RateAnalytics, "from_rows", side_effect=build_racing_a_write)
+
+        assert len(store.get(db).ordinals) == 10
+        assert not store.is_loaded()
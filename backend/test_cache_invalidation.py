@@ -0,0 +1,55 @@
+import json
+from datetime import date, timedelta
+
+from cache_invalidation import apply_invalidation, invalidation_payload
+from rate_cache import CURRENCIES_KEY, LATEST_KEY, RateCache, rate_cache, rates_key
+
+
+class TestCacheInvalidation:
+    def setup_method(self):
+        rate_cache.clear()
+        for key in (rates_key(date(2026, 1, 29)), rates_key(date(2026, 1, 30)), LATEST_KEY, CURRENCIES_KEY):
+            rate_cache.put(key, "cached")
+
+    def test_should_invalidate_only_notified_dates_and_latest_rates(self):
+        apply_invalidation(invalidation_payload([date(2026, 1, 30)], currencies_changed=False))
+
+        assert rate_cache.get(rates_key(date(2026, 1, 29))) == "cached"
+        assert rate_cache.get(rates_key(date(2026, 1, 30))) is None
+        assert rate_cache.get(LATEST_KEY) is None
+        assert rate_cache.get(CURRENCIES_KEY) == "cached"
+
+    def test_should_clear_everything_when_payload_exceeds_notify_limit(self):
+        dates = [date(2000, 1, 1) + timedelta(days=offset) for offset in range(2000)]
+
+        payload = invalidation_payload(dates, currencies_changed=True)
+        apply_invalidation(payload)
+
+        assert json.loads(payload) == {"all": True}
+        assert rate_cache.get(rates_key(date(2026, 1, 29))) is None
+        assert rate_cache.get(CURRENCIES_KEY) is None
+
+    def test_should_not_cache_read_that_raced_an_invalidation(self):
+        key = rates_key(date(2026, 1, 31))
+        generation = rate_cache.generation(key)
+
+        # The write commits and its notification arrives while the read is still in flight.
+        apply_invalidation(invalidation_payload([date(2026, 1, 31)], currencies_changed=False))
+        entry = rate_cache.set(key, [], generation=generation)
+
+        assert entry.empty
+        assert rate_cache.get(key) is None
+
+    def test_should_not_cache_empty_or_freshly_invalidated_replica_reads(self):
+        cache = RateCache(replica_lag=60)
+        key = rates_key(date(2026, 1, 31))
+
+        cache.set(key, [], generation=cache.generation(key), replica=True)
+        assert cache.get(key) is None
+
+        cache.invalidate_dates([date(2026, 1, 31)])
+        cache.set(key, [{"rate": 4.2}], generation=cache.generation(key), replica=True)
+        assert cache.get(key) is None
+
+        cache.set(key, [{"rate": 4.2}], generation=cache.generation(key))
+        assert cache.get(key) is not None
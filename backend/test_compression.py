@@ -0,0 +1,76 @@
+import gzip
+
+import compression
+import pytest
+from compression import CompressionMiddleware, negotiate_encoding
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+
+@app.get("/small")
+def small():
+    return PlainTextResponse("ok")
+
+
+@app.get("/large")
+def large():
+    return PlainTextResponse("kurs " * 100)
+
+
+@app.get("/stream")
+def stream():
+    return StreamingResponse(iter([b"a" * 50, b"b" * 50]), media_type="text/plain")
+
+
+client = TestClient(app)
+
+
+class TestNegotiateEncoding:
+    def test_should_prefer_brotli_when_available(self, mocker):
+        mocker.patch.object(compression, "brotli", object())
+
+        assert negotiate_encoding("gzip, deflate, br") == "br"
+
+    def test_should_fall_back_to_gzip_without_brotli(self, mocker):
+        mocker.patch.object(compression, "brotli", None)
+
+        assert negotiate_encoding("gzip, br") == "gzip"
+
+    @pytest.mark.parametrize("header", ["", "identity", "gzip;q=0", "*;q=0"])
+    def test_should_not_compress_when_client_refuses(self, header):
+        assert negotiate_encoding(header) is None
+
+    def test_should_respect_client_weights(self, mocker):
+        mocker.patch.object(compression, "brotli", object())
+
+        assert negotiate_encoding("br;q=0.5, gzip") == "gzip"
+
+
+class TestCompressionMiddleware:
+    @pytest.fixture(autouse=True)
+    def gzip_only(self, mocker):
+        mocker.patch.object(compression, "brotli", None)
+
+    def test_should_skip_responses_below_minimum_size(self):
+        response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+
+        assert "Content-Encoding" not in response.headers
+        assert response.text == "ok"
+
+    def test_should_gzip_large_responses(self):
+        response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert int(response.headers["Content-Length"]) < 500
+        assert response.text == "kurs " * 100
+
+    def test_should_compress_streaming_responses_chunk_by_chunk(self):
+        with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+            raw = b"".join(response.iter_raw())
+
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(raw) == b"a" * 50 + b"b" * 50
@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+
+import database
+from database import get_db, is_replica_session, pool_status, primary_bind
+
+
+class TestSessionRouting:
+    def open_session(self, method):
+        dependency = get_db(SimpleNamespace(method=method))
+        db = next(dependency)
+        dependency.close()
+        return db
+
+    def test_should_give_read_requests_a_replica_session_that_remembers_the_primary(self):
+        db = self.open_session("GET")
+
+        assert db.get_bind() is database.replica_engine
+        assert primary_bind(db) is database.engine
+        assert is_replica_session(db) == (database.replica_engine is not database.engine)
+
+    def test_should_give_write_requests_a_primary_session(self):
+        db = self.open_session("POST")
+
+        assert db.get_bind() is database.engine
+        assert primary_bind(db) is database.engine
+        assert not is_replica_session(db)
+
+    def test_should_report_primary_pool_settings(self):
+        status = pool_status()["primary"]
+
+        assert status["pool"] == "QueuePool"
+        assert status["size"] == database.DB_POOL_SIZE
+        assert status["checked_out"] == 0
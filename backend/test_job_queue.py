@@ -0,0 +1,142 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+from database import Base
+from job_queue import FAILED, PENDING, RUNNING, SUCCEEDED, FetchJobRunner, create_fetch_job
+from models import FetchJob, Rate
+from nbp_client import NBPClientError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from test_nbp_service import fake_range_response
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # A file database: workers and the polling test each need their own connection.
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def run_jobs(engine, *job_ids, timeout=5.0):
+    """
+    Starts a runner, waits until the given jobs reach a final status and stops it.
+    """
+    async def run():
+        runner = FetchJobRunner(engine, workers=2, poll_interval=0.05)
+        await runner.start()
+        for job_id in job_ids:
+            runner.submit(job_id)
+        deadline = asyncio.get_running_loop().time() + timeout
+        try:
+            while asyncio.get_running_loop().time() < deadline:
+                with Session(bind=engine) as db:
+                    if all(db.get(FetchJob, job_id).status in (SUCCEEDED, FAILED) for job_id in job_ids):
+                        return
+                await asyncio.sleep(0.02)
+            raise AssertionError("Jobs did not finish in time")
+        finally:
+            await runner.stop()
+
+    asyncio.run(run())
+    with Session(bind=engine, expire_on_commit=False) as db:
+        return [db.get(FetchJob, job_id) for job_id in job_ids]
+
+
+class TestCreateFetchJob:
+    def test_should_deduplicate_active_jobs_for_the_same_range(self, engine):
+        with Session(bind=engine) as db:
+            first, created_first = create_fetch_job(db, date(2026, 1, 1), date(2026, 1, 31))
+            second, created_second = create_fetch_job(db, date(2026, 1, 1), date(2026, 1, 31))
+            other, created_other = create_fetch_job(db, date(2026, 1, 1), date(2026, 1, 30))
+
+            assert (created_first, created_second, created_other) == (True, False, True)
+            assert second.id == first.id
+            assert other.id != first.id
+            assert first.days_total == 31
+
+    def test_should_create_new_job_once_previous_one_finished(self, engine):
+        with Session(bind=engine) as db:
+            first, _ = create_fetch_job(db)
+            first.status = SUCCEEDED
+            db.commit()
+
+            second, created = create_fetch_job(db)
+
+            assert created
+            assert second.id != first.id
+
+
+class TestFetchJobRunner:
+    def test_should_fetch_single_date_in_background(self, engine, mocker):
+        mocker.patch("nbp_service.fetch_exchange_rates", return_value=[{
+            "effectiveDate": "2026-01-30", "rates": [{"currency": "euro", "code": "EUR", "mid": 4.2}]
+        }])
+        with Session(bind=engine) as db:
+            job, _ = create_fetch_job(db, date(2026, 1, 30))
+
+        (job,) = run_jobs(engine, job.id)
+
+        assert job.status == SUCCEEDED
+        assert (job.tables_fetched, job.rows_added, job.days_done) == (1, 1, 1)
+        assert job.finished_at is not None
+
+    def test_should_report_progress_of_range_jobs_per_window(self, engine, mocker):
+        mocker.patch("nbp_service.fetch_exchange_rates_range", side_effect=fake_range_response)
+        with Session(bind=engine) as db:
+            job, _ = create_fetch_job(db, date(2025, 1, 1), date(2025, 6, 30))
+
+        (job,) = run_jobs(engine, job.id)
+
+        with Session(bind=engine) as db:
+            assert db.query(Rate).count() == job.rows_added > 0
+        assert job.status == SUCCEEDED
+        assert job.days_done == job.days_total == 181
+        assert job.completed_through == date(2025, 6, 30)
+        assert job.tables_fetched == job.rows_added
+
+    def test_should_record_failure(self, engine, mocker):
+        mocker.patch("nbp_service.fetch_exchange_rates", side_effect=NBPClientError("timeout"))
+        with Session(bind=engine) as db:
+            job, _ = create_fetch_job(db)
+
+        (job,) = run_jobs(engine, job.id)
+
+        assert job.status == FAILED
+        assert job.error == "timeout"
+
+    def test_should_resume_abandoned_job_after_last_saved_window(self, engine, mocker):
+        fetch = mocker.patch("nbp_service.fetch_exchange_rates_range", side_effect=fake_range_response)
+        with Session(bind=engine) as db:
+            job, _ = create_fetch_job(db, date(2025, 1, 1), date(2025, 6, 30))
+            # A process died while running the job, after saving the first window.
+            job.status = RUNNING
+            job.completed_through = date(2025, 4, 3)
+            job.heartbeat_at = datetime.utcnow() - timedelta(hours=1)
+            db.commit()
+            job_id = job.id
+
+        async def resume():
+            runner = FetchJobRunner(engine, workers=1)
+            await runner.enqueue_pending()
+            await runner.stop()
+            return list(runner._queued)
+
+        assert asyncio.run(resume()) == [job_id]
+        with Session(bind=engine) as db:
+            assert db.get(FetchJob, job_id).status == PENDING
+
+        (job,) = run_jobs(engine, job_id)
+
+        assert job.status == SUCCEEDED
+        assert fetch.call_args_list[0].args[0] == date(2025, 4, 4)
+
+    def test_should_claim_job_only_once(self, engine):
+        with Session(bind=engine) as db:
+            job, _ = create_fetch_job(db)
+        runner = FetchJobRunner(engine)
+
+        assert runner._claim(job.id) is not None
+        assert runner._claim(job.id) is None
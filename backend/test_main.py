@@ -1,30 +1,32 @@
+import os
+import tempfile
 from datetime import date
 
 import models
 import pytest
-from database import Base, get_db
+from database import Base, get_async_db, get_export_engine
 from fastapi.testclient import TestClient
 from main import app
-from sqlalchemy import create_engine
+from rate_cache import encode_response, rate_cache, rates_key
+from sqlalchemy import create_engine, event, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
-
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool
-)
+from sqlalchemy.pool import NullPool
+
+# The app reads through aiosqlite while tests prepare data synchronously, so both engines share one file.
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "test_main.db")
+engine = create_engine(f"sqlite:///{DATABASE_PATH}", connect_args={"check_same_thread": False})
+# TestClient runs each request in its own event loop, so async connections must not be pooled across requests.
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{DATABASE_PATH}", poolclass=NullPool)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_export_engine] = lambda: engine
+app.dependency_overrides[get_async_db] = override_get_async_db
 
 client = TestClient(app)
 
@@ -32,6 +34,7 @@ class TestCurrencyAPI:
     @pytest.fixture(autouse=True)
     def setup_db(self):
         Base.metadata.create_all(bind=engine)
+        rate_cache.clear()
         yield
         Base.metadata.drop_all(bind=engine)
 
@@ -102,3 +105,795 @@ class TestCurrencyAPI:
         assert rate is not None
         assert rate.rate == 1.23
         db.close()
+
+    def test_should_load_rates_for_date_with_constant_number_of_queries(self):
+        db = TestingSessionLocal()
+        currencies = [models.Currency(code=f"C{i:02d}", name=f"Currency {i}") for i in range(30)]
+        db.add_all(currencies)
+        db.flush()
+        db.add(models.Rate(currency_id=currencies[0].id, date=date(2026, 1, 29), rate=1.0))
+        db.add_all(models.Rate(currency_id=c.id, date=date(2026, 1, 30), rate=1.0) for c in currencies)
+        db.commit()
+        db.close()
+
+        statements = []
+        listener = lambda conn, cursor, statement, params, context, executemany: statements.append(statement)
+        event.listen(async_engine.sync_engine, "before_cursor_execute", listener)
+        try:
+            single = client.get("/currencies/2026-01-29")
+            single_count = len(statements)
+            statements.clear()
+            many = client.get("/currencies/2026-01-30")
+            many_count = len(statements)
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", listener)
+
+        assert len(single.json()) == 1
+        assert len(many.json()) == 30
+        assert many_count == single_count == 1
+
+    def test_should_return_etag_and_not_modified_for_matching_if_none_match(self):
+        db = TestingSessionLocal()
+        curr = models.Currency(code="EUR", name="Euro")
+        db.add(curr)
+        db.flush()
+        db.add(models.Rate(currency_id=curr.id, date=date(2026, 1, 30), rate=4.25))
+        db.commit()
+        db.close()
+
+        first = client.get("/currencies/2026-01-30")
+        second = client.get("/currencies/2026-01-30", headers={"If-None-Match": first.headers["ETag"]})
+
+        assert first.status_code == 200
+        assert first.headers["Cache-Control"] == "public, max-age=86400"
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["ETag"] == first.headers["ETag"]
+
+    def test_should_require_revalidation_of_empty_table(self):
+        response = client.get("/currencies/2026-02-01")
+
+        assert response.json() == []
+        assert response.headers["Cache-Control"] == "no-cache"
+
+    def test_should_serve_cached_table_until_save_rates_adds_rows_for_that_date(self):
+        from nbp_service import RateRecord, save_rates
+
+        assert client.get("/currencies/2026-01-30").json() == []
+        first_etag = client.get("/currencies").headers["ETag"]
+
+        db = TestingSessionLocal()
+        added = save_rates(db, [RateRecord(date(2026, 1, 30), "EUR", "Euro", 4.25)])
+        db.close()
+
+        response = client.get("/currencies/2026-01-30", headers={"If-None-Match": first_etag})
+        assert added == 1
+        assert response.status_code == 200
+        assert response.json()[0]["currency"]["code"] == "EUR"
+        assert client.get("/currencies", headers={"If-None-Match": first_etag}).status_code == 200
+
+class TestConversionAPI:
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        Base.metadata.create_all(bind=engine)
+        rate_cache.clear()
+        db = TestingSessionLocal()
+        eur = models.Currency(code="EUR", name="Euro")
+        usd = models.Currency(code="USD", name="US Dollar")
+        db.add_all([eur, usd])
+        db.flush()
+        db.add_all([
+            models.Rate(currency_id=eur.id, date=date(2026, 1, 29), rate=4.20),
+            models.Rate(currency_id=usd.id, date=date(2026, 1, 29), rate=4.00),
+            models.Rate(currency_id=eur.id, date=date(2026, 1, 30), rate=4.40),
+            models.Rate(currency_id=usd.id, date=date(2026, 1, 30), rate=4.00),
+        ])
+        db.commit()
+        db.close()
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_convert_between_two_currencies_on_date(self):
+        response = client.get("/convert", params={"from": "eur", "to": "USD", "amount": 100, "date": "2026-01-29"})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["from"] == "EUR"
+        assert data["rate"] == pytest.approx(1.05)
+        assert data["result"] == pytest.approx(105.0)
+
+    def test_should_use_latest_table_and_support_pln(self):
+        response = client.get("/convert", params={"from": "PLN", "to": "EUR", "amount": 44})
+
+        assert response.json()["date"] == "2026-01-30"
+        assert response.json()["result"] == pytest.approx(10.0)
+
+    def test_should_return_not_found_for_date_without_table(self):
+        response = client.get("/convert", params={"from": "EUR", "to": "USD", "date": "2026-02-01"})
+
+        assert response.status_code == 404
+
+    def test_should_convert_batch_across_dates(self):
+        items = [
+            {"amount": 100, "from": "EUR", "to": "USD", "date": "2026-01-29"},
+            {"amount": 100, "from": "EUR", "to": "USD", "date": "2026-01-30"},
+            {"amount": 400, "from": "USD", "to": "PLN"},
+        ] * 1000
+
+        response = client.post("/convert/batch", json={"items": items})
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert len(results) == 3000
+        assert [r["result"] for r in results[:3]] == pytest.approx([105.0, 110.0, 1600.0])
+        assert results[2]["date"] == "2026-01-30"
+
+    def test_should_reject_batch_with_unknown_currency(self):
+        items = [{"amount": 1, "from": "EUR", "to": "USD"}, {"amount": 1, "from": "XYZ", "to": "USD"}]
+
+        response = client.post("/convert/batch", json={"items": items})
+
+        assert response.status_code == 422
+        assert "Pozycja 1" in response.json()["detail"]
+
+class TestHistoryAPI:
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        Base.metadata.create_all(bind=engine)
+        db = TestingSessionLocal()
+        eur = models.Currency(code="EUR", name="Euro")
+        db.add(eur)
+        db.flush()
+        # Weekdays from Thu 2026-01-29 to Tue 2026-02-03.
+        for day, rate in [(29, 4.20), (30, 4.30)]:
+            db.add(models.Rate(currency_id=eur.id, date=date(2026, 1, day), rate=rate))
+        for day, rate in [(2, 4.10), (3, 4.50)]:
+            db.add(models.Rate(currency_id=eur.id, date=date(2026, 2, day), rate=rate))
+        db.commit()
+        db.close()
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_return_daily_history_in_range(self):
+        response = client.get("/currencies/eur/history", params={"start": "2026-01-30", "end": "2026-02-02"})
+
+        assert response.status_code == 200
+        points = response.json()["points"]
+        assert [p["date"] for p in points] == ["2026-01-30", "2026-02-02"]
+        assert points[0]["close"] == 4.30
+
+    def test_should_aggregate_history_by_week(self):
+        response = client.get("/currencies/EUR/history", params={"interval": "week"})
+
+        points = response.json()["points"]
+        assert [p["date"] for p in points] == ["2026-01-26", "2026-02-02"]
+        assert points[0] == {"date": "2026-01-26", "open": 4.20, "close": 4.30, "low": 4.20,
+                             "high": 4.30, "avg": pytest.approx(4.25), "count": 2}
+        assert points[1]["open"] == 4.10 and points[1]["close"] == 4.50
+
+    def test_should_aggregate_history_by_month(self):
+        response = client.get("/currencies/EUR/history", params={"interval": "month"})
+
+        points = response.json()["points"]
+        assert [(p["date"], p["count"], p["high"]) for p in points] == [("2026-01-01", 2, 4.30), ("2026-02-01", 2, 4.50)]
+
+    def test_should_return_not_found_for_unknown_currency(self):
+        assert client.get("/currencies/XYZ/history").status_code == 404
+
+class TestAsOfLookup:
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        Base.metadata.create_all(bind=engine)
+        rate_cache.clear()
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def save_friday_table(self):
+        from nbp_service import RateRecord, save_rates
+
+        db = TestingSessionLocal()
+        save_rates(db, [RateRecord(date(2026, 1, 30), "EUR", "Euro", 4.25)])
+        db.close()
+
+    def test_should_resolve_weekend_to_latest_published_table(self):
+        self.save_friday_table()
+
+        response = client.get("/currencies/2026-02-01", params={"as_of": True})
+
+        assert response.status_code == 200
+        assert response.headers["X-Rates-Date"] == "2026-01-30"
+        assert response.json()[0]["date"] == "2026-01-30"
+
+    def test_should_keep_exact_lookup_by_default(self):
+        self.save_friday_table()
+
+        response = client.get("/currencies/2026-02-01")
+
+        assert response.json() == []
+
+    def test_should_not_ask_nbp_again_for_confirmed_empty_date(self, mocker):
+        mock_fetch = mocker.patch("nbp_service.fetch_exchange_rates", return_value=[])
+
+        first = client.post("/currencies/fetch", params={"date": "2026-02-01"})
+        second = client.post("/currencies/fetch", params={"date": "2026-02-01"})
+
+        assert first.status_code == second.status_code == 404
+        assert mock_fetch.call_count == 1
+
+class TestReadThroughFetch:
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        Base.metadata.create_all(bind=engine)
+        rate_cache.clear()
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_fetch_missing_table_from_nbp_on_read(self, mocker):
+        mocker.patch("nbp_service.fetch_exchange_rates", return_value=[{
+            "effectiveDate": "2026-01-30",
+            "rates": [{"currency": "euro", "code": "EUR", "mid": 4.25}]
+        }])
+
+        response = client.get("/currencies/2026-01-30", params={"fetch": True})
+
+        assert response.status_code == 200
+        assert response.json()[0]["currency"]["code"] == "EUR"
+
+    def test_should_recover_table_cached_empty_before_it_was_visible(self, mocker):
+        from nbp_service import RateRecord, save_rates
+
+        assert client.get("/currencies/2026-01-30").json() == []
+        # Saved by another process whose invalidation was missed, so the empty entry stays cached.
+        db = TestingSessionLocal()
+        save_rates(db, [RateRecord(date(2026, 1, 30), "EUR", "euro", 4.25)])
+        db.close()
+        rate_cache.put(rates_key(date(2026, 1, 30)), encode_response([]))
+        mocker.patch("nbp_service.fetch_exchange_rates", return_value=[{
+            "effectiveDate": "2026-01-30",
+            "rates": [{"currency": "euro", "code": "EUR", "mid": 4.25}]
+        }])
+
+        response = client.get("/currencies/2026-01-30", params={"fetch": True})
+
+        assert [r["rate"] for r in response.json()] == [4.25]
+        assert [r["rate"] for r in client.get("/currencies/2026-01-30").json()] == [4.25]
+
+    def test_should_not_fetch_without_flag(self, mocker):
+        mock_fetch = mocker.patch("nbp_service.fetch_exchange_rates")
+
+        assert client.get("/currencies/2026-01-30").json() == []
+        mock_fetch.assert_not_called()
+
+    def test_should_coalesce_concurrent_misses_into_one_nbp_request(self, mocker):
+        import asyncio
+
+        import httpx
+        from main import nbp_fetch_flight
+
+        async def slow_fetch(target_date, client=None):
+            await asyncio.sleep(0.2)
+            return [{"effectiveDate": "2026-01-30", "rates": [{"currency": "euro", "code": "EUR", "mid": 4.25}]}]
+
+        mock_fetch = mocker.patch("nbp_service.fetch_exchange_rates", side_effect=slow_fetch)
+        coalesced_before = nbp_fetch_flight.coalesced
+
+        async def fetch_concurrently():
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                return await asyncio.gather(*[
+                    async_client.get("/currencies/2026-01-30", params={"fetch": True}) for _ in range(5)
+                ])
+
+        responses = asyncio.run(fetch_concurrently())
+
+        assert mock_fetch.call_count == 1
+        assert all(len(r.json()) == 1 for r in responses)
+        assert nbp_fetch_flight.coalesced - coalesced_before == 4
+        stats = client.get("/stats").json()
+        assert stats["nbp_fetch"]["in_flight"] == 0
+        assert "primary" in stats["db_pool"]
+
+class TestExportAPI:
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        Base.metadata.create_all(bind=engine)
+        db = TestingSessionLocal()
+        eur = models.Currency(code="EUR", name="Euro")
+        usd = models.Currency(code="USD", name="US Dollar")
+        db.add_all([eur, usd])
+        db.flush()
+        for day in (28, 29, 30):
+            db.add(models.Rate(currency_id=eur.id, date=date(2026, 1, day), rate=4.0 + day / 100))
+            db.add(models.Rate(currency_id=usd.id, date=date(2026, 1, day), rate=3.0 + day / 100))
+        db.commit()
+        db.close()
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_stream_ndjson_filtered_by_range_and_codes(self):
+        import json
+
+        response = client.get("/rates/export", params={"start": "2026-01-29", "codes": "eur"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert rows == [
+            {"date": "2026-01-29", "code": "EUR", "name": "Euro", "rate": 4.29},
+            {"date": "2026-01-30", "code": "EUR", "name": "Euro", "rate": 4.30},
+        ]
+
+    def test_should_stream_csv_with_header_across_batches(self):
+        from rate_export import stream_rates
+
+        body = b"".join(stream_rates(engine, "csv", batch_size=4)).decode()
+
+        lines = body.splitlines()
+        assert lines[0] == "date,code,name,rate"
+        assert len(lines) == 7
+        assert lines[1] == "2026-01-28,EUR,Euro,4.28"
+        assert lines[-1] == "2026-01-30,USD,US Dollar,3.3"
+
+    def test_should_release_connection_when_client_disconnects_mid_stream(self, mocker):
+        import asyncio
+
+        import main
+        from rate_export import stream_rates
+
+        # Keep a reference to the generator so that garbage collection cannot close it instead of the endpoint.
+        generators = []
+        mocker.patch.object(main, "stream_rates", side_effect=lambda *args: generators.append(stream_rates(*args)) or generators[-1])
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": "/rates/export", "raw_path": b"/rates/export", "root_path": "", "query_string": b"format=csv",
+            "headers": [(b"host", b"test")], "client": ("test", 1), "server": ("test", 80)
+        }
+
+        async def run():
+            body_sent = asyncio.Event()
+            requested = False
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                await body_sent.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                if message["type"] == "http.response.body":
+                    body_sent.set()
+                    # The client is gone: the send never completes and the stream gets cancelled.
+                    await asyncio.Event().wait()
+
+            await app(scope, receive, send)
+
+        asyncio.run(asyncio.wait_for(run(), timeout=10))
+
+        assert generators and generators[0].gi_frame is None
+        assert engine.pool.checkedout() == 0
+
+class TestSnapshotReads:
+    @pytest.fixture(autouse=True)
+    def setup_db(self, tmp_path, monkeypatch):
+        from nbp_service import RateRecord, save_rates
+        from rate_snapshot import snapshot_store
+
+        self.snapshot_path = str(tmp_path / "rates.snapshot")
+        monkeypatch.setattr(snapshot_store, "path", self.snapshot_path)
+        snapshot_store.invalidate()
+        Base.metadata.create_all(bind=engine)
+        rate_cache.clear()
+        db = TestingSessionLocal()
+        save_rates(db, [
+            RateRecord(date(2026, 1, 29), "EUR", "Euro", 4.20),
+            RateRecord(date(2026, 1, 29), "USD", "US Dollar", 4.00),
+        ])
+        save_rates(db, [
+            RateRecord(date(2026, 1, 30), "EUR", "Euro", 4.40),
+            RateRecord(date(2026, 2, 2), "EUR", "Euro", 4.30),
+        ])
+        # Zeroing rates keeps the snapshot version valid, so non-zero values below can only come from the snapshot.
+        db.execute(update(models.Rate).values(rate=0))
+        db.commit()
+        db.close()
+        rate_cache.clear()
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_serve_rates_for_date_from_snapshot(self):
+        response = client.get("/currencies/2026-01-29")
+
+        assert response.status_code == 200
+        assert [(r["currency"]["code"], r["rate"]) for r in response.json()] == [("EUR", 4.20), ("USD", 4.00)]
+
+    def test_should_serve_history_from_snapshot(self):
+        response = client.get("/currencies/EUR/history", params={"interval": "week"})
+
+        points = response.json()["points"]
+        assert [(p["date"], p["open"], p["close"], p["count"]) for p in points] == [
+            ("2026-01-26", 4.20, 4.40, 2), ("2026-02-02", 4.30, 4.30, 1)
+        ]
+
+    def test_should_serve_conversion_from_snapshot(self):
+        response = client.get("/convert", params={"from": "EUR", "to": "USD", "amount": 100, "date": "2026-01-29"})
+
+        assert response.json()["result"] == pytest.approx(105.0)
+
+    def test_should_serve_rate_matrix_from_snapshot(self):
+        response = client.get("/rates", params={"start": "2026-01-28", "end": "2026-02-02", "codes": "USD,EUR"})
+
+        assert response.json() == {
+            "dates": ["2026-01-29", "2026-01-30", "2026-02-02"],
+            "codes": ["USD", "EUR"],
+            "values": [[4.00, 4.20], [None, 4.40], [None, 4.30]]
+        }
+
+    def test_should_fall_back_to_database_when_snapshot_is_behind(self, monkeypatch):
+        from nbp_service import RateRecord, save_rates
+        from rate_snapshot import snapshot_store
+
+        # A writer without the snapshot enabled (e.g. the CLI backfill) leaves the file behind the database.
+        monkeypatch.setattr(snapshot_store, "path", "")
+        db = TestingSessionLocal()
+        save_rates(db, [RateRecord(date(2026, 1, 29), "CHF", "Swiss Franc", 4.60)])
+        db.close()
+        monkeypatch.setattr(snapshot_store, "path", self.snapshot_path)
+        snapshot_store.invalidate()
+
+        response = client.get("/currencies/2026-01-29")
+
+        assert [(r["currency"]["code"], r["rate"]) for r in response.json()] == [("CHF", 4.60), ("EUR", 0.0), ("USD", 0.0)]
+
+    def test_should_load_snapshot_off_the_event_loop_for_concurrent_cold_requests(self, monkeypatch):
+        import asyncio
+        import threading
+
+        import httpx
+        from rate_snapshot import RateSnapshot, snapshot_store
+
+        monkeypatch.setattr(snapshot_store, "_identity", None)
+        loader_threads = []
+        original_init = RateSnapshot.__init__
+
+        def init(snapshot, path):
+            loader_threads.append(threading.current_thread())
+            original_init(snapshot, path)
+
+        monkeypatch.setattr(RateSnapshot, "__init__", init)
+        responses = []
+
+        async def request_concurrently():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+                responses.extend(await asyncio.gather(
+                    async_client.get("/currencies/2026-01-29"),
+                    async_client.get("/rates", params={"start": "2026-01-29", "end": "2026-01-30", "codes": "EUR"}),
+                    async_client.get("/currencies/EUR/history"),
+                    async_client.get("/convert", params={"from": "EUR", "to": "USD", "date": "2026-01-29"})
+                ))
+
+        worker = threading.Thread(target=asyncio.run, args=(request_concurrently(),), daemon=True)
+        worker.start()
+        worker.join(timeout=10)
+
+        assert not worker.is_alive(), "concurrent cold snapshot reads blocked the event loop"
+        assert [r.status_code for r in responses] == [200, 200, 200, 200]
+        assert responses[1].json()["values"] == [[4.20], [4.40]]
+        # The mmap file is loaded in the thread pool, never on the thread running the event loop.
+        assert loader_threads and worker not in loader_threads
+
+class TestMetricsAPI:
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        Base.metadata.create_all(bind=engine)
+        rate_cache.clear()
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_record_latency_and_sql_per_route_template(self):
+        from metrics import HTTP_REQUEST_DB_STATEMENTS, HTTP_REQUEST_DURATION
+
+        route = "/currencies/{date}"
+        requests_before = HTTP_REQUEST_DURATION.count(method="GET", route=route, status="200")
+        client.get("/currencies/2026-01-29")
+        client.get("/currencies/2026-01-30")
+
+        assert HTTP_REQUEST_DURATION.count(method="GET", route=route, status="200") - requests_before == 2
+        body = client.get("/metrics").text
+        assert 'http_request_duration_seconds_count{method="GET",route="/currencies/{date}",status="200"}' in body
+        assert 'http_request_db_statements_bucket{route="/currencies/{date}",le="+Inf"}' in body
+        assert "rate_cache_hit_ratio" in body
+        assert HTTP_REQUEST_DB_STATEMENTS.count(route=route) >= 2
+
+class TestLatestRates:
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        Base.metadata.create_all(bind=engine)
+        rate_cache.clear()
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def save(self, records):
+        from nbp_service import save_rates
+
+        db = TestingSessionLocal()
+        save_rates(db, records)
+        db.close()
+
+    def test_should_return_newest_rate_per_currency(self):
+        from nbp_service import RateRecord
+
+        self.save([
+            RateRecord(date(2026, 1, 29), "EUR", "Euro", 4.20),
+            RateRecord(date(2026, 1, 30), "EUR", "Euro", 4.25),
+            RateRecord(date(2026, 1, 29), "XYZ", "Test", 0.17)
+        ])
+        # An older table loaded later (e.g. by a backfill) must not replace newer rates.
+        self.save([RateRecord(date(2026, 1, 2), "EUR", "Euro", 4.10)])
+
+        response = client.get("/currencies/latest")
+
+        assert response.status_code == 200
+        assert [(r["currency"]["code"], r["date"], r["rate"]) for r in response.json()] == [
+            ("EUR", "2026-01-30", 4.25),
+            ("XYZ", "2026-01-29", 0.17)
+        ]
+
+    def test_should_refresh_cached_latest_rates_after_save(self):
+        from nbp_service import RateRecord
+
+        self.save([RateRecord(date(2026, 1, 29), "EUR", "Euro", 4.20)])
+        first = client.get("/currencies/latest")
+        self.save([RateRecord(date(2026, 1, 30), "EUR", "Euro", 4.25)])
+
+        response = client.get("/currencies/latest", headers={"If-None-Match": first.headers["ETag"]})
+
+        assert response.status_code == 200
+        assert response.json()[0]["date"] == "2026-01-30"
+
+class TestResponseShapes:
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        Base.metadata.create_all(bind=engine)
+        rate_cache.clear()
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def save(self, records):
+        from nbp_service import save_rates
+
+        db = TestingSessionLocal()
+        save_rates(db, records)
+        db.close()
+
+    def test_should_return_rates_table_in_columnar_shape(self):
+        from nbp_service import RateRecord
+
+        self.save([
+            RateRecord(date(2026, 1, 29), "USD", "Dolar", 4.05),
+            RateRecord(date(2026, 1, 29), "EUR", "Euro", 4.20)
+        ])
+
+        rows = client.get("/currencies/2026-01-29")
+        columns = client.get("/currencies/2026-01-29?shape=columns")
+
+        assert columns.status_code == 200
+        assert columns.json() == {
+            "date": "2026-01-29", "codes": ["EUR", "USD"], "names": ["Euro", "Dolar"], "rates": [4.20, 4.05]
+        }
+        # Both shapes are cached separately, each with its own ETag.
+        assert rows.headers["ETag"] != columns.headers["ETag"]
+        assert columns.headers["Cache-Control"] == "public, max-age=86400"
+
+    def test_should_treat_empty_columnar_table_as_unpublished(self):
+        response = client.get("/currencies/2026-01-29?shape=columns")
+
+        assert response.json()["codes"] == []
+        assert response.headers["Cache-Control"] == "no-cache"
+
+    def test_should_return_latest_rates_in_columnar_shape(self):
+        from nbp_service import RateRecord
+
+        self.save([
+            RateRecord(date(2026, 1, 29), "EUR", "Euro", 4.20),
+            RateRecord(date(2026, 1, 30), "EUR", "Euro", 4.25),
+            RateRecord(date(2026, 1, 29), "XYZ", "Test", 0.17)
+        ])
+
+        response = client.get("/currencies/latest?shape=columns")
+
+        assert response.json() == {
+            "codes": ["EUR", "XYZ"], "names": ["Euro", "Test"],
+            "dates": ["2026-01-30", "2026-01-29"], "rates": [4.25, 0.17]
+        }
+
+    def test_should_compress_large_tables_and_revalidate_weak_etag(self):
+        from nbp_service import RateRecord
+
+        self.save([RateRecord(date(2026, 1, 29), f"C{i:02d}", f"Waluta {i}", 1.0 + i) for i in range(40)])
+
+        response = client.get("/currencies/2026-01-29", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert response.headers["ETag"].startswith('W/"')
+        assert len(response.json()) == 40
+
+        revalidated = client.get(
+            "/currencies/2026-01-29",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]}
+        )
+        assert revalidated.status_code == 304
+
+class TestAnalyticsAPI:
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        from analytics import analytics_store
+        from nbp_service import RateRecord, save_rates
+
+        Base.metadata.create_all(bind=engine)
+        rate_cache.clear()
+        analytics_store.invalidate()
+        db = TestingSessionLocal()
+        save_rates(db, [
+            RateRecord(date(2026, 1, day), code, code, rate * (1 + 0.01 * (day % 3)) * (1 if code == "EUR" else 1 + 0.005 * (day % 2)))
+            for day in range(5, 15) for code, rate in (("EUR", 4.2), ("USD", 4.0))
+        ])
+        db.close()
+        yield
+        analytics_store.invalidate()
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_return_rolling_statistics(self):
+        response = client.get("/analytics/rolling?code=eur&window=3&start=2026-01-06")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["code"] == "EUR"
+        assert data["dates"][0] == "2026-01-06"
+        assert data["mean"][0] is None
+        assert data["mean"][1] == pytest.approx((4.2 * 1.02 + 4.2 + 4.2 * 1.01) / 3)
+        assert data["volatility"][1] > 0
+
+    def test_should_return_correlation_matrix(self):
+        response = client.get("/analytics/correlation?codes=USD,EUR")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["codes"] == ["USD", "EUR"]
+        assert data["observations"] == 10
+        assert data["matrix"][0][0] == pytest.approx(1.0)
+        assert data["matrix"][0][1] == pytest.approx(data["matrix"][1][0])
+
+    def test_should_build_analytics_once_for_concurrent_cold_requests(self, mocker):
+        import asyncio
+        import threading
+
+        import httpx
+        from analytics import RateAnalytics
+
+        build = mocker.spy(RateAnalytics, "from_rows")
+        responses = []
+
+        async def request_concurrently():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+                responses.extend(await asyncio.gather(*[
+                    async_client.get("/analytics/correlation", params={"codes": "EUR,USD"}) for _ in range(3)
+                ]))
+
+        # A lock held across awaited I/O blocks the whole event loop, so the timeout must live outside it.
+        worker = threading.Thread(target=asyncio.run, args=(request_concurrently(),), daemon=True)
+        worker.start()
+        worker.join(timeout=10)
+
+        assert not worker.is_alive(), "concurrent cold analytics requests deadlocked the event loop"
+        assert [r.status_code for r in responses] == [200, 200, 200]
+        assert build.call_count == 1
+
+    def test_should_return_404_for_unknown_currency(self):
+        assert client.get("/analytics/rolling?code=XYZ").status_code == 404
+        assert client.get("/analytics/correlation?codes=EUR,XYZ").status_code == 404
+
+class TestRateMatrixAPI:
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        from nbp_service import RateRecord, save_rates
+
+        Base.metadata.create_all(bind=engine)
+        rate_cache.clear()
+        db = TestingSessionLocal()
+        save_rates(db, [
+            RateRecord(date(2026, 1, 29), "EUR", "Euro", 4.20),
+            RateRecord(date(2026, 1, 29), "USD", "US Dollar", 4.00),
+            RateRecord(date(2026, 1, 30), "EUR", "Euro", 4.40),
+            RateRecord(date(2026, 2, 2), "CHF", "Frank", 4.60)
+        ])
+        db.close()
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_return_selected_codes_as_matrix(self):
+        response = client.get("/rates", params={"start": "2026-01-29", "end": "2026-01-31", "codes": "usd,EUR"})
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "dates": ["2026-01-29", "2026-01-30"],
+            "codes": ["USD", "EUR"],
+            "values": [[4.00, 4.20], [None, 4.40]]
+        }
+
+    def test_should_return_all_quoted_codes_when_none_given(self):
+        response = client.get("/rates", params={"start": "2026-01-30", "end": "2026-02-02"})
+
+        assert response.json()["codes"] == ["CHF", "EUR"]
+        assert response.json()["values"] == [[None, 4.40], [4.60, None]]
+
+    def test_should_accept_codes_in_request_body(self):
+        response = client.post("/rates", json={"start": "2026-01-29", "end": "2026-02-02", "codes": ["CHF", "USD"]})
+
+        assert response.json()["dates"] == ["2026-01-29", "2026-02-02"]
+        assert response.json()["values"] == [[None, 4.00], [4.60, None]]
+
+    def test_should_reject_unknown_codes_and_reversed_range(self):
+        unknown = client.get("/rates", params={"start": "2026-01-29", "end": "2026-01-30", "codes": "EUR,XYZ"})
+        reversed_range = client.get("/rates", params={"start": "2026-01-30", "end": "2026-01-29"})
+
+        assert unknown.status_code == 404
+        assert "XYZ" in unknown.json()["detail"]
+        assert reversed_range.status_code == 422
+
+    def test_should_build_matrix_with_single_query(self):
+        statements = []
+        listener = lambda conn, cursor, statement, params, context, executemany: statements.append(statement)
+        event.listen(async_engine.sync_engine, "before_cursor_execute", listener)
+        try:
+            response = client.get("/rates", params={"start": "2026-01-29", "end": "2026-01-30", "codes": "USD,CHF"})
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", listener)
+
+        # CHF exists but has no rates in the range, so it is a known code with an empty column.
+        assert response.json()["values"] == [[4.00, None]]
+        assert len(statements) == 1
+
+class TestFetchJobsAPI:
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        Base.metadata.create_all(bind=engine)
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_create_pending_job_and_report_its_state(self):
+        response = client.post("/jobs/fetch", json={"start": "2026-01-01", "end": "2026-01-31"})
+
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == "pending"
+        assert (job["days_total"], job["days_done"], job["rows_added"]) == (31, 0, 0)
+
+        status = client.get(f"/jobs/{job['id']}")
+        assert status.status_code == 200
+        assert status.json()["start_date"] == "2026-01-01"
+
+    def test_should_submit_new_jobs_to_runner_and_deduplicate_pending_ones(self, mocker):
+        runner = mocker.Mock()
+        mocker.patch.object(app.state, "job_runner", runner, create=True)
+
+        first = client.post("/jobs/fetch", json={"date": "2026-01-30"}).json()
+        second = client.post("/jobs/fetch", json={"date": "2026-01-30"}).json()
+
+        assert second["id"] == first["id"]
+        runner.submit.assert_called_once_with(first["id"])
+
+    @pytest.mark.parametrize("body", [
+        {"date": "2026-01-30", "start": "2026-01-01"},
+        {"start": "2026-01-01"},
+        {"start": "2026-01-31", "end": "2026-01-01"},
+        {"start": "2001-01-01", "end": "2001-01-31"},
+    ])
+    def test_should_reject_invalid_ranges(self, body):
+        assert client.post("/jobs/fetch", json=body).status_code == 422
+
+    def test_should_return_404_for_unknown_job(self):
+        assert client.get("/jobs/999").status_code == 404
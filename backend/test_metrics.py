@@ -0,0 +1,90 @@
+import json
+import os
+import time
+
+import pytest
+from metrics import (
+    REGISTRY,
+    Counter,
+    GaugeCallback,
+    Histogram,
+    SamplingProfiler,
+    mark_process_dead,
+    render_metrics,
+    write_metrics_state
+)
+
+
+@pytest.fixture
+def registry():
+    size = len(REGISTRY)
+    yield
+    del REGISTRY[size:]
+
+
+class TestPrometheusFormat:
+    def test_should_render_cumulative_histogram_buckets(self, registry):
+        histogram = Histogram("test_latency_seconds", "Test latency.", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, route="/x")
+
+        lines = render_metrics().splitlines()
+
+        assert "# TYPE test_latency_seconds histogram" in lines
+        assert 'test_latency_seconds_bucket{route="/x",le="0.1"} 1' in lines
+        assert 'test_latency_seconds_bucket{route="/x",le="1"} 2' in lines
+        assert 'test_latency_seconds_bucket{route="/x",le="+Inf"} 3' in lines
+        assert 'test_latency_seconds_sum{route="/x"} 5.55' in lines
+        assert 'test_latency_seconds_count{route="/x"} 3' in lines
+
+    def test_should_escape_label_values(self, registry):
+        counter = Counter("test_requests_total", "Test requests.", ("path",))
+        counter.inc(path='a"b')
+
+        assert 'test_requests_total{path="a\\"b"} 1' in render_metrics()
+
+
+class TestWorkerAggregation:
+    def test_should_sum_counters_and_histograms_of_all_workers(self, registry, tmp_path):
+        counter = Counter("test_requests_total", "Test requests.", ("route",))
+        histogram = Histogram("test_latency_seconds", "Test latency.", buckets=(0.1, 1.0))
+        GaugeCallback("test_pool_checked_out", "Test pool.", lambda: 2)
+        counter.inc(route="/x")
+        histogram.observe(0.05)
+        # Another worker that wrote the same state.
+        write_metrics_state(str(tmp_path))
+        os.replace(tmp_path / f"metrics_{os.getpid()}.json", tmp_path / "metrics_99999.json")
+        counter.inc(route="/x")
+
+        lines = render_metrics(str(tmp_path)).splitlines()
+
+        assert 'test_requests_total{route="/x"} 3' in lines
+        assert 'test_latency_seconds_bucket{le="0.1"} 2' in lines
+        assert 'test_latency_seconds_count 2' in lines
+        assert f'test_pool_checked_out{{pid="{os.getpid()}"}} 2' in lines
+        assert 'test_pool_checked_out{pid="99999"} 2' in lines
+
+    def test_should_keep_counters_but_drop_gauges_of_exited_worker(self, registry, tmp_path):
+        Counter("test_requests_total", "Test requests.").inc()
+        GaugeCallback("test_pool_checked_out", "Test pool.", lambda: 2)
+        write_metrics_state(str(tmp_path))
+        os.replace(tmp_path / f"metrics_{os.getpid()}.json", tmp_path / "metrics_99999.json")
+
+        mark_process_dead(99999, str(tmp_path))
+
+        state = json.loads((tmp_path / "metrics_99999.json").read_text())
+        assert "test_pool_checked_out" not in state
+        assert "test_requests_total 2" in render_metrics(str(tmp_path)).splitlines()
+
+
+class TestSamplingProfiler:
+    def test_should_collect_stacks_of_busy_threads(self):
+        def busy_wait():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+
+        with SamplingProfiler(interval=0.001) as profiler:
+            busy_wait()
+
+        assert "busy_wait" in profiler.report()
@@ -1,6 +1,9 @@
 from datetime import date
 
 import pytest
+import sqlalchemy as sa
+from alembic.config import Config
+from alembic.script import ScriptDirectory
 from database import Base
 from models import Currency, Rate
 from sqlalchemy import create_engine
@@ -74,3 +77,47 @@ class TestModels:
         assert len(currency.rates) == 2
         assert currency.rates[0].rate == 5.01
         assert currency.rates[1].rate == 5.05
+
+class PrimaryKeyRecorder:
+    """
+    Stands in for alembic.op and records the primary key of every table the migrations create.
+    Raw SQL and the remaining operations are ignored.
+    """
+
+    def __init__(self):
+        self.primary_keys = {}
+
+    def f(self, name):
+        return name
+
+    def create_table(self, name, *elements, **kwargs):
+        table = sa.Table(name, sa.MetaData(), *elements)
+        self.primary_keys[name] = [column.name for column in table.primary_key.columns]
+
+    def create_primary_key(self, constraint_name, table_name, columns, **kwargs):
+        self.primary_keys[table_name] = list(columns)
+
+    def drop_table(self, name, **kwargs):
+        self.primary_keys.pop(name, None)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+class TestMigrations:
+    def test_should_declare_the_primary_keys_created_by_migrations(self, monkeypatch):
+        """
+        Test verifying that create_all and the migrations agree on every table's primary key
+        (e.g. the (id, date) key of the partitioned rates table).
+        """
+        recorder = PrimaryKeyRecorder()
+        script = ScriptDirectory.from_config(Config("alembic.ini"))
+        for revision in reversed(list(script.walk_revisions())):
+            monkeypatch.setattr(revision.module, "op", recorder)
+            revision.module.upgrade()
+
+        declared = {
+            name: [column.name for column in table.primary_key.columns]
+            for name, table in Base.metadata.tables.items()
+        }
+        assert recorder.primary_keys == declared
+        assert declared["rates"] == ["id", "date"]
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import nbp_client
+import pytest
+from database import Base, get_async_db
+from fastapi.testclient import TestClient
+from main import app
+from nbp_client import NBPClient, NBPClientError
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+TABLE = [{
+    "table": "A",
+    "no": "020/A/NBP/2026",
+    "effectiveDate": "2026-01-30",
+    "rates": [{"currency": "euro", "code": "EUR", "mid": 4.21}]
+}]
+
+class StubNBPHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        self.server.requests.append(path)
+        script = self.server.routes.get(path, [(404, None, 0)])
+        status, body, delay = script.pop(0) if len(script) > 1 else script[0]
+        if delay:
+            time.sleep(delay)
+        if isinstance(body, bytes):
+            payload = body
+        else:
+            payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub_nbp():
+    """
+    Starts a local HTTP server imitating the NBP API.
+    `routes` maps a path to a list of (status, body, delay) responses served in order;
+    a bytes body is sent as is.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubNBPHandler)
+    server.routes = {}
+    server.requests = []
+    server.base_url = f"http://127.0.0.1:{server.server_port}/api/exchangerates/tables/a/"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def get_tables(base_url, path, **kwargs):
+    async def run():
+        client = NBPClient(base_url=base_url, backoff_base=0.001, **kwargs)
+        try:
+            return await client.get_tables(path)
+        finally:
+            await client.aclose()
+    return asyncio.run(run())
+
+class TestNBPClient:
+    def test_should_return_tables_from_nbp(self, stub_nbp):
+        stub_nbp.routes["/api/exchangerates/tables/a/2026-01-30/"] = [(200, TABLE, 0)]
+
+        assert get_tables(stub_nbp.base_url, "2026-01-30/") == TABLE
+
+    def test_should_return_empty_list_when_nbp_has_no_table(self, stub_nbp):
+        assert get_tables(stub_nbp.base_url, "2026-02-01/") == []
+
+    def test_should_retry_server_errors_until_success(self, stub_nbp):
+        stub_nbp.routes["/api/exchangerates/tables/a/"] = [(503, None, 0), (500, None, 0), (200, TABLE, 0)]
+
+        assert get_tables(stub_nbp.base_url, "") == TABLE
+        assert len(stub_nbp.requests) == 3
+
+    def test_should_retry_timeouts(self, stub_nbp):
+        stub_nbp.routes["/api/exchangerates/tables/a/"] = [(200, TABLE, 0.5), (200, TABLE, 0)]
+
+        assert get_tables(stub_nbp.base_url, "", read_timeout=0.1) == TABLE
+        assert len(stub_nbp.requests) == 2
+
+    def test_should_retry_malformed_json_body(self, stub_nbp):
+        stub_nbp.routes["/api/exchangerates/tables/a/"] = [(200, b'[{"table": "A"', 0), (200, TABLE, 0)]
+
+        assert get_tables(stub_nbp.base_url, "") == TABLE
+        assert len(stub_nbp.requests) == 2
+
+    def test_should_raise_client_error_when_body_stays_malformed(self, stub_nbp):
+        stub_nbp.routes["/api/exchangerates/tables/a/"] = [(200, b"<html>", 0)]
+
+        with pytest.raises(NBPClientError, match="JSON"):
+            get_tables(stub_nbp.base_url, "", max_retries=1)
+        assert len(stub_nbp.requests) == 2
+
+    def test_should_raise_after_exhausting_retries(self, stub_nbp):
+        stub_nbp.routes["/api/exchangerates/tables/a/"] = [(502, None, 0)]
+
+        with pytest.raises(NBPClientError):
+            get_tables(stub_nbp.base_url, "", max_retries=2)
+        assert len(stub_nbp.requests) == 3
+
+    def test_should_not_retry_client_errors(self, stub_nbp):
+        stub_nbp.routes["/api/exchangerates/tables/a/"] = [(400, None, 0)]
+
+        with pytest.raises(NBPClientError):
+            get_tables(stub_nbp.base_url, "")
+        assert len(stub_nbp.requests) == 1
+
+class TestResponseCache:
+    def test_should_serve_past_tables_and_missing_days_from_disk(self, stub_nbp, tmp_path):
+        stub_nbp.routes["/api/exchangerates/tables/a/2026-01-30/"] = [(200, TABLE, 0)]
+
+        for _ in range(2):
+            assert get_tables(stub_nbp.base_url, "2026-01-30/", cache_dir=str(tmp_path)) == TABLE
+            assert get_tables(stub_nbp.base_url, "2026-02-01/", cache_dir=str(tmp_path)) == []
+
+        assert len(stub_nbp.requests) == 2
+
+    def test_should_read_and_write_cache_files_off_the_event_loop(self, stub_nbp, tmp_path, mocker):
+        stub_nbp.routes["/api/exchangerates/tables/a/2026-01-30/"] = [(200, TABLE, 0)]
+        to_thread = mocker.spy(asyncio, "to_thread")
+
+        get_tables(stub_nbp.base_url, "2026-01-30/", cache_dir=str(tmp_path))
+
+        assert [call.args[0].__name__ for call in to_thread.call_args_list] == ["get", "put"]
+
+    def test_should_expire_only_responses_that_may_still_change(self, tmp_path):
+        from nbp_cache import NBPResponseCache
+
+        cache = NBPResponseCache(str(tmp_path), ttl=-1)
+        for url in ("https://nbp/a/", "https://nbp/a/2026-01-30/", "https://nbp/a/2026-01-01/9999-12-31/"):
+            cache.put(url, 200, TABLE)
+
+        assert cache.get("https://nbp/a/") is None
+        assert cache.get("https://nbp/a/2026-01-30/").tables == TABLE
+        assert cache.get("https://nbp/a/2026-01-01/9999-12-31/") is None
+
+    def test_should_not_contact_nbp_in_cache_only_mode(self, stub_nbp, tmp_path):
+        with pytest.raises(NBPClientError):
+            get_tables(stub_nbp.base_url, "2026-01-30/", cache_dir=str(tmp_path), cache_only=True)
+        assert stub_nbp.requests == []
+
+class TestFetchEndpointWithStubNBP:
+    @pytest.fixture(autouse=True)
+    def setup(self, stub_nbp, monkeypatch, tmp_path):
+        path = tmp_path / "rates.db"
+        Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+        SessionLocal = async_sessionmaker(
+            bind=create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool), expire_on_commit=False
+        )
+
+        async def override_get_async_db():
+            async with SessionLocal() as db:
+                yield db
+
+        monkeypatch.setitem(app.dependency_overrides, get_async_db, override_get_async_db)
+        monkeypatch.setattr(nbp_client, "NBPClient", lambda: NBPClient(base_url=stub_nbp.base_url, backoff_base=0.001))
+        asyncio.run(nbp_client.close_nbp_client())
+        yield
+
+    def test_should_store_rates_served_by_nbp(self, stub_nbp):
+        stub_nbp.routes["/api/exchangerates/tables/a/2026-01-30/"] = [(200, TABLE, 0)]
+
+        response = TestClient(app).post("/currencies/fetch?date=2026-01-30")
+
+        assert response.status_code == 200
+        assert "Dodano 1 nowych kursów" in response.json()["message"]
+
+    def test_should_return_bad_gateway_when_nbp_keeps_failing(self, stub_nbp):
+        stub_nbp.routes["/api/exchangerates/tables/a/"] = [(503, None, 0)]
+
+        response = TestClient(app).post("/currencies/fetch")
+
+        assert response.status_code == 502
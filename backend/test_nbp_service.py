@@ -0,0 +1,250 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+from database import Base
+from models import Currency, Rate, RatesVersion, TableCalendar
+from nbp_service import RateRecord, backfill, normalize_data, rebuild_from_cache, save_rates, split_date_range
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def make_rates(days, currencies):
+    return [
+        RateRecord(date(2026, 1, day + 1), f"C{i:02d}", f"currency {i}", 1.0 + i)
+        for day in range(days)
+        for i in range(currencies)
+    ]
+
+class TestSaveRates:
+    @pytest.fixture(scope="function")
+    def db_session(self):
+        Base.metadata.create_all(bind=engine)
+        session = TestingSessionLocal()
+        yield session
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_insert_currencies_and_rates_and_return_added_count(self, db_session):
+        added = save_rates(db_session, make_rates(days=3, currencies=4))
+
+        assert added == 12
+        assert db_session.query(Currency).count() == 4
+        assert db_session.query(Rate).count() == 12
+
+    def test_should_skip_existing_rates_and_count_only_new_ones(self, db_session):
+        save_rates(db_session, make_rates(days=2, currencies=3))
+
+        added = save_rates(db_session, make_rates(days=3, currencies=3))
+
+        assert added == 3
+        assert db_session.query(Rate).count() == 9
+        assert db_session.get(RatesVersion, 1).version == 9
+
+    def test_should_ignore_duplicates_within_one_batch(self, db_session):
+        rows = make_rates(days=1, currencies=2)
+
+        added = save_rates(db_session, rows + rows)
+
+        assert added == 2
+        assert db_session.query(Rate).count() == 2
+
+    def test_should_use_constant_number_of_statements(self, db_session):
+        statements = []
+        listener = lambda conn, cursor, statement, params, context, executemany: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            save_rates(db_session, make_rates(days=1, currencies=2))
+            small_batch = len(statements)
+            statements.clear()
+            save_rates(db_session, make_rates(days=20, currencies=30))
+            large_batch = len(statements)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+        assert large_batch == small_batch
+
+    def test_should_save_in_fixed_size_chunks_within_one_transaction(self, db_session):
+        rows = make_rates(days=5, currencies=3)
+
+        added = save_rates(db_session, iter(rows + rows), chunk_size=4)
+
+        assert added == 15
+        assert db_session.query(Rate).count() == 15
+        assert db_session.query(TableCalendar).count() == 5
+
+    def test_should_save_through_async_session(self, tmp_path):
+        from nbp_service import save_rates_async
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+        path = tmp_path / "rates.db"
+        Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+
+        async def save_twice():
+            try:
+                async with AsyncSession(bind=async_engine, autoflush=False) as db:
+                    first = await save_rates_async(db, make_rates(days=2, currencies=3))
+                    second = await save_rates_async(db, make_rates(days=3, currencies=3))
+                    stored = (await db.execute(select(func.count()).select_from(Rate))).scalar()
+                    return first, second, stored
+            finally:
+                await async_engine.dispose()
+
+        assert asyncio.run(save_twice()) == (6, 3, 9)
+
+    def test_should_update_snapshot_off_the_event_loop_when_saving_asynchronously(self, tmp_path, mocker):
+        from nbp_service import save_rates_async
+        from rate_snapshot import RateSnapshot, snapshot_store
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+        path = tmp_path / "rates.db"
+        Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        mocker.patch.object(snapshot_store, "path", str(tmp_path / "rates.snapshot"))
+        to_thread = mocker.spy(asyncio, "to_thread")
+
+        async def save_twice():
+            try:
+                async with AsyncSession(bind=async_engine, autoflush=False) as db:
+                    await save_rates_async(db, make_rates(days=2, currencies=3))
+                    await save_rates_async(db, make_rates(days=3, currencies=3))
+            finally:
+                await async_engine.dispose()
+
+        asyncio.run(save_twice())
+
+        snapshot = RateSnapshot(snapshot_store.path)
+        assert snapshot.version == 9
+        assert len(snapshot.table(date(2026, 1, 3))) == 3
+        assert {call.args[0].__name__ for call in to_thread.call_args_list} >= {"add", "needs_rebuild", "write_snapshot"}
+
+    def test_should_remove_snapshot_when_update_fails(self, db_session, mocker, tmp_path):
+        from rate_snapshot import snapshot_store
+
+        path = tmp_path / "rates.snapshot"
+        mocker.patch.object(snapshot_store, "path", str(path))
+        save_rates(db_session, make_rates(days=1, currencies=2))
+        assert path.exists()
+        mocker.patch("rate_snapshot._write", side_effect=OSError("disk full"))
+
+        added = save_rates(db_session, make_rates(days=2, currencies=2))
+
+        assert added == 2
+        assert not path.exists()
+
+    def test_should_apply_saved_rates_to_snapshot_and_analytics_in_date_batches(self, db_session, mocker, tmp_path):
+        from analytics import AnalyticsStore
+        from rate_snapshot import RateSnapshot, snapshot_store
+
+        path = tmp_path / "rates.snapshot"
+        mocker.patch.object(snapshot_store, "path", str(path))
+        store = AnalyticsStore()
+        mocker.patch("nbp_service.analytics_store", store)
+        save_rates(db_session, make_rates(days=1, currencies=3))
+        store.get(db_session)
+        mocker.patch("nbp_service.ADDED_RATES_DATES_PER_QUERY", 2)
+        extend = mocker.spy(store, "extend")
+
+        save_rates(db_session, make_rates(days=6, currencies=3))
+
+        # Five new days are read back two days at a time instead of being kept from the insert.
+        assert [len(call.args[0]) for call in extend.call_args_list] == [6, 6, 3]
+        assert len(store.get(db_session).ordinals) == 6
+        snapshot = RateSnapshot(str(path))
+        assert snapshot.version == 18
+        assert len(snapshot.table(date(2026, 1, 6))) == 3
+
+class TestNormalizeData:
+    def test_should_lazily_yield_records_with_interned_strings(self):
+        payload = [
+            {"effectiveDate": day, "rates": [{"currency": "euro", "code": "EUR", "mid": 4.2 + i}]}
+            for i, day in enumerate(["2026-01-29", "2026-01-30", "invalid"])
+        ]
+
+        records = normalize_data(payload)
+
+        assert not isinstance(records, list)
+        first, second = list(records)
+        assert first == RateRecord(date(2026, 1, 29), "EUR", "euro", 4.2)
+        assert second.date == date(2026, 1, 30)
+        assert first.code is second.code and first.name is second.name
+
+def fake_range_response(start, end, client=None):
+    tables = []
+    current = start
+    while current <= end:
+        if current.weekday() < 5:
+            tables.append({
+                "effectiveDate": current.isoformat(),
+                "rates": [{"currency": "euro", "code": "EUR", "mid": 4.3}]
+            })
+        current += timedelta(days=1)
+    return tables
+
+class TestBackfill:
+    @pytest.fixture(scope="function")
+    def db_session(self):
+        Base.metadata.create_all(bind=engine)
+        session = TestingSessionLocal()
+        yield session
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_split_range_into_windows_of_at_most_93_days(self):
+        windows = split_date_range(date(2024, 1, 1), date(2024, 12, 31))
+
+        assert windows[0] == (date(2024, 1, 1), date(2024, 4, 2))
+        assert windows[-1][1] == date(2024, 12, 31)
+        assert all((end - start).days < 93 for start, end in windows)
+        assert all(nxt[0] - prev[1] == timedelta(days=1) for prev, nxt in zip(windows, windows[1:]))
+
+    def test_should_load_every_window_into_database(self, db_session, mocker):
+        fetch = mocker.patch("nbp_service.fetch_exchange_rates_range", side_effect=fake_range_response)
+
+        added = asyncio.run(backfill(db_session, date(2024, 1, 1), date(2024, 6, 30), concurrency=2))
+
+        assert fetch.call_count == 2
+        assert added == db_session.query(Rate).count() == 130
+        assert db_session.query(TableCalendar).filter_by(has_table=True).count() == 130
+        assert db_session.query(TableCalendar).filter_by(has_table=False).count() == 52
+
+    def test_should_resume_from_checkpoint(self, db_session, mocker, tmp_path):
+        checkpoint = str(tmp_path / "checkpoint.json")
+        fetch = mocker.patch("nbp_service.fetch_exchange_rates_range", side_effect=fake_range_response)
+        asyncio.run(backfill(db_session, date(2024, 1, 1), date(2024, 4, 2), checkpoint_path=checkpoint))
+        fetch.reset_mock()
+
+        asyncio.run(backfill(db_session, date(2024, 1, 1), date(2024, 6, 30), checkpoint_path=checkpoint))
+
+        fetch.assert_called_once_with(date(2024, 4, 3), date(2024, 6, 30), client=None)
+
+    def test_should_not_skip_earlier_range_because_of_later_checkpoint(self, db_session, mocker, tmp_path):
+        checkpoint = str(tmp_path / "checkpoint.json")
+        mocker.patch("nbp_service.fetch_exchange_rates_range", side_effect=fake_range_response)
+        asyncio.run(backfill(db_session, date(2024, 1, 1), date(2024, 3, 1), checkpoint_path=checkpoint))
+
+        added = asyncio.run(backfill(db_session, date(2023, 1, 1), date(2023, 3, 1), checkpoint_path=checkpoint))
+
+        assert added == 43
+        assert db_session.query(Rate).filter(Rate.date < date(2024, 1, 1)).count() == 43
+
+    def test_should_rebuild_database_offline_from_response_cache(self, db_session, tmp_path):
+        from nbp_cache import NBPResponseCache
+
+        cache = NBPResponseCache(str(tmp_path))
+        cache.put("https://nbp/a/2024-01-01/2024-01-07/", 200, fake_range_response(date(2024, 1, 1), date(2024, 1, 7)))
+        cache.put("https://nbp/a/2024-01-13/", 404)
+
+        added = rebuild_from_cache(db_session, cache)
+
+        assert added == db_session.query(Rate).count() == 5
+        assert db_session.query(TableCalendar).filter_by(has_table=False).count() == 3
@@ -0,0 +1,117 @@
+from datetime import date
+
+import numpy as np
+import pytest
+from database import Base
+from models import Currency, Rate, RatesVersion
+from rate_snapshot import RateSnapshot, SnapshotStore, rebuild_snapshot, update_snapshot
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class TestRateSnapshot:
+    @pytest.fixture
+    def snapshot_path(self, tmp_path):
+        Base.metadata.create_all(bind=engine)
+        db = TestingSessionLocal()
+        eur = Currency(code="EUR", name="euro")
+        usd = Currency(code="USD", name="dolar amerykański")
+        db.add_all([eur, usd])
+        db.flush()
+        db.add_all([
+            Rate(currency_id=eur.id, date=date(2026, 1, 29), rate=4.20),
+            Rate(currency_id=usd.id, date=date(2026, 1, 29), rate=4.00),
+            Rate(currency_id=eur.id, date=date(2026, 1, 30), rate=4.30),
+            RatesVersion(id=1, version=3),
+        ])
+        db.commit()
+        db.close()
+        path = str(tmp_path / "rates.snapshot")
+        rebuild_snapshot(engine, path)
+        yield path
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_index_rates_by_date_and_code(self, snapshot_path):
+        snapshot = RateSnapshot(snapshot_path)
+
+        assert snapshot.codes == ["EUR", "USD"]
+        assert snapshot.first_date == date(2026, 1, 29)
+        assert snapshot.table(date(2026, 1, 30)) == [("EUR", "euro", 4.30)]
+        assert snapshot.table(date(2026, 2, 1)) == []
+        assert isinstance(snapshot.matrix, np.memmap)
+
+    def test_should_return_series_without_missing_days(self, snapshot_path):
+        ordinals, values = RateSnapshot(snapshot_path).series("USD")
+
+        assert [date.fromordinal(int(o)) for o in ordinals] == [date(2026, 1, 29)]
+        assert values.tolist() == [4.00]
+
+    def test_should_extend_dates_and_currencies_on_update(self, snapshot_path):
+        updated = update_snapshot(snapshot_path, [
+            (date(2026, 2, 2), "CHF", "frank szwajcarski", 4.60),
+            (date(2026, 1, 28), "EUR", "euro", 4.10),
+        ], 5)
+
+        assert updated
+        snapshot = RateSnapshot(snapshot_path)
+        assert snapshot.version == 5
+        assert snapshot.codes == ["CHF", "EUR", "USD"]
+        assert (snapshot.first_date, snapshot.last_date) == (date(2026, 1, 28), date(2026, 2, 2))
+        assert snapshot.table(date(2026, 1, 29)) == [("EUR", "euro", 4.20), ("USD", "dolar amerykański", 4.00)]
+        assert snapshot.latest_date() == date(2026, 2, 2)
+
+    def test_should_refuse_update_when_database_changed_behind_snapshot(self, snapshot_path):
+        # Two rows were written by another process, so one new row cannot lead from version 3 to 6.
+        updated = update_snapshot(snapshot_path, [(date(2026, 2, 2), "EUR", "euro", 4.40)], 6)
+
+        assert not updated
+        assert RateSnapshot(snapshot_path).version == 3
+
+    def test_should_ignore_snapshot_that_does_not_match_database(self, snapshot_path):
+        from nbp_service import RateRecord, save_rates
+
+        store = SnapshotStore(snapshot_path, verify_interval=3600)
+        db = TestingSessionLocal()
+        assert store.get(db) is not None
+
+        save_rates(db, [RateRecord(date(2026, 2, 2), "EUR", "euro", 4.40)])
+        assert store.get(db) is not None  # verified recently, no invalidation yet
+        store.invalidate()
+
+        assert store.get(db) is None
+        db.close()
+
+    def test_should_keep_serving_verified_snapshot_when_version_check_fails(self, snapshot_path, mocker):
+        from sqlalchemy.exc import OperationalError
+
+        store = SnapshotStore(snapshot_path, verify_interval=3600)
+        db = TestingSessionLocal()
+        verified = store.get(db)
+        mocker.patch("rate_snapshot.rates_version", side_effect=OperationalError("SELECT", {}, Exception("down")))
+        store.invalidate()
+
+        assert store.get(db) is verified
+        db.close()
+
+    def test_should_check_version_with_a_single_primary_key_lookup(self, snapshot_path):
+        statements = []
+        listener = lambda conn, cursor, statement, params, context, executemany: statements.append(statement)
+        store = SnapshotStore(snapshot_path)
+        db = TestingSessionLocal()
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            store.get(db)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+            db.close()
+
+        assert len(statements) == 1
+        assert "rates_version" in statements[0] and "count" not in statements[0].lower()
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+from database import Base
+from models import Currency, Rate
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from sync_worker import SYNC_POLL_INTERVAL, next_check_delay, sync_once
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+WARSAW = ZoneInfo("Europe/Warsaw")
+
+class TestSchedule:
+    def test_should_wait_for_publication_window(self):
+        now = datetime(2026, 2, 2, 9, 15, tzinfo=WARSAW)
+
+        assert next_check_delay(now, synced_today=False) == 3 * 3600
+
+    def test_should_check_immediately_inside_window_and_then_poll(self):
+        now = datetime(2026, 2, 2, 12, 30, tzinfo=WARSAW)
+
+        assert next_check_delay(now, synced_today=False) == 0.0
+        assert next_check_delay(now, synced_today=False, last_check=now) == SYNC_POLL_INTERVAL
+
+    def test_should_skip_to_next_business_day_after_sync_and_over_weekend(self):
+        friday = datetime(2026, 1, 30, 12, 30, tzinfo=WARSAW)
+        monday_publication = datetime(2026, 2, 2, 12, 15, tzinfo=WARSAW)
+
+        assert next_check_delay(friday, synced_today=True) == (monday_publication - friday).total_seconds()
+
+class TestSyncOnce:
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        Base.metadata.create_all(bind=engine)
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def test_should_fetch_only_dates_after_newest_stored_rate(self, mocker):
+        today = datetime.now(WARSAW).date()
+        latest = today - timedelta(days=5)
+        db = TestingSessionLocal()
+        eur = Currency(code="EUR", name="euro")
+        db.add(eur)
+        db.flush()
+        db.add(Rate(currency_id=eur.id, date=latest, rate=4.2))
+        db.commit()
+        db.close()
+        fetch = mocker.patch("nbp_service.fetch_exchange_rates_range", return_value=[{
+            "effectiveDate": (latest + timedelta(days=1)).isoformat(),
+            "rates": [{"currency": "euro", "code": "EUR", "mid": 4.3}]
+        }])
+
+        added = asyncio.run(sync_once(engine))
+
+        fetch.assert_called_once_with(latest + timedelta(days=1), today, client=None)
+        assert added == 1
+
+    def test_should_initialize_empty_database_with_current_table(self, mocker):
+        fetch = mocker.patch("nbp_service.fetch_exchange_rates", return_value=[{
+            "effectiveDate": "2026-01-30",
+            "rates": [{"currency": "euro", "code": "EUR", "mid": 4.3}]
+        }])
+
+        added = asyncio.run(sync_once(engine))
+
+        fetch.assert_called_once_with(None, client=None)
+        assert added == 1
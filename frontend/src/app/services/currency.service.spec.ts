@@ -1,6 +1,6 @@
 import { TestBed } from '@angular/core/testing';
 import { HttpClientTestingModule, HttpTestingController } from '@angular/common/http/testing';
-import { CurrencyService, Currency, RateWithCurrency } from './currency.service';
+import { CurrencyService, Currency, RateMatrix, RateWithCurrency } from './currency.service';
 
 describe('CurrencyService', () => {
   let service: CurrencyService;
@@ -41,6 +41,23 @@ describe('CurrencyService', () => {
     });
   });
 
+  describe('Method: getLatestRates', () => {
+    it('should retrieve the newest rate of every currency via GET', () => {
+      const dummyRates: RateWithCurrency[] = [
+        { date: '2023-10-25', rate: 4.20, currency: { code: 'USD', name: 'US Dollar' } },
+        { date: '2023-10-24', rate: 0.17, currency: { code: 'XYZ', name: 'Test' } }
+      ];
+
+      service.getLatestRates().subscribe(rates => {
+        expect(rates).toEqual(dummyRates);
+      });
+
+      const req = httpMock.expectOne('http://localhost:8000/currencies/latest');
+      expect(req.request.method).toBe('GET');
+      req.flush(dummyRates);
+    });
+  });
+
   describe('Method: getRatesByDate', () => {
     it('should retrieve rates for a specific date via GET', () => {
       const date = '2023-10-25';
@@ -59,6 +76,24 @@ describe('CurrencyService', () => {
     });
   });
 
+  describe('Method: getRates', () => {
+    it('should retrieve a rate matrix for a date range and currencies in one GET', () => {
+      const dummyMatrix: RateMatrix = {
+        dates: ['2023-10-24', '2023-10-25'],
+        codes: ['USD', 'EUR'],
+        values: [[4.18, 4.45], [4.20, null]]
+      };
+
+      service.getRates('2023-10-24', '2023-10-25', ['USD', 'EUR']).subscribe(matrix => {
+        expect(matrix).toEqual(dummyMatrix);
+      });
+
+      const req = httpMock.expectOne('http://localhost:8000/rates?start=2023-10-24&end=2023-10-25&codes=USD,EUR');
+      expect(req.request.method).toBe('GET');
+      req.flush(dummyMatrix);
+    });
+  });
+
   describe('Method: fetchRatesFromNbp', () => {
     it('should trigger NBP fetch via POST request', () => {
       const responseMessage = { message: 'Success' };
@@ -1,5 +1,5 @@
 import { Injectable } from '@angular/core';
-import { HttpClient } from '@angular/common/http';
+import { HttpClient, HttpParams } from '@angular/common/http';
 import { Observable } from 'rxjs';
 
 export interface Currency {
@@ -17,6 +17,12 @@ export interface RateWithCurrency {
   };
 }
 
+export interface RateMatrix {
+  dates: string[];
+  codes: string[];
+  values: (number | null)[][];
+}
+
 @Injectable({
   providedIn: 'root'
 })
@@ -29,10 +35,22 @@ export class CurrencyService {
     return this.http.get<Currency[]>(`${this.apiUrl}/currencies`);
   }
 
+  getLatestRates(): Observable<RateWithCurrency[]> {
+    return this.http.get<RateWithCurrency[]>(`${this.apiUrl}/currencies/latest`);
+  }
+
   getRatesByDate(date: string): Observable<RateWithCurrency[]> {
     return this.http.get<RateWithCurrency[]>(`${this.apiUrl}/currencies/${date}`);
   }
 
+  getRates(start: string, end: string, codes?: string[]): Observable<RateMatrix> {
+    let params = new HttpParams().set('start', start).set('end', end);
+    if (codes && codes.length) {
+      params = params.set('codes', codes.join(','));
+    }
+    return this.http.get<RateMatrix>(`${this.apiUrl}/rates`, { params });
+  }
+
   fetchRatesFromNbp(date?: string): Observable<any> {
     const url = date ? `${this.apiUrl}/currencies/fetch?date=${date}` : `${this.apiUrl}/currencies/fetch`;
     return this.http.post(url, {});